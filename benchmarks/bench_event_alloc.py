@@ -0,0 +1,58 @@
+"""
+Measures the memory allocated for the events created from a single inbound line, the way CloudBot.process creates
+them: one base event, one event for each catch-all raw hook, and a CommandEvent.
+
+Usage: PYTHONPATH=. python benchmarks/bench_event_alloc.py [number of catch-all hooks]
+"""
+
+import sys
+import tracemalloc
+
+from cloudbot.event import CommandEvent, Event, EventType
+
+
+class FakeHook:
+    doc = "<text> - does a thing"
+
+
+lines = 1000
+
+
+def process_line(hooks, command_hook):
+    event = Event(bot=None, conn=None, event_type=EventType.message, content_raw="!cmd some text",
+                  content="!cmd some text", target=None, channel="#channel", nick="nick", user="~user",
+                  host="host.example.com", mask="nick!~user@host.example.com", irc_raw=":nick!~user@host PRIVMSG",
+                  irc_prefix="nick!~user@host.example.com", irc_command="PRIVMSG",
+                  irc_paramlist=["#channel", ":!cmd some text"], irc_ctcp_text=None, irc_tags={})
+    events = [event]
+    for hook in hooks:
+        events.append(Event(hook=hook, base_event=event))
+    events.append(CommandEvent(hook=command_hook, text="some text", triggered_command="cmd", base_event=event))
+    return events
+
+
+def main():
+    hook_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    hooks = [FakeHook() for _ in range(hook_count)]
+    command_hook = FakeHook()
+
+    # warm up any caches before measuring
+    process_line(hooks, command_hook)
+
+    retained = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(lines):
+        retained.append(process_line(hooks, command_hook))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats)
+    count = sum(stat.count_diff for stat in stats)
+    print("{} catch-all hooks, {} events per line".format(hook_count, len(retained[0])))
+    print("allocated per line: {:.0f} bytes in {:.1f} blocks".format(size / lines, count / lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares the old regex based line parsing from _IrcProtocol.data_received with cloudbot.clients.irc_parse, over a
+corpus of typical server traffic. Both parsers are checked to produce the same results first.
+
+The single pass parser does more work than the regexes (message tags, and the raw line), and the regexes run in C, so
+the two are expected to be about even. The point of this benchmark is to catch regressions in parse_line, not to show
+a large speedup.
+
+Usage: PYTHONPATH=. python benchmarks/bench_irc_parse.py [corpus file]
+"""
+
+import re
+import sys
+import timeit
+
+from cloudbot.clients.irc_parse import parse_line
+
+irc_prefix_re = re.compile(r":([^ ]*) ([^ ]*) (.*)")
+irc_noprefix_re = re.compile(r"([^ ]*) (.*)")
+irc_netmask_re = re.compile(r"([^!@]*)!([^@]*)@(.*)")
+irc_param_re = re.compile(r"(?:^|(?<= ))(:.*|[^ ]+)")
+
+default_corpus = [
+    ":nick!~user@host.example.com PRIVMSG #channel :hello everyone, how is it going?",
+    ":nick!~user@host.example.com PRIVMSG #channel :\x01ACTION waves\x01",
+    ":other!~someone@2001:db8::1 NOTICE CloudBot :you have a new message",
+    ":irc.example.net 353 CloudBot = #channel :@op +voice user1 user2 user3 user4 user5 user6 user7",
+    ":irc.example.net 366 CloudBot #channel :End of /NAMES list.",
+    ":quitter!~q@host.example.com QUIT :*.net *.split",
+    ":joiner!~j@host.example.com JOIN #channel",
+    ":parter!~p@host.example.com PART #channel :bye",
+    ":op!~op@host.example.com MODE #channel +o someone",
+    ":kicker!~k@host.example.com KICK #channel victim :behave",
+    "PING :irc.example.net",
+]
+
+
+def old_parse(line):
+    if line.startswith(":"):
+        prefix_line_match = irc_prefix_re.match(line)
+        if prefix_line_match is None:
+            return None
+        netmask_prefix, command, params = prefix_line_match.groups()
+        netmask_match = irc_netmask_re.match(netmask_prefix)
+        if netmask_match is None:
+            nick, user, host = netmask_prefix, None, None
+        else:
+            nick, user, host = netmask_match.groups()
+        mask = netmask_prefix
+    else:
+        noprefix_line_match = irc_noprefix_re.match(line)
+        if noprefix_line_match is None:
+            return None
+        command, params = noprefix_line_match.groups()
+        nick = user = host = mask = None
+    return mask, nick, user, host, command, irc_param_re.findall(params)
+
+
+def new_parse(line):
+    parsed = parse_line(line)
+    if parsed is None:
+        return None
+    # (prefix, nick, user, host, command, params)
+    return parsed[1:7]
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8", errors="replace") as f:
+            corpus = [line.rstrip("\r\n") for line in f if line.strip()]
+    else:
+        corpus = default_corpus
+
+    for line in corpus:
+        assert old_parse(line) == new_parse(line), line
+
+    # the best of several runs, so noise from other processes doesn't skew the comparison
+    number = 2000
+    repeat = 7
+    old_time = min(timeit.repeat(lambda: [old_parse(line) for line in corpus], number=number, repeat=repeat))
+    new_time = min(timeit.repeat(lambda: [parse_line(line) for line in corpus], number=number, repeat=repeat))
+    per_line = 1e6 / (number * len(corpus))
+    print("{} lines".format(len(corpus)))
+    print("regex parser:  {:.2f} us/line".format(old_time * per_line))
+    print("single pass:   {:.2f} us/line".format(new_time * per_line))
+    print("speedup:       {:.1f}x".format(old_time / new_time))
+
+
+if __name__ == "__main__":
+    main()
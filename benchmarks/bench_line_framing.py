@@ -0,0 +1,72 @@
+"""
+Feeds a 100k line burst (NAMES replies, a netsplit QUIT storm and channel chatter) through the old
+bytes-concatenate-and-split framing and through LineFramer, in socket-sized reads.
+
+Usage: PYTHONPATH=. python benchmarks/bench_line_framing.py
+"""
+
+import time
+
+from cloudbot.clients.framing import LineFramer
+
+LINE_COUNT = 100000
+READ_SIZES = (4096, 65536, 262144)
+
+
+def make_burst():
+    lines = []
+    for i in range(LINE_COUNT):
+        kind = i % 3
+        if kind == 0:
+            names = " ".join("@user{0}_{1} +voice{0}_{1}".format(i, n) for n in range(20))
+            lines.append(":irc.example.net 353 CloudBot = #channel :{}".format(names))
+        elif kind == 1:
+            lines.append(":user{0}!~user{0}@host-{0}.example.com QUIT :*.net *.split".format(i))
+        else:
+            lines.append(":user{0}!~user{0}@host-{0}.example.com PRIVMSG #channel :line number {0}".format(i))
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def old_framing(reads):
+    buffer = b""
+    count = 0
+    for data in reads:
+        buffer += data
+        while b"\r\n" in buffer:
+            line, buffer = buffer.split(b"\r\n", 1)
+            count += 1
+    return count
+
+
+def new_framing(reads):
+    framer = LineFramer()
+    count = 0
+    for data in reads:
+        count += len(framer.feed(data))
+    return count
+
+
+def main():
+    burst = make_burst()
+    print("burst: {} lines, {:.1f} MiB".format(LINE_COUNT, len(burst) / 1024 / 1024))
+    print("{:>10} {:>10} {:>10} {:>8}".format("read size", "old (s)", "new (s)", "speedup"))
+    for size in READ_SIZES:
+        reads = chunks(burst, size)
+
+        start = time.perf_counter()
+        assert old_framing(reads) == LINE_COUNT
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        assert new_framing(reads) == LINE_COUNT
+        new_time = time.perf_counter() - start
+
+        print("{:>10} {:>10.3f} {:>10.3f} {:>7.1f}x".format(size, old_time, new_time, old_time / new_time))
+
+
+if __name__ == "__main__":
+    main()
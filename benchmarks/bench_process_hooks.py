@@ -0,0 +1,87 @@
+"""
+Measures event loop latency while a worst case brainfuck program (one which runs until MAX_STEPS) is running, with
+the hook run on the event loop, in a thread and in the process pool.
+
+A timer on the loop is scheduled every few milliseconds, and the delay between when it should have fired and when
+it actually fired is recorded.
+
+Usage: PYTHONPATH=. python benchmarks/bench_process_hooks.py
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudbot.util.executors import ProcessHookExecutor
+from plugins.brainfuck import bf
+
+# a tight loop which never terminates by itself
+worst_case_program = "+[]"
+tick_interval = 0.005
+runs = 3
+
+
+def measure(loop, start_hook):
+    """
+    Runs the hook started by start_hook(), recording how late each tick of a timer on the loop is
+    :rtype: (float, list[float])
+    """
+    lags = []
+    finished = asyncio.Future(loop=loop)
+
+    def tick(expected):
+        now = loop.time()
+        lags.append(now - expected)
+        if not finished.done():
+            loop.call_at(now + tick_interval, tick, now + tick_interval)
+
+    def hook_done(future):
+        if not finished.done():
+            finished.set_result(future.result())
+
+    loop.call_soon(tick, loop.time())
+    start = time.perf_counter()
+    start_hook().add_done_callback(hook_done)
+    loop.run_until_complete(finished)
+    return time.perf_counter() - start, lags
+
+
+def report(name, results):
+    lags = sorted(lag for _, run_lags in results for lag in run_lags)
+    duration = sum(run_time for run_time, _ in results) / len(results)
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0
+    print("{:<8} hook: {:7.1f} ms, loop lag p99: {:7.2f} ms, max: {:7.2f} ms".format(
+        name, duration * 1000, p99 * 1000, lags[-1] * 1000 if lags else 0))
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    threads = ThreadPoolExecutor(1)
+    processes = ProcessHookExecutor(1, cpu_limit=10, timeout=30)
+
+    def on_loop():
+        future = asyncio.Future(loop=loop)
+        # the hook blocks the loop until it returns
+        loop.call_soon(lambda: future.set_result(bf(worst_case_program)))
+        return future
+
+    def in_thread():
+        return loop.run_in_executor(threads, bf, worst_case_program)
+
+    def in_process():
+        return asyncio.wrap_future(processes.submit(bf, worst_case_program), loop=loop)
+
+    # start the worker process before measuring
+    processes.submit(bf, "+").result()
+
+    try:
+        for name, start_hook in (("loop", on_loop), ("thread", in_thread), ("process", in_process)):
+            report(name, [measure(loop, start_hook) for _ in range(runs)])
+    finally:
+        threads.shutdown()
+        processes.shutdown()
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares the per-line cost of checking every regex hook against a line with the cost of using RegexPrefilter,
+for an increasing number of registered regex hooks.
+
+Usage: PYTHONPATH=. python benchmarks/bench_regex_hooks.py
+"""
+
+import re
+import timeit
+
+from cloudbot.util.prefilter import RegexPrefilter
+
+# patterns in the style of the bundled link plugins, one per fake site
+site_pattern = r'(.*:)//(www.site{0}.com|site{0}.com)(:[0-9]+)?(.*)'
+
+base_regexes = [
+    re.compile(r'(?:youtube.*?(?:v=|/v/)|youtu\.be/|yooouuutuuube.*?id=)([-_a-zA-Z0-9]+)', re.I),
+    re.compile(r'(.*:)//(twitch.tv|www.twitch.tv)(:[0-9]+)?(.*)', re.I),
+    re.compile(r'.*(((www\.)?reddit\.com/r|redd\.it)[^ ]+)', re.I),
+    re.compile(r'^.*\+\+$'),
+    re.compile(r'^.*\-\-$'),
+    re.compile(r'\\o/', re.IGNORECASE),
+    re.compile(r"^[sS]/(.*/.*(?:/[igx]{,4})?)\S*$"),
+    re.compile(r'^\? ?(.+)', re.I),
+]
+
+lines = [
+    "hey, has anyone here tried the new release yet? it seems a lot faster than the last one",
+    "lol",
+    "I think the problem is in the config file, try setting the port to 6697 and enabling ssl",
+    "brb",
+    "check out https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "cloudbot++",
+    "s/teh/the/",
+    "no, that's not what I meant at all. read the docs first and then come back with the error message",
+]
+
+
+def naive(pairs, line):
+    return [hook for regex, hook in pairs if regex.search(line)]
+
+
+def prefiltered(prefilter, line):
+    return [hook for regex, hook in prefilter.candidates(line) if regex.search(line)]
+
+
+def main():
+    print("{:>6} {:>14} {:>14} {:>8}".format("hooks", "naive us/line", "filter us/line", "speedup"))
+    for count in (8, 16, 32, 64, 128, 256):
+        regexes = base_regexes + [re.compile(site_pattern.format(i), re.I) for i in range(count - len(base_regexes))]
+        pairs = [(regex, index) for index, regex in enumerate(regexes)]
+        prefilter = RegexPrefilter(pairs)
+
+        for line in lines:
+            assert naive(pairs, line) == prefiltered(prefilter, line)
+
+        number = 200
+        naive_time = timeit.timeit(lambda: [naive(pairs, line) for line in lines], number=number)
+        filter_time = timeit.timeit(lambda: [prefiltered(prefilter, line) for line in lines], number=number)
+        per_line = 1e6 / (number * len(lines))
+        print("{:>6} {:>14.2f} {:>14.2f} {:>7.1f}x".format(count, naive_time * per_line, filter_time * per_line,
+                                                         naive_time / filter_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Measures how long the bot takes to load its plugins at startup, cold (no plugin manifest, every plugin is imported)
+and warm (plugins without startup hooks are registered from the manifest and imported on first use).
+
+Each run is done in a fresh process, so no plugin modules are cached between runs. Connections are not started.
+
+Usage: PYTHONPATH=. python benchmarks/bench_startup.py [runs]
+Needs a config.json in the working directory, like the bot itself.
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+
+def load_plugins(queue):
+    import asyncio
+    from cloudbot.bot import CloudBot
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot = CloudBot(loop)
+    bot.config.setdefault("plugin_loading", {})["lazy_loading"] = True
+    bot.plugin_manager.lazy_loading = True
+    # only measure loading plugins
+    bot.connections = {}
+
+    start = time.perf_counter()
+    loop.run_until_complete(bot._init_routine())
+    duration = time.perf_counter() - start
+
+    imported = sum(1 for name in sys.modules if name.startswith("plugins."))
+    queue.put((duration, imported, len(bot.plugin_manager.plugins)))
+    bot.executors.shutdown(wait=False)
+
+
+def run(manifest_path, cold):
+    if cold and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=load_plugins, args=(queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    manifest_path = os.path.join(os.path.abspath("data"), "plugin_manifest.json")
+
+    for name, cold in (("cold", True), ("warm", False)):
+        results = [run(manifest_path, cold) for _ in range(runs)]
+        duration = sum(result[0] for result in results) / runs
+        _, imported, plugins = results[-1]
+        print("{:<5} start: {:7.1f} ms, {} of {} plugins imported".format(name, duration * 1000, imported, plugins))
+
+
+if __name__ == "__main__":
+    main()
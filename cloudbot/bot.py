@@ -7,19 +7,18 @@ import os
 import gc
 from operator import attrgetter
 
-from sqlalchemy import create_engine
-
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.schema import MetaData
 
 from cloudbot.client import Client
 from cloudbot.config import Config
-from cloudbot.hook import Action
+from cloudbot.hook import Action, Priority
 from cloudbot.reloader import PluginReloader
 from cloudbot.plugin import PluginManager
 from cloudbot.event import Event, CommandEvent, RegexEvent, EventType
 from cloudbot.util import database, formatting
+from cloudbot.util.executors import ExecutorManager
 from cloudbot.clients.irc import IrcClient, irc_clean
 
 try:
@@ -49,10 +48,12 @@ class CloudBot:
     :type plugin_manager: PluginManager
     :type reloader: PluginReloader
     :type db_engine: sqlalchemy.engine.Engine
+    :type db_metrics: cloudbot.util.database.DatabaseMetrics
     :type db_factory: sqlalchemy.orm.session.sessionmaker
     :type db_session: sqlalchemy.orm.scoping.scoped_session
     :type db_metadata: sqlalchemy.sql.schema.MetaData
     :type loop: asyncio.events.AbstractEventLoop
+    :type executors: ExecutorManager
     :type stopped_future: asyncio.Future
     :param: stopped_future: Future that will be given a result when the bot has stopped.
     """
@@ -92,9 +93,13 @@ class CloudBot:
         self.user_agent = self.config.get('user_agent', 'CloudBot/3.0 - CloudBot Refresh '
                                                         '<https://github.com/CloudBotIRC/CloudBot/>')
 
+        # thread pools for threaded hooks and sieves
+        self.executors = ExecutorManager(self.config.get("executors", {}))
+
         # setup db
         db_path = self.config.get('database', 'sqlite:///cloudbot.db')
-        self.db_engine = create_engine(db_path)
+        self.db_engine = database.create_engine(db_path, self.config.get('database_options'))
+        self.db_metrics = database.DatabaseMetrics(self.db_engine)
         self.db_factory = sessionmaker(bind=self.db_engine)
         self.db_session = scoped_session(self.db_factory)
         self.db_metadata = MetaData()
@@ -182,6 +187,9 @@ class CloudBot:
                 continue
             connection.close()
 
+        # stop accepting threaded hooks, without waiting for ones which may never finish
+        self.executors.shutdown(wait=False)
+
         self.running = False
         # Give the stopped_future a result, so that run() will exit
         self.stopped_future.set_result(restart)
@@ -216,13 +224,14 @@ class CloudBot:
         gc.collect()
 
     @asyncio.coroutine
-    def process(self, event):
+    def process(self, event, *, shed_low_priority=False):
         """
+        :param shed_low_priority: Skip raw hooks with a lower than normal priority, used when the connection is overloaded
         :type event: Event
+        :type shed_low_priority: bool
         """
         run_before_tasks = []
         tasks = []
-        command_prefix = event.conn.config.get('command_prefix', '.')
         halted = False
 
         def add_hook(hook, _event, _run_before=False):
@@ -245,6 +254,8 @@ class CloudBot:
 
         # Raw IRC hook
         for raw_hook in self.plugin_manager.catch_all_triggers:
+            if shed_low_priority and raw_hook.priority > Priority.NORMAL:
+                continue
             # run catch-all coroutine hooks before all others - TODO: Make this a plugin argument
             run_before = not raw_hook.threaded
             if not add_hook(raw_hook, Event(hook=raw_hook, base_event=event), _run_before=run_before):
@@ -253,6 +264,8 @@ class CloudBot:
 
         if event.irc_command in self.plugin_manager.raw_triggers:
             for raw_hook in self.plugin_manager.raw_triggers[event.irc_command]:
+                if shed_low_priority and raw_hook.priority > Priority.NORMAL:
+                    continue
                 if not add_hook(raw_hook, Event(hook=raw_hook, base_event=event)):
                     # The hook has an action of Action.HALT* so stop adding new tasks
                     break
@@ -266,15 +279,8 @@ class CloudBot:
 
         if event.type is EventType.message:
             # Commands
-            if event.chan.lower() == event.nick.lower():  # private message, no command prefix
-                command_re = r'(?i)^(?:[{}]?|{}[,;:]+\s+)(\w+)(?:$|\s+)(.*)'
-            else:
-                command_re = r'(?i)^(?:[{}]|{}[,;:]+\s+)(\w+)(?:$|\s+)(.*)'
-
-            cmd_match = re.match(
-                command_re.format(command_prefix, event.conn.nick),
-                event.content_raw
-            )
+            private = event.chan.lower() == event.nick.lower()  # private message, no command prefix
+            cmd_match = event.conn.get_command_re(private).match(event.content_raw)
 
             if cmd_match:
                 command = cmd_match.group(1).lower()
@@ -285,10 +291,7 @@ class CloudBot:
                                                  triggered_command=command, base_event=event)
                     add_hook(command_hook, command_event)
                 else:
-                    potential_matches = []
-                    for potential_match, plugin in self.plugin_manager.commands.items():
-                        if potential_match.startswith(command):
-                            potential_matches.append((potential_match, plugin))
+                    potential_matches = self.plugin_manager.find_commands(command)
                     if potential_matches:
                         if len(potential_matches) == 1:
                             command_hook = potential_matches[0][1]
@@ -301,7 +304,8 @@ class CloudBot:
 
             # Regex hooks
             regex_matched = False
-            for regex, regex_hook in self.plugin_manager.regex_hooks:
+            # only regexes which contain a literal found in the line (or have no literal at all) are checked
+            for regex, regex_hook in self.plugin_manager.regex_prefilter.candidates(event.content):
                 if not regex_hook.run_on_cmd and cmd_match:
                     continue
 
@@ -1,7 +1,9 @@
 import asyncio
 import logging
 import collections
+import re
 
+from cloudbot.dispatcher import EventDispatcher
 from cloudbot.permissions import PermissionManager
 
 logger = logging.getLogger("cloudbot")
@@ -19,6 +21,7 @@ class Client:
     :type vars: dict
     :type history: dict[str, list[tuple]]
     :type permissions: PermissionManager
+    :type dispatcher: EventDispatcher
     """
 
     def __init__(self, bot, name, nick, *, channels=None, config=None):
@@ -49,15 +52,41 @@ class Client:
         # create permissions manager
         self.permissions = PermissionManager(self)
 
+        # passes incoming events to the bot, with a bounded number in flight
+        self.dispatcher = EventDispatcher.from_config(bot, self, self.config.get("dispatch", {}))
+
         # for plugins to abuse
         self.memory = collections.defaultdict()
 
         # set when on_load in core_misc is done
         self.ready = False
 
+        # compiled command regexes, rebuilt only when the nick or command prefix changes
+        self._command_re_key = None
+        self._command_re = None
+
     def describe_server(self):
         raise NotImplementedError
 
+    def get_command_re(self, private=False):
+        """
+        Returns the compiled regex used to match commands on this connection. The regexes are cached, and are only
+        recompiled when the bot's nick or the configured command prefix changes.
+        :param private: Whether to return the regex for private messages, where the command prefix is optional
+        :type private: bool
+        :rtype: re.__Regex
+        """
+        key = (self.config.get('command_prefix', '.'), self.nick)
+        if key != self._command_re_key:
+            command_prefix, nick = key
+            nick = re.escape(nick)
+            self._command_re = (
+                re.compile(r'(?i)^(?:[{}]|{}[,;:]+\s+)(\w+)(?:$|\s+)(.*)'.format(command_prefix, nick)),
+                re.compile(r'(?i)^(?:[{}]?|{}[,;:]+\s+)(\w+)(?:$|\s+)(.*)'.format(command_prefix, nick))
+            )
+            self._command_re_key = key
+        return self._command_re[private]
+
     @asyncio.coroutine
     def connect(self):
         """
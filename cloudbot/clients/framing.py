@@ -0,0 +1,104 @@
+import logging
+
+logger = logging.getLogger("cloudbot")
+
+# IRCv3 allows 8191 bytes of message tags on top of the 512 bytes of the message itself
+DEFAULT_MAX_LINE_LENGTH = 8191 + 512
+
+
+class LineFramer:
+    """
+    Splits a stream of bytes into lines, without re-copying buffered data each time a line is taken off the front.
+
+    Lines may be terminated by either "\r\n" or a bare "\n". Lines longer than max_line_length are dropped.
+
+    :type max_line_length: int
+    :type overflows: int
+    :type _buffer: bytearray
+    :type _scan_offset: int
+    :type _discarding: bool
+    """
+
+    def __init__(self, max_line_length=DEFAULT_MAX_LINE_LENGTH):
+        """
+        :type max_line_length: int
+        """
+        self.max_line_length = max_line_length
+        # number of lines dropped for being too long
+        self.overflows = 0
+
+        self._buffer = bytearray()
+        # everything before this offset in the buffer is known to not contain a line terminator
+        self._scan_offset = 0
+        # set when we're dropping the rest of an overlong line
+        self._discarding = False
+
+    def __len__(self):
+        """
+        :return: The number of buffered bytes which aren't part of a complete line yet
+        """
+        return len(self._buffer)
+
+    def feed(self, data):
+        """
+        Adds data to the buffer, and returns a list of all lines completed by it, without their line terminators.
+        Empty lines are skipped.
+        :type data: bytes
+        :rtype: list[bytes]
+        """
+        buffer = self._buffer
+        buffer += data
+
+        lines = []
+        start = 0
+        find = buffer.find
+        max_length = self.max_line_length
+        with memoryview(buffer) as view:
+            end = find(b"\n", self._scan_offset)
+            while end != -1:
+                line_end = end
+                if line_end > start and buffer[line_end - 1] == 13:  # \r
+                    line_end -= 1
+
+                if self._discarding:
+                    # this is the end of a line we've already dropped
+                    self._discarding = False
+                elif line_end - start > max_length:
+                    self._overflow(line_end - start)
+                elif line_end > start:
+                    lines.append(bytes(view[start:line_end]))
+
+                start = end + 1
+                end = find(b"\n", start)
+
+        # remove the complete lines from the front of the buffer, leaving the incomplete tail where it is
+        if start:
+            del buffer[:start]
+
+        length = len(buffer)
+        if length and buffer[-1] == 13:  # \r
+            # the \r may be the first half of a terminator split between reads, so don't count it yet
+            length -= 1
+        if length > max_length:
+            # the current line is already too long, so stop buffering it until the next terminator arrives
+            if not self._discarding:
+                self._overflow(length)
+                self._discarding = True
+            buffer.clear()
+
+        # we already know there's no terminator in the remaining data
+        self._scan_offset = len(buffer)
+        return lines
+
+    def clear(self):
+        """
+        Discards any buffered partial line
+        """
+        self._buffer.clear()
+        self._scan_offset = 0
+        self._discarding = False
+
+    def _overflow(self, length):
+        self.overflows += 1
+        logger.warning("Dropping line of at least {} bytes, longer than the maximum of {} bytes".format(
+            length, self.max_line_length))
@@ -6,15 +6,13 @@ from _ssl import PROTOCOL_SSLv23
 from ssl import SSLContext
 
 from cloudbot.client import Client
+from cloudbot.clients.framing import LineFramer, DEFAULT_MAX_LINE_LENGTH
+from cloudbot.clients.irc_parse import parse_line
+from cloudbot.clients.sendqueue import SendQueue
 from cloudbot.event import Event, EventType
 
 logger = logging.getLogger("cloudbot")
 
-irc_prefix_re = re.compile(r":([^ ]*) ([^ ]*) (.*)")
-irc_noprefix_re = re.compile(r"([^ ]*) (.*)")
-irc_netmask_re = re.compile(r"([^!@]*)!([^@]*)@(.*)")
-irc_param_re = re.compile(r"(?:^|(?<= ))(:.*|[^ ]+)")
-
 irc_bad_chars = ''.join([chr(x) for x in list(range(0, 1)) + list(range(4, 32)) + list(range(127, 160))])
 irc_clean_re = re.compile('[{}]'.format(re.escape(irc_bad_chars)))
 
@@ -50,6 +48,7 @@ class IrcClient(Client):
     :type port: int
     :type _connected: bool
     :type _ignore_cert_errors: bool
+    :type send_queue: SendQueue
     """
 
     def __init__(self, bot, name, nick, *, channels=None, config=None,
@@ -93,6 +92,11 @@ class IrcClient(Client):
         self._transport = None
         self._protocol = None
 
+        # outgoing lines, drained by a single writer task
+        self.send_queue = SendQueue.from_config(self.config.get("send_ratelimit", {}))
+        self._send_ready = asyncio.Event(loop=self.loop)
+        self._send_task = None
+
     def describe_server(self):
         if self.use_ssl:
             return "+{}:{}".format(self.server, self.port)
@@ -116,6 +120,8 @@ class IrcClient(Client):
         else:
             self._connected = True
             logger.info("[{}] Connecting".format(self.name))
+        if self._send_task is None:
+            self._send_task = asyncio.async(self._send_loop(), loop=self.loop)
         optional_params = {}
         if self.local_bind:
             optional_params["local_addr"] = self.local_bind
@@ -144,6 +150,17 @@ class IrcClient(Client):
         if not self._connected:
             return
 
+        # make sure the QUIT, and anything else we're allowed to send, gets written before closing
+        if self._protocol is not None and self._protocol.connected:
+            lines, delay = self.send_queue.take()
+            if lines:
+                self._protocol.write_lines(lines)
+        # whatever the rate limit held back is dropped with the connection
+        self.send_queue.clear()
+        if self._send_task is not None:
+            self._send_task.cancel()
+            self._send_task = None
+
         self._transport.close()
         self._connected = False
 
@@ -218,8 +235,50 @@ class IrcClient(Client):
         :type line: str
         """
         logger.info("[{}] >> {}".format(self.name, line))
-        asyncio.async(self._protocol.send(line), loop=self.loop)
+        self._queue_line(line)
+
+    def _queue_line(self, line):
+        """
+        Adds a line to the send queue and wakes the writer. Not threadsafe.
+        :type line: str
+        """
+        if not self.send_queue.put(line):
+            logger.warning("[{}] Send queue full, dropped line: {}".format(self.name, line))
+            return
+        self._send_ready.set()
 
+    @asyncio.coroutine
+    def _send_loop(self):
+        """
+        Drains the send queue, writing every line that the rate limit allows in a single write.
+        """
+        while True:
+            yield from self._send_ready.wait()
+            self._send_ready.clear()
+            # if we get disconnected, wait to be woken again by the next connection
+            while self.send_queue and self._protocol is not None and self._protocol.connected:
+                lines, delay = self.send_queue.take()
+                if lines:
+                    self._protocol.write_lines(lines)
+                if delay:
+                    # wait out the rate limit, but wake early when another line is queued, so a PONG or QUIT isn't
+                    # held back behind the throttled lines. take() only releases the throttled lines once it's time.
+                    try:
+                        yield from asyncio.wait_for(self._send_ready.wait(), delay, loop=self.loop)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._send_ready.clear()
+
+    def _reset_session(self):
+        """
+        Drops the incoming events and outgoing lines left over from a lost connection, so they aren't processed or
+        sent after reconnecting
+        """
+        self.dispatcher.reset()
+        if self.send_queue:
+            logger.info("[{}] Dropping {} unsent lines from the lost connection".format(
+                self.name, len(self.send_queue)))
+        self.send_queue.clear()
 
     @property
     def connected(self):
@@ -231,7 +290,7 @@ class _IrcProtocol(asyncio.Protocol):
     :type loop: asyncio.events.AbstractEventLoop
     :type conn: IrcClient
     :type bot: cloudbot.bot.CloudBot
-    :type _input_buffer: bytes
+    :type _framer: LineFramer
     :type _connected: bool
     :type _transport: asyncio.transports.Transport
     :type _connected_future: asyncio.Future
@@ -245,8 +304,8 @@ class _IrcProtocol(asyncio.Protocol):
         self.bot = conn.bot
         self.conn = conn
 
-        # input buffer
-        self._input_buffer = b""
+        # splits incoming data into lines
+        self._framer = LineFramer(conn.config.get("max_line_length", DEFAULT_MAX_LINE_LENGTH))
 
         # connected
         self._connected = False
@@ -263,9 +322,12 @@ class _IrcProtocol(asyncio.Protocol):
         self._connected_future.set_result(None)
         # we don't need the _connected_future, everything uses it will check _connected first.
         del self._connected_future
+        # send anything that was queued while we were disconnected
+        self.conn._send_ready.set()
 
     def connection_lost(self, exc):
         self._connected = False
+        self.conn._reset_session()
         # create a new connected_future for when we are connected.
         self._connected_future = asyncio.Future(loop=self.loop)
         if exc is None:
@@ -276,70 +338,55 @@ class _IrcProtocol(asyncio.Protocol):
 
     def eof_received(self):
         self._connected = False
+        self.conn._reset_session()
         # create a new connected_future for when we are connected.
         self._connected_future = asyncio.Future(loop=self.loop)
         logger.info("[{}] EOF received.".format(self.conn.name))
         asyncio.async(self.conn.connect(), loop=self.loop)
         return True
 
-    @asyncio.coroutine
-    def send(self, line):
-        # make sure we are connected before sending
-        if not self._connected:
-            yield from self._connected_future
-        line = line[:510] + "\r\n"
-        data = line.encode("utf-8", "replace")
+    @property
+    def connected(self):
+        return self._connected
+
+    def write_lines(self, lines):
+        """
+        Writes the given lines to the transport in a single write. The protocol must be connected.
+        :type lines: list[str]
+        """
+        data = "".join(line[:510] + "\r\n" for line in lines).encode("utf-8", "replace")
         self._transport.write(data)
 
     def data_received(self, data):
-        self._input_buffer += data
-
-        while b"\r\n" in self._input_buffer:
-            line_data, self._input_buffer = self._input_buffer.split(b"\r\n", 1)
+        for line_data in self._framer.feed(data):
             line = decode(line_data)
 
             # parse the line into a message
-            if line.startswith(":"):
-                prefix_line_match = irc_prefix_re.match(line)
-                if prefix_line_match is None:
-                    logger.critical("[{}] Received invalid IRC line '{}' from {}".format(
-                        self.conn.name, line, self.conn.describe_server()))
-                    continue
-
-                netmask_prefix, command, params = prefix_line_match.groups()
-                prefix = ":" + netmask_prefix  # TODO: Do we need to know this?
-                netmask_match = irc_netmask_re.match(netmask_prefix)
-                if netmask_match is None:
-                    # This isn't in the format of a netmask
-                    nick = netmask_prefix
-                    user = None
-                    host = None
-                    mask = netmask_prefix
-                else:
-                    nick = netmask_match.group(1)
-                    user = netmask_match.group(2)
-                    host = netmask_match.group(3)
-                    mask = netmask_prefix
-            else:
+            parsed = parse_line(line)
+            if parsed is None:
+                logger.critical("[{}] Received invalid IRC line '{}' from {}".format(
+                    self.conn.name, line, self.conn.describe_server()))
+                continue
+
+            command = parsed.command
+            command_params = parsed.params
+            nick = parsed.nick
+            user = parsed.user
+            host = parsed.host
+            mask = parsed.prefix
+            if mask is None:
                 prefix = None
-                noprefix_line_match = irc_noprefix_re.match(line)
-                if noprefix_line_match is None:
-                    logger.critical("[{}] Received invalid IRC line '{}' from {}".format(
-                        self.conn.name, line, self.conn.describe_server()))
-                    continue
-                command = noprefix_line_match.group(1)
-                params = noprefix_line_match.group(2)
-                nick = None
-                user = None
-                host = None
-                mask = None
-
-            command_params = irc_param_re.findall(params)
+            else:
+                prefix = ":" + mask  # TODO: Do we need to know this?
 
             # Reply to pings immediately
 
             if command == "PING":
-                asyncio.async(self.send("PONG " + command_params[-1]), loop=self.loop)
+                # PONG skips the rate limit, and goes to the front of the send queue
+                if command_params:
+                    self.conn._queue_line("PONG " + command_params[-1])
+                else:
+                    self.conn._queue_line("PONG")
 
             # Parse the command and params
 
@@ -402,11 +449,12 @@ class _IrcProtocol(asyncio.Protocol):
             # Set up parsed message
             # TODO: Do we really want to send the raw `prefix` and `command_params` here?
             event = Event(bot=self.bot, conn=self.conn, event_type=event_type, content_raw=content_raw, content=content,
-                          target=target, channel=channel, nick=nick, user=user, host=host, mask=mask, irc_raw=line,
-                          irc_prefix=prefix, irc_command=command, irc_paramlist=command_params, irc_ctcp_text=ctcp_text)
+                          target=target, channel=channel, nick=nick, user=user, host=host, mask=mask, irc_raw=parsed.raw,
+                          irc_prefix=prefix, irc_command=command, irc_paramlist=command_params, irc_ctcp_text=ctcp_text,
+                          irc_tags=parsed.tags)
 
             # handle the message, async
-            asyncio.async(self.bot.process(event), loop=self.loop)
+            self.conn.dispatcher.submit(event)
 
 # Channel Commands
 # NOTICE #chan :Text
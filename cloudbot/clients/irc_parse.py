@@ -0,0 +1,169 @@
+"""
+irc_parse.py
+
+A single pass IRC line parser, supporting IRCv3 message tags.
+
+Lines are split with str.partition rather than a series of regexes, so each part of a line is only scanned once.
+"""
+
+from collections import namedtuple
+
+# The params keep the leading ':' on a trailing parameter, to stay compatible with plugins using irc_paramlist
+ParsedLine = namedtuple("ParsedLine", ["tags", "prefix", "nick", "user", "host", "command", "params", "raw"])
+_new_tuple = tuple.__new__
+
+_tag_value_escapes = {
+    ":": ";",
+    "s": " ",
+    "\\": "\\",
+    "r": "\r",
+    "n": "\n",
+}
+
+
+def unescape_tag_value(value):
+    """
+    Unescapes an IRCv3 message tag value
+    :type value: str
+    :rtype: str
+    """
+    if "\\" not in value:
+        return value
+
+    out = []
+    i = 0
+    length = len(value)
+    while i < length:
+        char = value[i]
+        if char == "\\":
+            i += 1
+            if i == length:
+                # a trailing lone backslash is dropped
+                break
+            char = value[i]
+            out.append(_tag_value_escapes.get(char, char))
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def parse_tags(tags):
+    """
+    Parses the message tags of a line, without the leading '@'. Tags without a value are given an empty string.
+    :type tags: str
+    :rtype: dict[str, str]
+    """
+    parsed = {}
+    for tag in tags.split(";"):
+        if not tag:
+            continue
+        key, _, value = tag.partition("=")
+        parsed[key] = unescape_tag_value(value)
+    return parsed
+
+
+def parse_params(params):
+    """
+    Splits the parameter section of a line. The trailing parameter keeps its leading ':'.
+    :type params: str
+    :rtype: list[str]
+    """
+    if not params:
+        return []
+
+    if params[0] == ":":
+        return [params]
+
+    index = params.find(" :")
+    if index == -1:
+        middle = params
+        trailing = None
+    else:
+        middle = params[:index]
+        trailing = params[index + 1:]
+
+    if "  " in middle or middle.endswith(" "):
+        # only filter out empty params when there are repeated spaces, which is rare
+        parsed = [param for param in middle.split(" ") if param]
+    else:
+        parsed = middle.split(" ")
+
+    if trailing is not None:
+        parsed.append(trailing)
+    return parsed
+
+
+def parse_prefix(prefix):
+    """
+    Splits a prefix (without the leading ':') into (nick, user, host). If the prefix isn't in the format of a netmask,
+    nick is the whole prefix and user and host are None.
+    :type prefix: str
+    :rtype: (str, str | None, str | None)
+    """
+    bang = prefix.find("!")
+    if bang != -1:
+        at = prefix.find("@", bang + 1)
+        if at != -1 and prefix.find("@", 0, bang) == -1:
+            return prefix[:bang], prefix[bang + 1:at], prefix[at + 1:]
+    return prefix, None, None
+
+
+def parse_line(line):
+    """
+    Parses a single IRC line into a ParsedLine, or returns None if the line is invalid.
+
+    ParsedLine.raw is the line without its message tags.
+    :type line: str
+    :rtype: ParsedLine | None
+    """
+    tags = None
+    if line[:1] == "@":
+        tags, _, line = line.partition(" ")
+        if not line:
+            return None
+        tags = parse_tags(tags[1:])
+        if line[:1] == " ":
+            line = line.lstrip(" ")
+
+    if line[:1] == ":":
+        prefix, _, rest = line.partition(" ")
+        prefix = prefix[1:]
+        if rest[:1] == " ":
+            rest = rest.lstrip(" ")
+        # parse_prefix() is inlined here, as this is the hot path for every line we receive
+        nick = prefix
+        user = host = None
+        if "!" in prefix:
+            bang_nick, _, user_host = prefix.partition("!")
+            if "@" not in bang_nick:
+                bang_user, at, bang_host = user_host.partition("@")
+                if at:
+                    nick, user, host = bang_nick, bang_user, bang_host
+    else:
+        prefix = nick = user = host = None
+        rest = line
+
+    command, space, params = rest.partition(" ")
+    if not command:
+        return None
+
+    if not space:
+        params = []
+    elif params[:1] == ":":
+        params = [params]
+    else:
+        # likewise for parse_params(), handling the common case of single spaced params directly
+        index = params.find(" :")
+        middle = params if index == -1 else params[:index]
+        if "  " in middle or middle[-1:] == " ":
+            params = parse_params(params)
+        elif index == -1:
+            params = middle.split(" ")
+        else:
+            trailing = params[index + 1:]
+            params = middle.split(" ")
+            params.append(trailing)
+
+    # tuple.__new__ skips the python level __new__ namedtuple generates, which is a noticeable part of the cost here
+    return _new_tuple(ParsedLine, (tags, prefix, nick, user, host, command, params, line))
@@ -0,0 +1,133 @@
+import logging
+from collections import deque
+
+from cloudbot.util.tokenbucket import TokenBucket
+
+logger = logging.getLogger("cloudbot")
+
+# commands which skip the queue and the rate limit entirely
+PRIORITY_COMMANDS = {"PONG", "QUIT"}
+
+
+class SendQueue:
+    """
+    A queue of outgoing lines for a single connection, with a priority lane and flood control.
+
+    Lines for commands in PRIORITY_COMMANDS are always sent first and are not rate limited. All other lines are
+    queued in order, and released as the token bucket allows.
+
+    :type bucket: TokenBucket | None
+    :type line_cost: float
+    :type max_size: int
+    :type sent: int
+    :type dropped: int
+    :type _priority: deque[str]
+    :type _queue: deque[str]
+    """
+
+    def __init__(self, bucket=None, line_cost=1, max_size=1000):
+        """
+        :param bucket: The token bucket used for flood control, or None to disable it
+        :param line_cost: The number of tokens each line costs
+        :param max_size: The maximum number of lines to hold in the normal lane, further lines are dropped
+        :type bucket: TokenBucket | None
+        :type line_cost: float
+        :type max_size: int
+        """
+        self.bucket = bucket
+        self.line_cost = line_cost
+        self.max_size = max_size
+
+        # counters, for monitoring
+        self.sent = 0
+        self.dropped = 0
+
+        self._priority = deque()
+        self._queue = deque()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a SendQueue from a connection's "send_ratelimit" config section
+        :type config: dict[str, unknown]
+        :rtype: SendQueue
+        """
+        line_cost = config.get("line_cost", 1)
+        if config.get("enabled", True):
+            max_tokens = config.get("max_tokens", 10)
+            restore_rate = config.get("restore_rate", 1)
+            if restore_rate <= 0:
+                logger.warning("Invalid restore_rate for send_ratelimit, using 1")
+                restore_rate = 1
+            if line_cost > max_tokens:
+                # the bucket could never hold enough tokens to send a line
+                logger.warning("send_ratelimit line_cost is more than max_tokens, using {}".format(max_tokens))
+                line_cost = max_tokens
+            bucket = TokenBucket(max_tokens, restore_rate)
+        else:
+            bucket = None
+        return cls(bucket, line_cost=line_cost, max_size=config.get("max_queue", 1000))
+
+    def __len__(self):
+        return len(self._priority) + len(self._queue)
+
+    @property
+    def depth(self):
+        """
+        :return: The number of lines waiting to be sent
+        :rtype: int
+        """
+        return len(self)
+
+    def put(self, line):
+        """
+        Adds a line to the queue. Returns False if the line was dropped because the queue is full.
+        :type line: str
+        :rtype: bool
+        """
+        command = line.split(" ", 1)[0].upper()
+        if command in PRIORITY_COMMANDS:
+            self._priority.append(line)
+            return True
+
+        if len(self._queue) >= self.max_size:
+            self.dropped += 1
+            return False
+
+        self._queue.append(line)
+        return True
+
+    def take(self):
+        """
+        Removes and returns all lines which may be sent right now, along with the number of seconds to wait before
+        calling take() again. The delay is 0 if the queue is now empty.
+        :rtype: (list[str], float)
+        """
+        lines = list(self._priority)
+        self._priority.clear()
+
+        queue = self._queue
+        bucket = self.bucket
+        if bucket is None:
+            lines.extend(queue)
+            queue.clear()
+        else:
+            while queue and bucket.consume(self.line_cost):
+                lines.append(queue.popleft())
+
+        self.sent += len(lines)
+
+        if queue:
+            # wait until there's enough tokens for the next line
+            delay = max(self.line_cost - bucket.tokens, 0) / bucket.fill_rate
+        else:
+            delay = 0
+        return lines, delay
+
+    def clear(self):
+        """
+        Drops all queued lines, counting them as dropped
+        """
+        self.dropped += len(self)
+        self._priority.clear()
+        self._queue.clear()
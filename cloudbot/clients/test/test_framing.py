@@ -0,0 +1,52 @@
+from cloudbot.clients.framing import LineFramer
+
+
+def test_framer_lines():
+    framer = LineFramer()
+    assert framer.feed(b"PING :a\r\nPING :b\r\n") == [b"PING :a", b"PING :b"]
+    assert len(framer) == 0
+
+
+def test_framer_partial():
+    framer = LineFramer()
+    assert framer.feed(b"PING :a\r\nPIN") == [b"PING :a"]
+    assert len(framer) == 3
+    assert framer.feed(b"G :b\r") == []
+    assert framer.feed(b"\nPING :c\r\n") == [b"PING :b", b"PING :c"]
+
+
+def test_framer_bare_newline():
+    framer = LineFramer()
+    assert framer.feed(b"PING :a\nPING :b\r\n\r\n\n") == [b"PING :a", b"PING :b"]
+
+
+def test_framer_max_length():
+    framer = LineFramer(max_line_length=10)
+    # too long, but complete
+    assert framer.feed(b"0123456789A\r\nshort\r\n") == [b"short"]
+    assert framer.overflows == 1
+
+    # too long, and still incomplete
+    assert framer.feed(b"0123456789A") == []
+    assert framer.overflows == 2
+    assert len(framer) == 0
+    assert framer.feed(b"BCDEF\r\nafter\r\n") == [b"after"]
+    assert framer.overflows == 2
+
+    # exactly at the limit
+    assert framer.feed(b"0123456789\r\n") == [b"0123456789"]
+
+
+def test_framer_max_length_split_terminator():
+    framer = LineFramer(max_line_length=10)
+    # a line of exactly the maximum length, with its \r\n split between reads
+    assert framer.feed(b"0123456789\r") == []
+    assert framer.overflows == 0
+    assert framer.feed(b"\nshort\r\n") == [b"0123456789", b"short"]
+
+
+def test_framer_clear():
+    framer = LineFramer()
+    framer.feed(b"PING")
+    framer.clear()
+    assert framer.feed(b" :a\r\n") == [b" :a"]
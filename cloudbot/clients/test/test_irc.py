@@ -0,0 +1,63 @@
+import asyncio
+import sys
+
+import pytest
+
+if sys.version_info >= (3, 7):
+    # the core modules use "async" as a name, which is a keyword from python 3.7
+    pytest.skip("cloudbot.clients.irc can't be imported on this version of python", allow_module_level=True)
+
+from cloudbot.clients.irc import IrcClient
+
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+
+
+class FakeProtocol:
+    connected = True
+
+    def __init__(self):
+        self.written = []
+
+    def write_lines(self, lines):
+        self.written.extend(lines)
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def run_briefly(loop):
+    loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+
+
+def test_priority_wakes_writer(loop):
+    # one line every 10 seconds
+    config = {"send_ratelimit": {"max_tokens": 1, "restore_rate": 0.1}}
+    conn = IrcClient(FakeBot(loop), "test", "CloudBot", config=config, server="irc.example.net")
+    conn._protocol = protocol = FakeProtocol()
+    task = loop.create_task(conn._send_loop())
+
+    conn._send("PRIVMSG #chan :a")
+    conn._send("PRIVMSG #chan :b")
+    run_briefly(loop)
+    assert protocol.written == ["PRIVMSG #chan :a"]
+
+    # the writer is waiting on the rate limit, but a PONG has to go out straight away
+    conn._send("PONG :irc.example.net")
+    run_briefly(loop)
+    assert protocol.written == ["PRIVMSG #chan :a", "PONG :irc.example.net"]
+
+    # while the throttled line still waits for its turn
+    conn._send("PRIVMSG #chan :c")
+    run_briefly(loop)
+    assert protocol.written == ["PRIVMSG #chan :a", "PONG :irc.example.net"]
+    assert conn.send_queue.depth == 2
+
+    task.cancel()
+    loop.run_until_complete(asyncio.wait([task], loop=loop))
@@ -0,0 +1,56 @@
+from cloudbot.clients.irc_parse import parse_line, parse_params, parse_prefix, parse_tags, unescape_tag_value
+
+
+def test_parse_params():
+    assert parse_params("") == []
+    assert parse_params("#chan :hello world") == ["#chan", ":hello world"]
+    assert parse_params(":only trailing") == [":only trailing"]
+    assert parse_params("a  b c") == ["a", "b", "c"]
+    assert parse_params("a  :b :c") == ["a", ":b :c"]
+    assert parse_params("nick #chan:with:colons") == ["nick", "#chan:with:colons"]
+
+
+def test_parse_prefix():
+    assert parse_prefix("nick!user@host") == ("nick", "user", "host")
+    assert parse_prefix("irc.example.net") == ("irc.example.net", None, None)
+    assert parse_prefix("nick!user") == ("nick!user", None, None)
+    assert parse_prefix("ni@ck!user@host") == ("ni@ck!user@host", None, None)
+
+
+def test_tags():
+    assert unescape_tag_value("plain") == "plain"
+    assert unescape_tag_value(r"a\sb\:c\\d\r\n") == "a b;c\\d\r\n"
+    assert unescape_tag_value("\\x") == "x"
+    assert unescape_tag_value("end\\") == "end"
+    assert parse_tags("time=2016-01-01T00:00:00.000Z;account=someone;+draft/flag") == {
+        "time": "2016-01-01T00:00:00.000Z",
+        "account": "someone",
+        "+draft/flag": "",
+    }
+
+
+def test_parse_line():
+    parsed = parse_line(":nick!user@host PRIVMSG #chan :hello there")
+    assert parsed.tags is None
+    assert parsed.prefix == "nick!user@host"
+    assert (parsed.nick, parsed.user, parsed.host) == ("nick", "user", "host")
+    assert parsed.command == "PRIVMSG"
+    assert parsed.params == ["#chan", ":hello there"]
+    assert parsed.raw == ":nick!user@host PRIVMSG #chan :hello there"
+
+    parsed = parse_line("PING :irc.example.net")
+    assert parsed.prefix is None
+    assert parsed.nick is None
+    assert parsed.command == "PING"
+    assert parsed.params == [":irc.example.net"]
+
+    parsed = parse_line("@time=2016-01-01T00:00:00.000Z;account=some\\sone :nick!user@host JOIN #chan")
+    assert parsed.tags == {"time": "2016-01-01T00:00:00.000Z", "account": "some one"}
+    assert parsed.command == "JOIN"
+    assert parsed.params == ["#chan"]
+    assert parsed.raw == ":nick!user@host JOIN #chan"
+
+    assert parse_line(":irc.example.net 001").params == []
+    assert parse_line("") is None
+    assert parse_line(":prefix") is None
+    assert parse_line("@tags=only") is None
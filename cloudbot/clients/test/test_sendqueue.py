@@ -0,0 +1,80 @@
+from cloudbot.clients.sendqueue import SendQueue
+from cloudbot.util.tokenbucket import TokenBucket
+
+
+def test_unlimited():
+    queue = SendQueue()
+    queue.put("PRIVMSG #chan :a")
+    queue.put("PRIVMSG #chan :b")
+    assert queue.depth == 2
+    assert queue.take() == (["PRIVMSG #chan :a", "PRIVMSG #chan :b"], 0)
+    assert queue.depth == 0
+    assert queue.sent == 2
+
+
+def test_rate_limited():
+    queue = SendQueue(TokenBucket(2, 1))
+    for i in range(4):
+        queue.put("PRIVMSG #chan :{}".format(i))
+
+    lines, delay = queue.take()
+    assert lines == ["PRIVMSG #chan :0", "PRIVMSG #chan :1"]
+    assert 0 < delay <= 1
+    assert queue.depth == 2
+
+
+def test_priority():
+    queue = SendQueue(TokenBucket(1, 1))
+    queue.put("PRIVMSG #chan :a")
+    queue.put("PRIVMSG #chan :b")
+    queue.put("PONG :irc.example.net")
+    queue.put("QUIT :bye")
+
+    # priority lines go first, and aren't limited by the bucket
+    lines, delay = queue.take()
+    assert lines == ["PONG :irc.example.net", "QUIT :bye", "PRIVMSG #chan :a"]
+    assert delay > 0
+
+    queue.bucket.empty()
+    queue.put("pong :again")
+    assert queue.take()[0] == ["pong :again"]
+
+
+def test_dropped():
+    queue = SendQueue(TokenBucket(1, 1), max_size=2)
+    assert queue.put("PRIVMSG #chan :a")
+    assert queue.put("PRIVMSG #chan :b")
+    assert not queue.put("PRIVMSG #chan :c")
+    # the priority lane is never full
+    assert queue.put("PONG :x")
+    assert queue.dropped == 1
+
+    queue.clear()
+    assert queue.dropped == 4
+    assert queue.depth == 0
+
+
+def test_from_config():
+    queue = SendQueue.from_config({"max_tokens": 5, "restore_rate": 2, "line_cost": 2, "max_queue": 10})
+    assert queue.bucket.capacity == 5
+    assert queue.bucket.fill_rate == 2
+    assert queue.line_cost == 2
+    assert queue.max_size == 10
+
+    assert SendQueue.from_config({"enabled": False}).bucket is None
+
+
+def test_from_config_invalid():
+    # a line costing more than the bucket holds could never be sent
+    queue = SendQueue.from_config({"max_tokens": 2, "line_cost": 5})
+    assert queue.line_cost == 2
+    queue.put("PRIVMSG #chan :a")
+    assert queue.take()[0] == ["PRIVMSG #chan :a"]
+
+    queue = SendQueue.from_config({"restore_rate": 0})
+    assert queue.bucket.fill_rate == 1
+    for i in range(11):
+        queue.put("PRIVMSG #chan :{}".format(i))
+    lines, delay = queue.take()
+    assert len(lines) == 10
+    assert 0 < delay <= 1
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from collections import deque
+
+from cloudbot.event import EventType
+
+logger = logging.getLogger("cloudbot")
+
+# what to do with incoming events when a connection already has max_in_flight events being processed
+# queue the event. Once the backlog is full, drop new events until it has drained to half full. Reading from the server
+# never stops, so its PINGs are still answered while the backlog drains.
+OVERLOAD_DROP_NEW = "drop_new"
+OVERLOAD_SHED_OTHER = "shed_other"  # drop EventType.other events, queue everything else
+OVERLOAD_DROP_LOW_PRIORITY = "drop_low_priority"  # queue the event, but don't run low priority raw hooks for it
+
+overload_policies = (OVERLOAD_DROP_NEW, OVERLOAD_SHED_OTHER, OVERLOAD_DROP_LOW_PRIORITY)
+
+# protocol commands which are always processed straight away, to keep the connection alive and finish registering.
+# None of these can be sent by other users, so they can't be used to flood the bot.
+critical_commands = {"PING", "ERROR", "CAP", "001", "004"}
+
+
+class EventDispatcher:
+    """
+    Hands incoming events from a single connection to CloudBot.process, with a bounded number of events in flight.
+
+    Events arriving while the window is full are held in a backlog and started as earlier events finish.
+    What happens beyond that depends on the overload policy, see overload_policies. Critical events, see
+    critical_commands, skip the window and the backlog.
+
+    :type bot: cloudbot.bot.CloudBot
+    :type conn: cloudbot.client.Client
+    :type max_in_flight: int
+    :type max_backlog: int
+    :type policy: str
+    :type in_flight: int
+    :type dropped: int
+    :type shed: int
+    :type dropping: bool
+    :type critical: int
+    :type _backlog: deque[(cloudbot.event.Event, bool)]
+    """
+
+    def __init__(self, bot, conn, *, max_in_flight=100, max_backlog=1000, policy=OVERLOAD_DROP_NEW):
+        """
+        :type bot: cloudbot.bot.CloudBot
+        :type conn: cloudbot.client.Client
+        :type max_in_flight: int
+        :type max_backlog: int
+        :type policy: str
+        """
+        if policy not in overload_policies:
+            raise ValueError("Invalid overload policy {}, expected one of {}".format(policy, overload_policies))
+
+        self.bot = bot
+        self.conn = conn
+        self.max_in_flight = max_in_flight
+        self.max_backlog = max_backlog
+        self.policy = policy
+
+        # counters, for monitoring
+        self.in_flight = 0
+        self.dropped = 0
+        self.shed = 0
+        self.critical = 0
+        # with the drop_new policy, whether new events are being dropped until the backlog drains
+        self.dropping = False
+
+        self._backlog = deque()
+
+    @classmethod
+    def from_config(cls, bot, conn, config):
+        """
+        Creates an EventDispatcher from a connection's "dispatch" config section
+        :type bot: cloudbot.bot.CloudBot
+        :type conn: cloudbot.client.Client
+        :type config: dict[str, unknown]
+        :rtype: EventDispatcher
+        """
+        return cls(bot, conn, max_in_flight=config.get("max_in_flight", 100),
+                   max_backlog=config.get("max_backlog", 1000), policy=config.get("overload_policy", OVERLOAD_DROP_NEW))
+
+    @property
+    def backlog(self):
+        """
+        :return: The number of events waiting to be processed
+        :rtype: int
+        """
+        return len(self._backlog)
+
+    def is_critical(self, event):
+        """
+        :type event: cloudbot.event.Event
+        :rtype: bool
+        """
+        return event.irc_command in critical_commands
+
+    def submit(self, event):
+        """
+        Processes an event as soon as the in-flight window allows it. Not threadsafe.
+        :type event: cloudbot.event.Event
+        """
+        if self.in_flight < self.max_in_flight and not self._backlog:
+            self._start(event, False)
+            return
+
+        # we're overloaded
+        if self.is_critical(event):
+            self.critical += 1
+            self._start(event, False)
+            return
+
+        if self.policy == OVERLOAD_SHED_OTHER and event.type is EventType.other:
+            self.shed += 1
+            return
+
+        if self.dropping or len(self._backlog) >= self.max_backlog:
+            if self.policy == OVERLOAD_DROP_NEW and not self.dropping:
+                logger.warning("[{}] Event backlog full, dropping events until it drains".format(self.conn.name))
+                self.dropping = True
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning("[{}] Event backlog full, dropped {} events so far".format(
+                    self.conn.name, self.dropped))
+            return
+
+        self._backlog.append((event, self.policy == OVERLOAD_DROP_LOW_PRIORITY))
+
+    def reset(self):
+        """
+        Drops the backlog, for when the connection is lost. The events were for the old session, so they shouldn't be
+        processed after reconnecting. Events already in flight are left to finish.
+        """
+        if self._backlog:
+            logger.info("[{}] Dropping {} backlogged events from the lost connection".format(
+                self.conn.name, len(self._backlog)))
+        self.dropped += len(self._backlog)
+        self._backlog.clear()
+        self.dropping = False
+
+    def _start(self, event, shed_low_priority):
+        """
+        :type event: cloudbot.event.Event
+        :type shed_low_priority: bool
+        """
+        self.in_flight += 1
+        task = asyncio.async(self.bot.process(event, shed_low_priority=shed_low_priority), loop=self.bot.loop)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self.in_flight -= 1
+        try:
+            task.result()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("[{}] Error processing event".format(self.conn.name))
+
+        while self._backlog and self.in_flight < self.max_in_flight:
+            self._start(*self._backlog.popleft())
+
+        if self.dropping and len(self._backlog) <= self.max_backlog // 2:
+            logger.info("[{}] Event backlog drained, accepting events again".format(self.conn.name))
+            self.dropping = False
@@ -1,7 +1,7 @@
 import asyncio
-import concurrent.futures
 import enum
 import logging
+from operator import attrgetter
 
 logger = logging.getLogger("cloudbot")
 
@@ -18,6 +18,58 @@ class EventType(enum.Enum):
     other = 6
 
 
+class _EventCore:
+    """
+    The details of the line an event was created from. This is shared by reference between all events created from
+    the same line, and is copied before being changed, see _core_property().
+    """
+    __slots__ = ("type", "content", "content_raw", "target", "chan", "nick", "user", "host", "mask", "irc_raw",
+                 "irc_prefix", "irc_command", "irc_paramlist", "irc_ctcp_text", "irc_tags")
+
+    def __init__(self, event_type, content, content_raw, target, chan, nick, user, host, mask, irc_raw, irc_prefix,
+                 irc_command, irc_paramlist, irc_ctcp_text, irc_tags):
+        self.type = event_type
+        self.content = content
+        self.content_raw = content_raw
+        self.target = target
+        self.chan = chan
+        self.nick = nick
+        self.user = user
+        self.host = host
+        self.mask = mask
+        self.irc_raw = irc_raw
+        self.irc_prefix = irc_prefix
+        self.irc_command = irc_command
+        self.irc_paramlist = irc_paramlist
+        self.irc_ctcp_text = irc_ctcp_text
+        self.irc_tags = irc_tags
+
+    def copy(self):
+        """
+        :rtype: _EventCore
+        """
+        core = _EventCore.__new__(_EventCore)
+        for name in self.__slots__:
+            setattr(core, name, getattr(self, name))
+        return core
+
+
+def _core_property(name):
+    """
+    Creates a property for an attribute of the event core. Setting it copies the core first, so other events created
+    from the same line aren't affected.
+    :type name: str
+    :rtype: property
+    """
+
+    def setter(self, value):
+        core = self._core.copy()
+        setattr(core, name, value)
+        self._core = core
+
+    return property(attrgetter("_core." + name), setter)
+
+
 class Event:
     """
     :type bot: cloudbot.bot.CloudBot
@@ -32,17 +84,38 @@ class Event:
     :type host: str
     :type mask: str
     :type db: sqlalchemy.orm.Session
-    :type db_executor: concurrent.futures.ThreadPoolExecutor
+    :type db_executor: cloudbot.util.executors.HookExecutor
     :type irc_raw: str
     :type irc_prefix: str
     :type irc_command: str
     :type irc_paramlist: str
     :type irc_ctcp_text: str
+    :type irc_tags: dict[str, str]
     """
+    # events are created for every hook triggered by every line, so keep them small. The details of the line itself are
+    # kept in a _EventCore, which is shared with the base event.
+    __slots__ = ("bot", "conn", "hook", "db", "db_executor", "_core")
+
+    type = _core_property("type")
+    content = _core_property("content")
+    content_raw = _core_property("content_raw")
+    target = _core_property("target")
+    chan = _core_property("chan")
+    nick = _core_property("nick")
+    user = _core_property("user")
+    host = _core_property("host")
+    mask = _core_property("mask")
+    # clients-specific parameters
+    irc_raw = _core_property("irc_raw")
+    irc_prefix = _core_property("irc_prefix")
+    irc_command = _core_property("irc_command")
+    irc_paramlist = _core_property("irc_paramlist")
+    irc_ctcp_text = _core_property("irc_ctcp_text")
+    irc_tags = _core_property("irc_tags")
 
     def __init__(self, *, bot=None, hook=None, conn=None, base_event=None, event_type=EventType.other, content=None,
                  content_raw=None, target=None, channel=None, nick=None, user=None, host=None, mask=None, irc_raw=None,
-                 irc_prefix=None, irc_command=None, irc_paramlist=None, irc_ctcp_text=None):
+                 irc_prefix=None, irc_command=None, irc_paramlist=None, irc_ctcp_text=None, irc_tags=None):
         """
         All of these parameters except for `bot` and `hook` are optional.
         The irc_* parameters should only be specified for IRC events.
@@ -62,12 +135,13 @@ class Event:
         :param user: The user of the sender that triggered this event
         :param host: The host of the sender that triggered this event
         :param mask: The mask of the sender that triggered this event (nick!user@host)
-        :param irc_raw: The raw IRC line
+        :param irc_raw: The raw IRC line, without any IRCv3 message tags
         :param irc_prefix: The raw IRC prefix
         :param irc_command: The IRC command
         :param irc_paramlist: The list of params for the IRC command. If the last param is a content param, the ':'
                                 should be removed from the front.
         :param irc_ctcp_text: CTCP text if this message is a CTCP command
+        :param irc_tags: The unescaped IRCv3 message tags sent with this line, if any
         :type bot: cloudbot.bot.CloudBot
         :type conn: cloudbot.client.Client
         :type hook: cloudbot.plugin.Hook
@@ -84,6 +158,7 @@ class Event:
         :type irc_command: str
         :type irc_paramlist: list[str]
         :type irc_ctcp_text: str
+        :type irc_tags: dict[str, str]
         """
         self.db = None
         self.db_executor = None
@@ -99,39 +174,14 @@ class Event:
             if self.hook is None and base_event.hook is not None:
                 self.hook = base_event.hook
 
-            # If base_event is provided, don't check these parameters, just inherit
-            self.type = base_event.type
-            self.content = base_event.content
-            self.content_raw = base_event.content_raw
-            self.target = base_event.target
-            self.chan = base_event.chan
-            self.nick = base_event.nick
-            self.user = base_event.user
-            self.host = base_event.host
-            self.mask = base_event.mask
-            # clients-specific parameters
-            self.irc_raw = base_event.irc_raw
-            self.irc_prefix = base_event.irc_prefix
-            self.irc_command = base_event.irc_command
-            self.irc_paramlist = base_event.irc_paramlist
-            self.irc_ctcp_text = base_event.irc_ctcp_text
+            # If base_event is provided, don't check these parameters, just share them
+            self._core = base_event._core
         else:
             # Since base_event wasn't provided, we can take these parameters
-            self.type = event_type
-            self.content = content
-            self.content_raw = content_raw
-            self.target = target
-            self.chan = channel
-            self.nick = nick
-            self.user = user
-            self.host = host
-            self.mask = mask
-            # clients-specific parameters
-            self.irc_raw = irc_raw
-            self.irc_prefix = irc_prefix
-            self.irc_command = irc_command
-            self.irc_paramlist = irc_paramlist
-            self.irc_ctcp_text = irc_ctcp_text
+            if irc_tags is None:
+                irc_tags = {}
+            self._core = _EventCore(event_type, content, content_raw, target, channel, nick, user, host, mask, irc_raw,
+                                    irc_prefix, irc_command, irc_paramlist, irc_ctcp_text, irc_tags)
 
     @asyncio.coroutine
     def prepare(self):
@@ -147,13 +197,20 @@ class Event:
         if self.hook is None:
             raise ValueError("event.hook is required to prepare an event")
 
-        if "db" in self.hook.required_args:
+        if self.hook.needs_db:
             #logger.debug("Opening database session for {}:threaded=False".format(self.hook.description))
 
-            # we're running a coroutine hook with a db, so initialise an executor pool
-            self.db_executor = concurrent.futures.ThreadPoolExecutor(1)
+            # we're running a coroutine hook with a db, so pin this event to one of the shared database workers
+            self.db_executor = self.bot.executors.db_sessions.acquire()
             # be sure to initialize the db in the database executor, so it will be accessible in that thread.
-            self.db = yield from self.async(self.bot.db_session)
+            # other events may be pinned to the same thread, so this needs its own session rather than the scoped one
+            try:
+                self.db = yield from self.async(self.bot.db_factory)
+            except BaseException:
+                # close() won't be called, so give the worker back now
+                self.bot.executors.db_sessions.release(self.db_executor)
+                self.db_executor = None
+                raise
 
     def prepare_threaded(self):
         """
@@ -168,7 +225,7 @@ class Event:
         if self.hook is None:
             raise ValueError("event.hook is required to prepare an event")
 
-        if "db" in self.hook.required_args:
+        if self.hook.needs_db:
             #logger.debug("Opening database session for {}:threaded=True".format(self.hook.description))
 
             self.db = self.bot.db_session()
@@ -192,6 +249,10 @@ class Event:
             yield from self.async(self.db.close)
             self.db = None
 
+        if self.db_executor is not None:
+            self.bot.executors.db_sessions.release(self.db_executor)
+            self.db_executor = None
+
     def close_threaded(self):
         """
         Closes this event after running it through it's hook.
@@ -316,9 +377,9 @@ class Event:
         else:
             executor = None
         if kwargs:
-            result = yield from self.loop.run_in_executor(executor, function, *args)
-        else:
             result = yield from self.loop.run_in_executor(executor, lambda: function(*args, **kwargs))
+        else:
+            result = yield from self.loop.run_in_executor(executor, function, *args)
         return result
 
 
@@ -328,6 +389,7 @@ class CommandEvent(Event):
     :type text: str
     :type triggered_command: str
     """
+    __slots__ = ("text", "doc", "triggered_command")
 
     def __init__(self, *, bot=None, hook, text, triggered_command, conn=None, base_event=None, event_type=None,
                  content=None, content_raw=None, target=None, channel=None, nick=None, user=None, host=None, mask=None,
@@ -371,6 +433,7 @@ class RegexEvent(Event):
     :type hook: cloudbot.plugin.RegexHook
     :type match: re.__Match
     """
+    __slots__ = ("match",)
 
     def __init__(self, *, bot=None, hook, match, conn=None, base_event=None, event_type=None, content=None, content_raw=None,
                  target=None, channel=None, nick=None, user=None, host=None, mask=None, irc_raw=None, irc_prefix=None,
@@ -386,6 +449,8 @@ class RegexEvent(Event):
 
 
 class CapEvent(Event):
+    __slots__ = ("cap", "cap_param")
+
     def __init__(self, *args, cap, cap_param=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.cap = cap
@@ -305,6 +305,9 @@ def regex(regex_param, **kwargs):
 
 def sieve(param=None, **kwargs):
     """External sieve decorator. Can be used directly as a decorator, or with args to return a decorator
+
+    The sieve can be limited to some hooks with the hook_types, plugins and exclude_plugins args, which take
+    iterables of hook types (eg. "command") and plugin titles.
     :type param: function | None
     """
 
@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+
+import cloudbot
+from cloudbot.event import EventType
+from cloudbot.hook import Action
+
+logger = logging.getLogger("cloudbot")
+
+# bump this when the format of manifest entries changes, so old manifests are ignored
+MANIFEST_VERSION = 1
+
+# hooks which run without being triggered by a line, so their plugins always have to be imported at startup
+_eager_hook_lists = ("sieves", "periodic", "run_on_start", "on_cap_ack", "on_cap_available", "connect_hooks")
+
+
+def file_hash(path):
+    """
+    :type path: str
+    :rtype: str
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _hook_entry(hook):
+    """
+    Describes a hook well enough to register a LazyHook in its place
+    :type hook: cloudbot.plugin.Hook
+    :rtype: dict
+    """
+    entry = {
+        "type": hook.type,
+        "function_name": hook.function_name,
+        "threaded": hook.threaded,
+        "executor": hook.executor,
+        "permissions": list(hook.permissions),
+        "action": hook.action.name,
+        "priority": int(hook.priority),
+    }
+    if hook.type == "command":
+        entry.update(name=hook.name, aliases=hook.aliases, doc=hook.doc, auto_help=hook.auto_help)
+    elif hook.type == "regex":
+        entry.update(regexes=[[regex.pattern, regex.flags] for regex in hook.regexes], run_on_cmd=hook.run_on_cmd,
+                     only_no_match=hook.only_no_match)
+    elif hook.type == "irc_raw":
+        entry.update(triggers=sorted(hook.triggers))
+    elif hook.type == "event":
+        entry.update(types=sorted(event_type.value for event_type in hook.types))
+    return entry
+
+
+def plugin_entry(plugin):
+    """
+    Creates the manifest entry for a loaded plugin. Plugins are only marked as lazy if none of their hooks need to run
+    before the plugin is first triggered by a line.
+    :type plugin: cloudbot.plugin.Plugin
+    :rtype: dict
+    """
+    stat = os.stat(plugin.file_path)
+    entry = {
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "hash": file_hash(plugin.file_path),
+        "lazy": False,
+        "hooks": [],
+        "tables": [table.name for table in plugin.tables],
+    }
+
+    if any(getattr(plugin, name, None) for name in _eager_hook_lists):
+        return entry
+    if any(raw_hook.is_catch_all() for raw_hook in plugin.raw_hooks):
+        # catch-all hooks run for every line, there's nothing to gain
+        return entry
+
+    hooks = [_hook_entry(hook) for hook in plugin.sieved_hooks]
+    if not all(isinstance(pattern, str) for hook in hooks for pattern, flags in hook.get("regexes", ())):
+        return entry
+
+    entry["hooks"] = hooks
+    entry["lazy"] = True
+    return entry
+
+
+class PluginManifest:
+    """
+    A cache of the hooks registered by each plugin, used to avoid importing plugins until they're needed.
+
+    :type path: str
+    :type entries: dict[str, dict]
+    :type dirty: bool
+    """
+
+    def __init__(self, path):
+        """
+        :type path: str
+        """
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        """
+        Loads the manifest from disk, ignoring it if it's missing, unreadable or from another version
+        """
+        self.entries = {}
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable plugin manifest {}".format(self.path))
+            return
+        if data.get("version") != MANIFEST_VERSION or data.get("cloudbot_version") != cloudbot.__version__:
+            logger.info("Ignoring plugin manifest from another version")
+            return
+        self.entries = data.get("plugins", {})
+
+    def save(self):
+        """
+        Writes the manifest to disk, if it changed since it was loaded
+        """
+        if not self.dirty:
+            return
+        data = {"version": MANIFEST_VERSION, "cloudbot_version": cloudbot.__version__, "plugins": self.entries}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    def get(self, file_name, path):
+        """
+        Gets the manifest entry for a plugin, if the plugin hasn't changed since the entry was written
+        :type file_name: str
+        :type path: str
+        :rtype: dict | None
+        """
+        entry = self.entries.get(file_name)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size != entry["size"]:
+            return None
+        if stat.st_mtime != entry["mtime"]:
+            # the file may have just been touched, so check the contents before giving up
+            if file_hash(path) != entry["hash"]:
+                return None
+            entry["mtime"] = stat.st_mtime
+            self.dirty = True
+        return entry
+
+    def update(self, plugin):
+        """
+        :type plugin: cloudbot.plugin.Plugin
+        """
+        self.entries[plugin.file_name] = plugin_entry(plugin)
+        self.dirty = True
+
+    def remove(self, file_name):
+        """
+        :type file_name: str
+        """
+        if self.entries.pop(file_name, None) is not None:
+            self.dirty = True
+
+
+class LazyHook:
+    """
+    Stands in for a hook from a plugin which hasn't been imported yet. It has everything needed to decide whether the
+    hook should run, and PluginManager.launch() imports the plugin to get the real hook when it does.
+
+    :type plugin: LazyPlugin
+    """
+    lazy = True
+
+    def __init__(self, plugin, entry):
+        """
+        :type plugin: LazyPlugin
+        :type entry: dict
+        """
+        self.plugin = plugin
+        self.type = entry["type"]
+        self.function_name = entry["function_name"]
+        self.threaded = entry["threaded"]
+        self.executor = entry["executor"]
+        self.permissions = entry["permissions"]
+        self.action = Action[entry["action"]]
+        self.priority = entry["priority"]
+        self.sieve_chain = []
+
+        if self.type == "command":
+            self.name = entry["name"]
+            self.aliases = entry["aliases"]
+            self.doc = entry["doc"]
+            self.auto_help = entry["auto_help"]
+        elif self.type == "regex":
+            self.regexes = [re.compile(pattern, flags) for pattern, flags in entry["regexes"]]
+            self.run_on_cmd = entry["run_on_cmd"]
+            self.only_no_match = entry["only_no_match"]
+        elif self.type == "irc_raw":
+            self.triggers = set(entry["triggers"])
+        elif self.type == "event":
+            self.types = {EventType(value) for value in entry["types"]}
+
+    def is_catch_all(self):
+        return "*" in getattr(self, "triggers", ())
+
+    @property
+    def description(self):
+        return "{}:{}".format(self.plugin.title, self.function_name)
+
+    def __repr__(self):
+        return "Lazy[type: {}, plugin: {}, function: {}]".format(self.type, self.plugin.title, self.function_name)
+
+    def __str__(self):
+        return "lazy {} {} from {}".format(self.type, self.function_name, self.plugin.file_name)
+
+
+class LazyPlugin:
+    """
+    Stands in for a plugin which hasn't been imported yet, registering LazyHooks from its manifest entry.
+    """
+    lazy = True
+
+    def __init__(self, filepath, filename, title, entry):
+        """
+        :type filepath: str
+        :type filename: str
+        :type title: str
+        :type entry: dict
+        """
+        self.tasks = []
+        self.file_path = filepath
+        self.file_name = filename
+        self.title = title
+
+        hooks = [LazyHook(self, hook_entry) for hook_entry in entry["hooks"]]
+        self.commands = [hook for hook in hooks if hook.type == "command"]
+        self.regexes = [hook for hook in hooks if hook.type == "regex"]
+        self.raw_hooks = [hook for hook in hooks if hook.type == "irc_raw"]
+        self.events = [hook for hook in hooks if hook.type == "event"]
+        self.sieves, self.periodic, self.run_on_start, self.run_on_stop = [], [], [], []
+        self.on_cap_ack, self.on_cap_available, self.connect_hooks = [], [], []
+        # tables are registered when the plugin is imported
+        self.tables = []
+        self.indexes, self.hot_queries = [], []
+
+    @property
+    def sieved_hooks(self):
+        return self.commands + self.regexes + self.raw_hooks + self.events
+
+    @property
+    def registered_hooks(self):
+        return self.commands + self.raw_hooks + self.events + self.regexes
+
+    @asyncio.coroutine
+    def create_tables(self, bot):
+        pass
+
+    @asyncio.coroutine
+    def create_indexes(self, bot):
+        pass
+
+    def unregister_tables(self, bot):
+        pass
@@ -4,16 +4,25 @@ import importlib
 import inspect
 import logging
 import os
+import pickle
 import re
-from collections import defaultdict
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
 from operator import attrgetter
 from itertools import chain
 
 import sqlalchemy
 
-from cloudbot.event import Event
+from cloudbot.event import Event, CommandEvent, RegexEvent, CapEvent
 from cloudbot.hook import Priority, Action
+from cloudbot.manifest import LazyPlugin, PluginManifest
 from cloudbot.util import database
+from cloudbot.util.executors import CPU_POOL, PROCESS_POOL, infer_pool, process_safe_args
+from cloudbot.util.prefilter import RegexPrefilter
+from cloudbot.util.scheduler import Scheduler
+from cloudbot.util.trie import PrefixTrie
 
 logger = logging.getLogger("cloudbot")
 
@@ -41,12 +50,18 @@ def find_hooks(parent, module):
                   "periodic": periodic, "on_start": on_start, "on_stop": on_stop, "on_cap_ack": on_cap_ack,
                   "on_cap_available": on_cap_available, "on_connect": on_connect}
     for name, func in module.__dict__.items():
-        if hasattr(func, "_cloudbot_hook"):
+        # some objects, like sqlalchemy's func, claim to have any attribute asked for, so check it's really hooks
+        if isinstance(getattr(func, "_cloudbot_hook", None), dict):
             # if it has cloudbot hook
             func_hooks = func._cloudbot_hook
 
             for hook_type, func_hook in func_hooks.items():
-                type_lists[hook_type].append(_hook_name_to_plugin[hook_type](parent, func_hook))
+                hook = _hook_name_to_plugin[hook_type](parent, func_hook)
+                if hook.invalid_args:
+                    logger.error("Not registering hook {}: it asks for invalid argument(s) {}".format(
+                        hook.description, ", ".join("'{}'".format(arg) for arg in hook.invalid_args)))
+                    continue
+                type_lists[hook_type].append(hook)
 
             # delete the hook to free memory
             del func._cloudbot_hook
@@ -68,6 +83,74 @@ def find_tables(code):
     return tables
 
 
+def find_indexes(code):
+    """
+    :type code: object
+    :rtype: (list[cloudbot.util.database.TableIndex], list[cloudbot.util.database.HotQuery])
+    """
+    indexes = []
+    hot_queries = []
+    for name, obj in code.__dict__.items():
+        if isinstance(obj, database.TableIndex):
+            indexes.append(obj)
+        elif isinstance(obj, database.HotQuery):
+            hot_queries.append(obj)
+
+    return indexes, hot_queries
+
+
+def create_indexes(engine, indexes):
+    """
+    Creates the given indexes in a single transaction, logging the ones which were created
+    :type engine: sqlalchemy.engine.Engine
+    :type indexes: list[cloudbot.util.database.TableIndex]
+    """
+    with engine.begin() as connection:
+        created = database.create_indexes(connection, indexes)
+    if created:
+        logger.info("Created indexes {}".format(", ".join(created)))
+
+
+# plugins importing each other from different threads could deadlock, so plugin modules are imported one at a time
+_import_lock = threading.Lock()
+
+
+def import_plugin(file_path, file_name, title):
+    """
+    Imports (or reimports) a plugin module and finds its hooks. This is run in an executor, so plugins are imported
+    without blocking the event loop.
+    :type file_path: str
+    :type file_name: str
+    :type title: str
+    :rtype: Plugin
+    """
+    module_name = "plugins.{}".format(title)
+    with _import_lock:
+        plugin_module = importlib.import_module(module_name)
+        # if this plugin was loaded before, reload it
+        if hasattr(plugin_module, "_cloudbot_loaded"):
+            importlib.reload(plugin_module)
+
+    # finding the hooks doesn't touch the import system, so it can run alongside other imports
+    return Plugin(file_path, file_name, title, plugin_module)
+
+
+# hook attributes which don't affect how a hook is registered or run, see _hook_state()
+_swappable_hook_attributes = {"function", "plugin", "get_parameters", "sieve_chain"}
+
+
+def _hook_state(hook):
+    """
+    Gets everything about a hook except its function, so hooks can be compared between versions of a plugin
+    :type hook: Hook
+    :rtype: dict
+    """
+    state = {name: value for name, value in vars(hook).items() if name not in _swappable_hook_attributes}
+    if "regexes" in state:
+        state["regexes"] = [(regex.pattern, regex.flags) for regex in state["regexes"]]
+    return state
+
+
 class PluginManager:
     """
     PluginManager is the core of CloudBot plugin loading.
@@ -85,10 +168,12 @@ class PluginManager:
     :type bot: cloudbot.bot.CloudBot
     :type plugins: dict[str, Plugin]
     :type commands: dict[str, CommandHook]
+    :type command_trie: PrefixTrie
     :type raw_triggers: dict[str, list[RawHook]]
     :type catch_all_triggers: list[RawHook]
     :type event_type_hooks: dict[cloudbot.event.EventType, list[EventHook]]
     :type regex_hooks: list[(re.__Regex, RegexHook)]
+    :type regex_prefilter: RegexPrefilter
     :type sieves: list[SieveHook]
     """
 
@@ -101,14 +186,38 @@ class PluginManager:
 
         self.plugins = {}
         self.commands = {}
+        # mirrors self.commands, used to resolve partial command names
+        self.command_trie = PrefixTrie()
         self.raw_triggers = {}
         self.catch_all_triggers = []
         self.event_type_hooks = {}
         self.regex_hooks = []
+        # mirrors self.regex_hooks, used to skip regexes which can't match a line
+        self.regex_prefilter = RegexPrefilter()
         self.sieves = []
         self.cap_hooks = {"on_available": defaultdict(list), "on_ack": defaultdict(list)}
         self.connect_hooks = []
         self._hook_waiting_queues = {}
+        # the number of times each hook has timed out, by hook description
+        self.timeouts = Counter()
+        # threads running hooks which have timed out, but haven't finished yet
+        self.abandoned_threads = 0
+        # limits the number of concurrent runs of hooks with max_concurrent set
+        self._hook_semaphores = {}
+        # runs periodic hooks, plugins may also use it to schedule their own calls
+        self.scheduler = Scheduler(bot.loop)
+        # the scheduled call running each periodic hook
+        self._periodic_calls = {}
+
+        # when enabled, plugins which don't need to run anything at startup are only imported when first triggered
+        self.lazy_loading = bot.config.get("plugin_loading", {}).get("lazy_loading", False)
+        self.manifest = PluginManifest(os.path.join(bot.data_dir, "plugin_manifest.json"))
+        # imports of lazily loaded plugins which are in progress, by file name
+        self._lazy_imports = {}
+        # how long each part of loading took for each plugin, by file name
+        self.load_times = {}
+        # how long the last hot reload of each plugin took, by file name
+        self.reload_times = {}
 
     @asyncio.coroutine
     def load_all(self, plugin_dir):
@@ -120,8 +229,82 @@ class PluginManager:
         :type plugin_dir: str
         """
         path_list = glob.iglob(os.path.join(plugin_dir, '*.py'))
-        # Load plugins asynchronously :O
-        yield from asyncio.gather(*[self.load_plugin(path) for path in path_list], loop=self.bot.loop)
+        if self.lazy_loading:
+            self.manifest.load()
+        start = time.perf_counter()
+        # Import plugins asynchronously :O
+        plugins = yield from asyncio.gather(
+            *[self._prepare_plugin(path, allow_lazy=self.lazy_loading) for path in path_list], loop=self.bot.loop)
+        plugins = [plugin for plugin in plugins if plugin is not None]
+
+        # create the tables of every plugin at once, before any on_start hooks use them
+        tables_created = yield from self._create_all_tables()
+        if tables_created:
+            yield from self._create_all_indexes(plugins)
+
+        yield from asyncio.gather(*[self._register_plugin(plugin, create_tables=not tables_created)
+                                    for plugin in plugins], loop=self.bot.loop)
+        self._log_load_times(time.perf_counter() - start)
+
+        if self.lazy_loading:
+            try:
+                self.manifest.save()
+            except OSError:
+                logger.exception("Error saving plugin manifest")
+
+    @asyncio.coroutine
+    def _create_all_tables(self):
+        """
+        Creates every table registered to the bot's metadata which doesn't exist yet, using a single connection and
+        transaction instead of a couple of round trips per table. Returns False if that failed, in which case plugins
+        should create their own tables.
+
+        :rtype: bool
+        """
+        metadata = self.bot.db_metadata
+        if not metadata.tables:
+            return True
+
+        def create_all():
+            with self.bot.db_engine.begin() as connection:
+                # creates indexes and constraints along with their tables
+                metadata.create_all(connection, checkfirst=True)
+
+        start = time.perf_counter()
+        try:
+            yield from self.bot.loop.run_in_executor(None, create_all)
+        except Exception:
+            logger.exception("Error creating tables, falling back to creating them for each plugin")
+            return False
+
+        logger.info("Registered {} tables in {:.2f}s".format(len(metadata.tables), time.perf_counter() - start))
+        return True
+
+    @asyncio.coroutine
+    def _create_all_indexes(self, plugins):
+        """
+        Creates the indexes declared by the given plugins in one transaction, after their tables have been created
+
+        :type plugins: list[Plugin | LazyPlugin]
+        """
+        indexes = list(chain.from_iterable(plugin.indexes for plugin in plugins))
+        if not indexes:
+            return
+
+        try:
+            yield from self.bot.loop.run_in_executor(None, create_indexes, self.bot.db_engine, indexes)
+        except Exception:
+            logger.exception("Error creating indexes")
+
+    @asyncio.coroutine
+    def _create_plugin_indexes(self, plugin):
+        """
+        :type plugin: Plugin | LazyPlugin
+        """
+        try:
+            yield from plugin.create_indexes(self.bot)
+        except Exception:
+            logger.exception("Error creating indexes for {}".format(plugin.title))
 
     @asyncio.coroutine
     def unload_all(self):
@@ -130,15 +313,31 @@ class PluginManager:
         )
 
     @asyncio.coroutine
-    def load_plugin(self, path):
+    def load_plugin(self, path, *, allow_lazy=False):
         """
         Loads a plugin from the given path and plugin object, then registers all hooks from that plugin.
 
         Won't load any plugins listed in "disabled_plugins".
 
+        :param allow_lazy: Register placeholder hooks from the plugin manifest instead of importing the plugin, if the
+                            manifest is up to date and the plugin doesn't need to run anything at startup
         :type path: str
+        :type allow_lazy: bool
+        """
+        plugin = yield from self._prepare_plugin(path, allow_lazy=allow_lazy)
+        if plugin is not None:
+            yield from self._register_plugin(plugin)
+
+    @asyncio.coroutine
+    def _prepare_plugin(self, path, *, allow_lazy=False):
         """
+        Imports the plugin from the given path, unloading the previously loaded version of it. Returns None if the
+        plugin shouldn't or couldn't be loaded.
 
+        :type path: str
+        :type allow_lazy: bool
+        :rtype: Plugin | LazyPlugin | None
+        """
         file_path = os.path.abspath(path)
         file_name = os.path.basename(path)
         title = os.path.splitext(file_name)[0]
@@ -159,25 +358,45 @@ class PluginManager:
         if file_name in self.plugins:
             yield from self.unload_plugin(file_path)
 
-        module_name = "plugins.{}".format(title)
-        try:
-            plugin_module = importlib.import_module(module_name)
-            # if this plugin was loaded before, reload it
-            if hasattr(plugin_module, "_cloudbot_loaded"):
-                importlib.reload(plugin_module)
-        except Exception:
-            logger.exception("Error loading {}:".format(file_name))
-            return
+        load_time = {"import": 0.0, "tables": 0.0, "on_start": 0.0}
+        start = time.perf_counter()
+        manifest_entry = self.manifest.get(file_name, file_path) if allow_lazy else None
+        if manifest_entry is not None and manifest_entry["lazy"]:
+            # the plugin will be imported when one of its hooks is first triggered, see _import_lazy_hook()
+            plugin = LazyPlugin(file_path, file_name, title, manifest_entry)
+        else:
+            try:
+                plugin = yield from self.bot.loop.run_in_executor(self.bot.executors.get(CPU_POOL), import_plugin,
+                                                                  file_path, file_name, title)
+            except Exception:
+                logger.exception("Error loading {}:".format(file_name))
+                return None
+            load_time["import"] = time.perf_counter() - start
 
-        # create the plugin
-        plugin = Plugin(file_path, file_name, title, plugin_module)
+        self.load_times[file_name] = load_time
+        return plugin
 
-        # proceed to register hooks
+    @asyncio.coroutine
+    def _register_plugin(self, plugin, *, create_tables=True):
+        """
+        Creates the tables of an imported plugin, runs its on_start hooks, then registers all of its hooks
 
-        # create database tables
-        yield from plugin.create_tables(self.bot)
+        :param create_tables: Whether the plugin's tables still need to be created, they're created in one go by
+                              load_all() at startup
+        :type plugin: Plugin | LazyPlugin
+        :type create_tables: bool
+        """
+        load_time = self.load_times[plugin.file_name]
 
-        # run on_start hooks
+        # create database tables
+        if create_tables:
+            start = time.perf_counter()
+            yield from plugin.create_tables(self.bot)
+            yield from self._create_plugin_indexes(plugin)
+            load_time["tables"] = time.perf_counter() - start
+
+        # run on_start hooks, threaded ones run in their executor pool like any other threaded hook
+        start = time.perf_counter()
         for on_start_hook in plugin.run_on_start:
             success = yield from self.launch(on_start_hook, Event(bot=self.bot, hook=on_start_hook))
             if not success:
@@ -185,88 +404,159 @@ class PluginManager:
 
                 # unregister databases
                 plugin.unregister_tables(self.bot)
+                del self.load_times[plugin.file_name]
                 return
+        load_time["on_start"] = time.perf_counter() - start
 
         self.plugins[plugin.file_name] = plugin
 
-        for on_cap_available_hook in plugin.on_cap_available:
-            for cap in on_cap_available_hook.caps:
-                self.cap_hooks["on_available"][cap.casefold()].append(on_cap_available_hook)
-            self._log_hook(on_cap_available_hook)
+        for hook in plugin.registered_hooks:
+            self._register_hook(hook)
+        self._sort_hooks()
 
-        for on_cap_ack_hook in plugin.on_cap_ack:
-            for cap in on_cap_ack_hook.caps:
-                self.cap_hooks["on_ack"][cap.casefold()].append(on_cap_ack_hook)
-            self._log_hook(on_cap_ack_hook)
+        # new sieves change the sieve chain of every hook, otherwise only this plugin's hooks need one
+        if plugin.sieves:
+            self._compile_sieve_chains(self.plugins.values())
+        else:
+            self._compile_sieve_chains([plugin])
 
-        for periodic_hook in plugin.periodic:
-            task = asyncio.async(self._start_periodic(periodic_hook))
-            plugin.tasks.append(task)
-            self._log_hook(periodic_hook)
+        if self.lazy_loading and not plugin.lazy:
+            self.manifest.update(plugin)
 
-        # register commands
-        for command_hook in plugin.commands:
-            for alias in command_hook.aliases:
-                if alias in self.commands:
-                    logger.warning(
-                        "Plugin {} attempted to register command {} which was already registered by {}. "
-                        "Ignoring new assignment.".format(plugin.title, alias, self.commands[alias].plugin.title))
-                else:
-                    self.commands[alias] = command_hook
-            self._log_hook(command_hook)
+        # we don't need this anymore
+        del plugin.run_on_start
 
-        # register raw hooks
-        for raw_hook in plugin.raw_hooks:
-            if raw_hook.is_catch_all():
-                self.catch_all_triggers.append(raw_hook)
-            else:
-                for trigger in raw_hook.triggers:
-                    if trigger in self.raw_triggers:
-                        self.raw_triggers[trigger].append(raw_hook)
-                    else:
-                        self.raw_triggers[trigger] = [raw_hook]
-            self._log_hook(raw_hook)
+    @asyncio.coroutine
+    def reload_plugin(self, path):
+        """
+        Reloads a plugin after its file changed, only re-registering the hooks which changed. Hooks which are the same
+        apart from their code keep their registration and just get the new function, so periodic hooks keep their
+        schedule. If every on_start hook of the plugin lists the state it sets up in preserve_state, that state is
+        carried over from the old version, and neither on_stop nor on_start hooks are run. Both the old and the new
+        version have to preserve state for it to be carried over.
 
-        # register events
-        for event_hook in plugin.events:
-            for event_type in event_hook.types:
-                if event_type in self.event_type_hooks:
-                    self.event_type_hooks[event_type].append(event_hook)
+        Plugins which aren't loaded yet are loaded with load_plugin().
+
+        :type path: str
+        """
+        file_path = os.path.abspath(path)
+        file_name = os.path.basename(path)
+        old_plugin = self.plugins.get(file_name)
+        if old_plugin is None or old_plugin.lazy:
+            yield from self.load_plugin(path)
+            return
+
+        reload_start = time.perf_counter()
+        load_time = {"import": 0.0, "tables": 0.0, "on_start": 0.0}
+
+        # reimporting reruns the module code, which resets its globals
+        module = sys.modules.get("plugins.{}".format(old_plugin.title))
+        module_globals = vars(module) if module is not None else {}
+        saved_state = {name: module_globals[name] for name in old_plugin.preserved_state if name in module_globals}
+
+        preserve = old_plugin.preserves_state and old_plugin.preserved_state.issubset(saved_state)
+        if preserve:
+            # in case the new version doesn't preserve state, and the old version's on_stop hooks have to run after all
+            old_globals = dict(module_globals)
+        else:
+            # on_stop hooks need the old module's globals, so they run before it's reimported
+            for on_stop_hook in old_plugin.run_on_stop:
+                yield from self.launch(on_stop_hook, Event(bot=self.bot, hook=on_stop_hook))
+            old_plugin.run_on_stop = []
+
+        # the new version of the module defines its tables again
+        old_plugin.unregister_tables(self.bot)
+        start = time.perf_counter()
+        try:
+            plugin = yield from self.bot.loop.run_in_executor(self.bot.executors.get(CPU_POOL), import_plugin,
+                                                              file_path, file_name, old_plugin.title)
+        except Exception:
+            logger.exception("Error reloading {}:".format(file_name))
+            yield from self.unload_plugin(file_path)
+            return
+        load_time["import"] = time.perf_counter() - start
+
+        if preserve and plugin.preserves_state and plugin.preserved_state.issubset(saved_state):
+            module_globals.update(saved_state)
+        elif preserve:
+            # the new version sets its state up from scratch, so the old one has to be stopped. Its on_stop hooks
+            # need the old module's globals, which the reimport replaced, so those are put back while they run.
+            new_globals = dict(module_globals)
+            module_globals.clear()
+            module_globals.update(old_globals)
+            try:
+                for on_stop_hook in old_plugin.run_on_stop:
+                    yield from self.launch(on_stop_hook, Event(bot=self.bot, hook=on_stop_hook))
+            finally:
+                module_globals.clear()
+                module_globals.update(new_globals)
+            old_plugin.run_on_stop = []
+            preserve = False
+
+        start = time.perf_counter()
+        yield from plugin.create_tables(self.bot)
+        yield from self._create_plugin_indexes(plugin)
+        load_time["tables"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if not preserve:
+            for on_start_hook in plugin.run_on_start:
+                success = yield from self.launch(on_start_hook, Event(bot=self.bot, hook=on_start_hook))
+                if not success:
+                    logger.warning("Unloading plugin {}: on_start hook errored".format(plugin.title))
+                    plugin.unregister_tables(self.bot)
+                    yield from self.unload_plugin(file_path)
+                    return
+        load_time["on_start"] = time.perf_counter() - start
+
+        # work out which hooks changed, hooks are matched between versions by their type and function name
+        old_hooks = {(hook.type, hook.function_name): hook for hook in old_plugin.registered_hooks}
+        kept = 0
+        added = []
+        for hooks in (plugin.on_cap_available, plugin.on_cap_ack, plugin.periodic, plugin.commands, plugin.raw_hooks,
+                      plugin.events, plugin.regexes, plugin.sieves, plugin.connect_hooks):
+            for index, hook in enumerate(hooks):
+                key = (hook.type, hook.function_name)
+                old_hook = old_hooks.get(key)
+                if old_hook is not None and _hook_state(old_hook) == _hook_state(hook):
+                    # keep the registered hook, with the new code
+                    del old_hooks[key]
+                    old_hook.function = hook.function
+                    old_hook.plugin = plugin
+                    hooks[index] = old_hook
+                    if old_hook.type == "periodic":
+                        plugin.tasks.append(self._periodic_calls[old_hook])
+                    kept += 1
                 else:
-                    self.event_type_hooks[event_type] = [event_hook]
-            self._log_hook(event_hook)
-
-        # register regexps
-        for regex_hook in plugin.regexes:
-            for regex_match in regex_hook.regexes:
-                self.regex_hooks.append((regex_match, regex_hook))
-            self._log_hook(regex_hook)
-
-        # register sieves
-        for sieve_hook in plugin.sieves:
-            self.sieves.append(sieve_hook)
-            self._log_hook(sieve_hook)
-
-        # register connect hooks
-        for connect_hook in plugin.connect_hooks:
-            self.connect_hooks.append(connect_hook)
-            self._log_hook(connect_hook)
-
-        # sort sieve hooks by priority
-        self.sieves.sort(key=lambda x: x.priority)
-        self.connect_hooks.sort(key=attrgetter("priority"))
+                    added.append(hook)
+
+        # the old hooks left over were changed or removed
+        for hook in old_hooks.values():
+            self._unregister_hook(hook)
+        self.plugins[file_name] = plugin
+        for hook in added:
+            self._register_hook(hook)
+        if added or old_hooks:
+            self._sort_hooks()
+
+        if plugin.sieves or old_plugin.sieves:
+            self._compile_sieve_chains(self.plugins.values())
+        else:
+            self._compile_sieve_chains([plugin])
 
-        # Sort hooks
-        self.regex_hooks.sort(key=lambda x: x[1].priority)
-        dicts_of_lists_of_hooks = (self.event_type_hooks, self.raw_triggers)
-        lists_of_hooks = [self.catch_all_triggers, self.sieves]
-        lists_of_hooks.extend(chain.from_iterable(d.values() for d in dicts_of_lists_of_hooks))
+        if self.lazy_loading:
+            self.manifest.update(plugin)
 
-        for lst in lists_of_hooks:
-            lst.sort(key=lambda x: x.priority)
+        if any(hook.executor == PROCESS_POOL for hook in chain(old_plugin.registered_hooks, plugin.registered_hooks)):
+            # the worker processes still have the old version of the module
+            self.bot.executors.processes.recycle()
 
-        # we don't need this anymore
         del plugin.run_on_start
+        self.load_times[file_name] = load_time
+        self.reload_times[file_name] = time.perf_counter() - reload_start
+        logger.info("Reloaded {} in {:.0f}ms: {} hooks kept, {} registered, {} unregistered{}".format(
+            file_name, self.reload_times[file_name] * 1000, kept, len(added), len(old_hooks),
+            ", state preserved" if preserve else ""))
 
     @asyncio.coroutine
     def unload_plugin(self, path):
@@ -294,60 +584,13 @@ class PluginManager:
         for task in plugin.tasks:
             task.cancel()
 
-        for on_cap_available_hook in plugin.on_cap_available:
-            available_hooks = self.cap_hooks["on_available"]
-            for cap in on_cap_available_hook.caps:
-                cap_cf = cap.casefold()
-                available_hooks[cap_cf].remove(on_cap_available_hook)
-                if not available_hooks[cap_cf]:
-                    del available_hooks[cap_cf]
-
-        for on_cap_ack in plugin.on_cap_ack:
-            ack_hooks = self.cap_hooks["on_ack"]
-            for cap in on_cap_ack.caps:
-                cap_cf = cap.casefold()
-                ack_hooks[cap_cf].remove(on_cap_ack)
-                if not ack_hooks[cap_cf]:
-                    del ack_hooks[cap_cf]
-
-        # unregister commands
-        for command_hook in plugin.commands:
-            for alias in command_hook.aliases:
-                if alias in self.commands and self.commands[alias] == command_hook:
-                    # we need to make sure that there wasn't a conflict, so we don't delete another plugin's command
-                    del self.commands[alias]
-
-        # unregister raw hooks
-        for raw_hook in plugin.raw_hooks:
-            if raw_hook.is_catch_all():
-                self.catch_all_triggers.remove(raw_hook)
-            else:
-                for trigger in raw_hook.triggers:
-                    assert trigger in self.raw_triggers  # this can't be not true
-                    self.raw_triggers[trigger].remove(raw_hook)
-                    if not self.raw_triggers[trigger]:  # if that was the last hook for this trigger
-                        del self.raw_triggers[trigger]
-
-        # unregister events
-        for event_hook in plugin.events:
-            for event_type in event_hook.types:
-                assert event_type in self.event_type_hooks  # this can't be not true
-                self.event_type_hooks[event_type].remove(event_hook)
-                if not self.event_type_hooks[event_type]:  # if that was the last hook for this event type
-                    del self.event_type_hooks[event_type]
-
-        # unregister regexps
-        for regex_hook in plugin.regexes:
-            for regex_match in regex_hook.regexes:
-                self.regex_hooks.remove((regex_match, regex_hook))
-
-        # unregister sieves
-        for sieve_hook in plugin.sieves:
-            self.sieves.remove(sieve_hook)
+        for hook in plugin.registered_hooks:
+            self._unregister_hook(hook)
 
-        # unregister connect hooks
-        for connect_hook in plugin.connect_hooks:
-            self.connect_hooks.remove(connect_hook)
+        if plugin.regexes:
+            self.regex_prefilter.rebuild(self.regex_hooks)
+        if plugin.sieves:
+            self._compile_sieve_chains(other for other in self.plugins.values() if other is not plugin)
 
         # Run on_stop hooks
         for on_stop_hook in plugin.run_on_stop:
@@ -357,20 +600,169 @@ class PluginManager:
         # unregister databases
         plugin.unregister_tables(self.bot)
 
+        # forget concurrency limits for this plugin's hooks
+        for hook in [hook for hook in self._hook_semaphores if hook.plugin is plugin]:
+            del self._hook_semaphores[hook]
+
         # remove last reference to plugin
         del self.plugins[plugin.file_name]
+        self.load_times.pop(plugin.file_name, None)
+        self.reload_times.pop(plugin.file_name, None)
 
         if self.bot.config.get("logging", {}).get("show_plugin_loading", True):
             logger.info("Unloaded all plugins from {}.py".format(plugin.title))
 
         return True
 
+    def find_commands(self, prefix):
+        """
+        Returns all registered (alias, CommandHook) pairs where the alias starts with the given prefix
+
+        :type prefix: str
+        :rtype: list[(str, CommandHook)]
+        """
+        return self.command_trie.find_prefix(prefix)
+
+    def _register_hook(self, hook):
+        """
+        Adds a hook to the lookup tables for its type. _sort_hooks() must be called once all hooks are registered.
+
+        :type hook: Hook
+        """
+        if hook.type == "on_cap_available":
+            for cap in hook.caps:
+                self.cap_hooks["on_available"][cap.casefold()].append(hook)
+        elif hook.type == "on_cap_ack":
+            for cap in hook.caps:
+                self.cap_hooks["on_ack"][cap.casefold()].append(hook)
+        elif hook.type == "periodic":
+            call = self.scheduler.every(hook.interval, self._run_periodic, hook, initial_delay=hook.initial_interval,
+                                        jitter=hook.jitter, name=hook.description)
+            hook.plugin.tasks.append(call)
+            self._periodic_calls[hook] = call
+        elif hook.type == "command":
+            for alias in hook.aliases:
+                if alias in self.commands:
+                    logger.warning(
+                        "Plugin {} attempted to register command {} which was already registered by {}. "
+                        "Ignoring new assignment.".format(hook.plugin.title, alias, self.commands[alias].plugin.title))
+                else:
+                    self.commands[alias] = hook
+                    self.command_trie[alias] = hook
+        elif hook.type == "irc_raw":
+            if hook.is_catch_all():
+                self.catch_all_triggers.append(hook)
+            else:
+                for trigger in hook.triggers:
+                    if trigger in self.raw_triggers:
+                        self.raw_triggers[trigger].append(hook)
+                    else:
+                        self.raw_triggers[trigger] = [hook]
+        elif hook.type == "event":
+            for event_type in hook.types:
+                if event_type in self.event_type_hooks:
+                    self.event_type_hooks[event_type].append(hook)
+                else:
+                    self.event_type_hooks[event_type] = [hook]
+        elif hook.type == "regex":
+            for regex_match in hook.regexes:
+                self.regex_hooks.append((regex_match, hook))
+        elif hook.type == "sieve":
+            self.sieves.append(hook)
+        elif hook.type == "on_connect":
+            self.connect_hooks.append(hook)
+
+        self._log_hook(hook)
+
+    def _unregister_hook(self, hook):
+        """
+        Removes a hook from the lookup tables for its type. The regex prefilter and sieve chains aren't updated.
+
+        :type hook: Hook
+        """
+        if hook.type in ("on_cap_available", "on_cap_ack"):
+            cap_hooks = self.cap_hooks["on_available" if hook.type == "on_cap_available" else "on_ack"]
+            for cap in hook.caps:
+                cap_cf = cap.casefold()
+                cap_hooks[cap_cf].remove(hook)
+                if not cap_hooks[cap_cf]:
+                    del cap_hooks[cap_cf]
+        elif hook.type == "periodic":
+            call = self._periodic_calls.pop(hook, None)
+            if call is not None:
+                call.cancel()
+        elif hook.type == "command":
+            for alias in hook.aliases:
+                if alias in self.commands and self.commands[alias] == hook:
+                    # we need to make sure that there wasn't a conflict, so we don't delete another plugin's command
+                    del self.commands[alias]
+                    del self.command_trie[alias]
+        elif hook.type == "irc_raw":
+            if hook.is_catch_all():
+                self.catch_all_triggers.remove(hook)
+            else:
+                for trigger in hook.triggers:
+                    assert trigger in self.raw_triggers  # this can't be not true
+                    self.raw_triggers[trigger].remove(hook)
+                    if not self.raw_triggers[trigger]:  # if that was the last hook for this trigger
+                        del self.raw_triggers[trigger]
+        elif hook.type == "event":
+            for event_type in hook.types:
+                assert event_type in self.event_type_hooks  # this can't be not true
+                self.event_type_hooks[event_type].remove(hook)
+                if not self.event_type_hooks[event_type]:  # if that was the last hook for this event type
+                    del self.event_type_hooks[event_type]
+        elif hook.type == "regex":
+            for regex_match in hook.regexes:
+                self.regex_hooks.remove((regex_match, hook))
+        elif hook.type == "sieve":
+            self.sieves.remove(hook)
+        elif hook.type == "on_connect":
+            self.connect_hooks.remove(hook)
+
+        # forget its concurrency limit
+        self._hook_semaphores.pop(hook, None)
+
+    def _sort_hooks(self):
+        """
+        Sorts all hook lists by priority, and rebuilds the regex prefilter
+        """
+        self.connect_hooks.sort(key=attrgetter("priority"))
+
+        self.regex_hooks.sort(key=lambda x: x[1].priority)
+        self.regex_prefilter.rebuild(self.regex_hooks)
+        dicts_of_lists_of_hooks = (self.event_type_hooks, self.raw_triggers)
+        lists_of_hooks = [self.catch_all_triggers, self.sieves]
+        lists_of_hooks.extend(chain.from_iterable(d.values() for d in dicts_of_lists_of_hooks))
+
+        for lst in lists_of_hooks:
+            lst.sort(key=lambda x: x.priority)
+
+    def _log_load_times(self, duration):
+        """
+        Logs how long loading all plugins took, and which plugins were the slowest to load
+        :type duration: float
+        """
+        totals = sorted(((sum(times.values()), file_name) for file_name, times in self.load_times.items()),
+                        reverse=True)
+        logger.info("Loaded {} plugins in {:.2f}s, slowest: {}".format(
+            len(self.load_times), duration,
+            ", ".join("{} ({:.2f}s)".format(file_name, total) for total, file_name in totals[:5])))
+        for total, file_name in totals:
+            times = self.load_times[file_name]
+            logger.debug("{}: {:.3f}s (import {:.3f}s, tables {:.3f}s, on_start {:.3f}s)".format(
+                file_name, total, times["import"], times["tables"], times["on_start"]))
+
     def _log_hook(self, hook):
         """
         Logs registering a given hook
 
         :type hook: Hook
         """
+        if hook.threaded and hook.executor not in self.bot.executors:
+            logger.warning("Hook {} asked for unknown executor pool '{}', it will run in the default pool"
+                           .format(hook.description, hook.executor))
+
         if self.bot.config.get("logging", {}).get("show_plugin_loading", True):
             logger.info("Loaded {}".format(hook))
             logger.debug("Loaded {}".format(repr(hook)))
@@ -381,19 +773,15 @@ class PluginManager:
 
         :type hook: cloudbot.plugin.Hook
         :type event: cloudbot.event.Event
-        :rtype: list
+        :rtype: tuple
         """
-        parameters = []
-        for required_arg in hook.required_args:
-            if hasattr(event, required_arg):
-                value = getattr(event, required_arg)
-                parameters.append(value)
-            else:
-                logger.error("Plugin {} asked for invalid argument '{}', cancelling execution!"
-                             .format(hook.description, required_arg))
-                logger.debug("Valid arguments are: {} ({})".format(dir(event), event))
-                return None
-        return parameters
+        try:
+            return hook.get_parameters(event)
+        except AttributeError:
+            # arguments are checked when the hook is loaded, so this only happens if the hook is given the wrong event
+            logger.exception("Plugin {} asked for an argument {} doesn't have, cancelling execution!"
+                             .format(hook.description, type(event).__name__))
+            return None
 
     def _execute_hook_threaded(self, hook, event):
         """
@@ -402,11 +790,10 @@ class PluginManager:
         """
         event.prepare_threaded()
 
-        parameters = self._prepare_parameters(hook, event)
-        if parameters is None:
-            return None
-
         try:
+            parameters = self._prepare_parameters(hook, event)
+            if parameters is None:
+                return None
             return hook.function(*parameters)
         finally:
             event.close_threaded()
@@ -419,33 +806,106 @@ class PluginManager:
         """
         yield from event.prepare()
 
-        parameters = self._prepare_parameters(hook, event)
-        if parameters is None:
-            return None
-
         try:
+            # close the event even if it was given the wrong arguments, so its session and worker are released
+            parameters = self._prepare_parameters(hook, event)
+            if parameters is None:
+                return None
             return (yield from hook.function(*parameters))
         finally:
             yield from event.close()
 
+    @asyncio.coroutine
+    def _execute_hook_process(self, hook, event):
+        """
+        :type hook: Hook
+        :type event: cloudbot.event.Event
+        """
+        parameters = self._prepare_parameters(hook, event)
+        if parameters is None:
+            return None
+
+        future = self.bot.executors.processes.submit(hook.function, *parameters, cpu_limit=hook.cpu_limit)
+        return (yield from asyncio.wrap_future(future, loop=self.bot.loop))
+
+    def _get_timeout(self, hook):
+        """
+        Gets the number of seconds a hook may run for, or 0 if it may run forever
+        :type hook: Hook
+        :rtype: float
+        """
+        if hook.timeout is not None:
+            return hook.timeout
+        if hook.type in ("on_start", "on_stop"):
+            # plugins may legitimately take a while to load or save their data
+            return 0
+        if hook.executor == PROCESS_POOL:
+            return self.bot.executors.processes.timeout
+        return self.bot.config.get("hook_timeout", 60)
+
+    def _hook_timed_out(self, hook, timeout, thread_future):
+        """
+        Cleans up after a hook which didn't finish in time
+        :type hook: Hook
+        :type timeout: float
+        :type thread_future: concurrent.futures.Future | None
+        """
+        self.timeouts[hook.description] += 1
+
+        if hook.executor == PROCESS_POOL:
+            logger.warning("Hook {} didn't finish within {} seconds, killing the process pool"
+                           .format(hook.description, timeout))
+            self.bot.executors.processes.kill()
+        elif thread_future is not None and not thread_future.cancelled():
+            # threads can't be stopped, so just stop waiting for it and keep track of it until it finishes
+            logger.warning("Hook {} didn't finish within {} seconds, abandoning its thread"
+                           .format(hook.description, timeout))
+            self.abandoned_threads += 1
+            thread_future.add_done_callback(
+                lambda _: self.bot.loop.call_soon_threadsafe(self._abandoned_thread_finished, hook))
+        else:
+            logger.warning("Hook {} didn't finish within {} seconds, cancelled it".format(hook.description, timeout))
+
+    def _abandoned_thread_finished(self, hook):
+        """
+        :type hook: Hook
+        """
+        self.abandoned_threads -= 1
+        logger.info("Abandoned thread for hook {} has finished".format(hook.description))
+
     @asyncio.coroutine
     def _execute_hook(self, hook, event):
         """
         Runs the specific hook with the given bot and event.
 
-        Returns False if the hook errored, True otherwise.
+        Returns False if the hook errored or timed out, True otherwise.
 
         :type hook: cloudbot.plugin.Hook
         :type event: cloudbot.event.Event
         :rtype: bool
         """
+        timeout = self._get_timeout(hook)
+        thread_future = None
         try:
             # _internal_run_threaded and _internal_run_coroutine prepare the database, and run the hook.
             # _internal_run_* will prepare parameters and the database session, but won't do any error catching.
-            if hook.threaded:
-                out = yield from self.bot.loop.run_in_executor(None, self._execute_hook_threaded, hook, event)
+            if hook.executor == PROCESS_POOL:
+                coro = self._execute_hook_process(hook, event)
+            elif hook.threaded:
+                executor = self.bot.executors.get(hook.executor)
+                thread_future = executor.submit(self._execute_hook_threaded, hook, event)
+                coro = asyncio.wrap_future(thread_future, loop=self.bot.loop)
+            else:
+                coro = self._execute_hook_sync(hook, event)
+
+            if timeout:
+                # coroutine hooks are cancelled when they time out
+                out = yield from asyncio.wait_for(coro, timeout, loop=self.bot.loop)
             else:
-                out = yield from self._execute_hook_sync(hook, event)
+                out = yield from coro
+        except asyncio.TimeoutError:
+            self._hook_timed_out(hook, timeout, thread_future)
+            return False
         except Exception:
             logger.exception("Error in hook {}".format(hook.description))
             return False
@@ -458,35 +918,128 @@ class PluginManager:
                 event.reply(*str(out).split('\n'))
         return True
 
+    def _run_threaded_sieves(self, sieves, event, hook):
+        """
+        :type sieves: list[SieveHook]
+        :type event: cloudbot.event.Event
+        :type hook: cloudbot.plugin.Hook
+        :rtype: cloudbot.event.Event
+        """
+        for sieve in sieves:
+            try:
+                event = sieve.function(self.bot, event, hook)
+            except Exception:
+                logger.exception("Error running sieve {} on {}:".format(sieve.description, hook.description))
+                return None
+            if event is None:
+                return None
+        return event
+
     @asyncio.coroutine
-    def _sieve(self, sieve, event, hook):
+    def _sieve(self, sieves, event, hook):
         """
-        :type sieve: cloudbot.plugin.Hook
+        Runs one step of a hook's sieve chain: either a single coroutine sieve, or a batch of threaded sieves which
+        are run one after another in a single executor call.
+
+        :type sieves: list[SieveHook]
         :type event: cloudbot.event.Event
         :type hook: cloudbot.plugin.Hook
         :rtype: cloudbot.event.Event
         """
+        sieve = sieves[0]
+        if sieve.threaded:
+            executor = self.bot.executors.get(sieve.executor)
+            return (yield from self.bot.loop.run_in_executor(executor, self._run_threaded_sieves, sieves, event,
+                                                             hook))
+
         try:
-            if sieve.threaded:
-                result = yield from self.bot.loop.run_in_executor(None, sieve.function, self.bot, event, hook)
-            else:
-                result = yield from sieve.function(self.bot, event, hook)
+            result = yield from sieve.function(self.bot, event, hook)
         except Exception:
             logger.exception("Error running sieve {} on {}:".format(sieve.description, hook.description))
             return None
         else:
             return result
 
-    @asyncio.coroutine
-    def _start_periodic(self, hook):
-        interval = hook.interval
-        initial_interval = hook.initial_interval
-        yield from asyncio.sleep(initial_interval)
+    def _compile_sieve_chain(self, hook):
+        """
+        Works out which sieves apply to a hook, grouping consecutive threaded sieves so they can share a single trip
+        to the executor.
+
+        :type hook: Hook
+        """
+        sieve_chain = []
+        for sieve in self.sieves:
+            if not sieve.applies_to(hook):
+                continue
+            if sieve.threaded and sieve_chain and sieve_chain[-1][0].threaded \
+                    and sieve_chain[-1][0].executor == sieve.executor:
+                sieve_chain[-1].append(sieve)
+            else:
+                sieve_chain.append([sieve])
+        hook.sieve_chain = sieve_chain
 
-        while True:
-            event = Event(bot=self.bot, hook=hook)
-            yield from self.launch(hook, event)
-            yield from asyncio.sleep(interval)
+    def _compile_sieve_chains(self, plugins):
+        """
+        :type plugins: collections.Iterable[Plugin]
+        """
+        for plugin in plugins:
+            for hook in plugin.sieved_hooks:
+                self._compile_sieve_chain(hook)
+
+    def _run_periodic(self, hook):
+        """
+        Runs a periodic hook, called by the scheduler. A run which is still going when the next one is due makes the
+        scheduler skip that one.
+        :type hook: PeriodicHook
+        """
+        return self.launch(hook, Event(bot=self.bot, hook=hook))
+
+    def _release_hook_slot(self, key):
+        """
+        Lets the next waiting instance of a single threaded hook run, or marks the hook as not running if there are
+        none waiting
+        :type key: (str, str)
+        """
+        queue = self._hook_waiting_queues[key]
+        while queue is not None and not queue.empty():
+            next_future = queue.get_nowait()
+            # skip over tasks which were cancelled while waiting
+            if not next_future.done():
+                next_future.set_result(None)
+                return
+
+        # We're the last task in the queue, we can delete it now.
+        del self._hook_waiting_queues[key]
+
+    @asyncio.coroutine
+    def _import_lazy_hook(self, hook):
+        """
+        Imports the plugin a LazyHook stands in for, returning the real hook
+        :type hook: cloudbot.manifest.LazyHook
+        :rtype: Hook | None
+        """
+        file_name = hook.plugin.file_name
+        plugin = self.plugins.get(file_name)
+        if plugin is not None and not plugin.lazy:
+            # the plugin was imported since this event was created
+            return plugin.find_hook(hook.type, hook.function_name)
+
+        # several events may trigger the plugin before it's imported, make sure it's only imported once
+        task = self._lazy_imports.get(file_name)
+        if task is None:
+            logger.info("Importing {} on first use".format(file_name))
+            task = asyncio.async(self.load_plugin(hook.plugin.file_path), loop=self.bot.loop)
+            self._lazy_imports[file_name] = task
+            task.add_done_callback(lambda _: self._lazy_imports.pop(file_name, None))
+
+        # don't let a hook timing out cancel the import for everyone else
+        yield from asyncio.shield(task, loop=self.bot.loop)
+
+        plugin = self.plugins.get(file_name)
+        if plugin is None or plugin.lazy:
+            logger.warning("Couldn't import {}, not running {}".format(file_name, hook.description))
+            return None
+        return plugin.find_hook(hook.type, hook.function_name)
 
     @asyncio.coroutine
     def launch(self, hook, event):
@@ -500,9 +1053,15 @@ class PluginManager:
         :rtype: bool
         """
 
+        if hook.lazy:
+            hook = yield from self._import_lazy_hook(hook)
+            if hook is None:
+                return False
+            event.hook = hook
+
         if hook.type not in ("on_start", "on_stop", "periodic"):  # we don't need sieves on on_start hooks.
-            for sieve in self.bot.plugin_manager.sieves:
-                event = yield from self._sieve(sieve, event, hook)
+            for sieves in hook.sieve_chain:
+                event = yield from self._sieve(sieves, event, hook)
                 if event is None:
                     return False
 
@@ -526,23 +1085,32 @@ class PluginManager:
                 future = asyncio.Future()
                 queue.put_nowait(future)
                 # wait until the last task is completed
-                yield from future
+                try:
+                    yield from future
+                except asyncio.CancelledError:
+                    if future.done() and not future.cancelled():
+                        # we were cancelled just after being handed the slot, so pass it on
+                        self._release_hook_slot(key)
+                    raise
             else:
                 # set to None to signify that this hook is running, but there's no need to create a full queue
                 # in case there are no more hooks that will wait
                 self._hook_waiting_queues[key] = None
 
-            # Run the plugin with the message, and wait for it to finish
-            result = yield from self._execute_hook(hook, event)
-
-            queue = self._hook_waiting_queues[key]
-            if queue is None or queue.empty():
-                # We're the last task in the queue, we can delete it now.
-                del self._hook_waiting_queues[key]
-            else:
-                # set the result for the next task's future, so they can execute
-                next_future = yield from queue.get()
-                next_future.set_result(None)
+            try:
+                # Run the plugin with the message, and wait for it to finish
+                result = yield from self._execute_hook(hook, event)
+            finally:
+                self._release_hook_slot(key)
+        elif hook.max_concurrent:
+            # Only allow a set number of instances of this hook to run at once, the rest wait their turn
+            semaphore = self._hook_semaphores.get(hook)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(hook.max_concurrent, loop=self.bot.loop)
+                self._hook_semaphores[hook] = semaphore
+
+            with (yield from semaphore):
+                result = yield from self._execute_hook(hook, event)
         else:
             # Run the plugin with the message, and wait for it to finish
             result = yield from self._execute_hook(hook, event)
@@ -565,6 +1133,8 @@ class Plugin:
     :type events: list[EventHook]
     :type tables: list[sqlalchemy.Table]
     """
+    # see cloudbot.manifest.LazyPlugin
+    lazy = False
 
     def __init__(self, filepath, filename, title, code):
         """
@@ -582,9 +1152,45 @@ class Plugin:
         self.sieves, self.events, self.periodic, *hooks = hooks
         self.run_on_start, self.run_on_stop, self.on_cap_ack, *hooks = hooks
         self.on_cap_available, self.connect_hooks, *hooks = hooks
+        # the module globals kept across hot reloads, see OnStartHook.preserve_state
+        self.preserved_state = set(chain.from_iterable(hook.preserve_state for hook in self.run_on_start))
+        self.preserves_state = bool(self.run_on_start) and all(hook.preserve_state for hook in self.run_on_start)
         # we need to find tables for each plugin so that they can be unloaded from the global metadata when the
         # plugin is reloaded
         self.tables = find_tables(code)
+        self.indexes, self.hot_queries = find_indexes(code)
+
+    @property
+    def sieved_hooks(self):
+        """
+        All hooks from this plugin which are sieved before being run
+        :rtype: collections.Iterable[Hook]
+        """
+        return chain(self.commands, self.regexes, self.raw_hooks, self.events, self.on_cap_ack,
+                     self.on_cap_available, self.connect_hooks)
+
+    @property
+    def registered_hooks(self):
+        """
+        All hooks from this plugin which PluginManager keeps track of while the plugin is loaded
+        :rtype: collections.Iterable[Hook]
+        """
+        return chain(self.on_cap_available, self.on_cap_ack, self.periodic, self.commands, self.raw_hooks,
+                     self.events, self.regexes, self.sieves, self.connect_hooks)
+
+    def find_hook(self, hook_type, function_name):
+        """
+        Finds one of this plugin's command, regex, raw or event hooks by the name of its function
+        :type hook_type: str
+        :type function_name: str
+        :rtype: Hook | None
+        """
+        hooks = {"command": self.commands, "regex": self.regexes, "irc_raw": self.raw_hooks,
+                 "event": self.events}.get(hook_type, [])
+        for hook in hooks:
+            if hook.function_name == function_name:
+                return hook
+        return None
 
     @asyncio.coroutine
     def create_tables(self, bot):
@@ -602,6 +1208,16 @@ class Plugin:
                 if not (yield from bot.loop.run_in_executor(None, table.exists, bot.db_engine)):
                     yield from bot.loop.run_in_executor(None, table.create, bot.db_engine)
 
+    @asyncio.coroutine
+    def create_indexes(self, bot):
+        """
+        Creates the indexes declared by this plugin, and rebuilds any whose definition has changed
+
+        :type bot: cloudbot.bot.CloudBot
+        """
+        if self.indexes:
+            yield from bot.loop.run_in_executor(None, create_indexes, bot.db_engine, self.indexes)
+
     def unregister_tables(self, bot):
         """
         Unregisters all sqlalchemy Tables registered to the global metadata by this plugin
@@ -615,6 +1231,30 @@ class Plugin:
                 bot.db_metadata.remove(table)
 
 
+# the events each type of hook is given, for checking the arguments hooks ask for
+_event_classes = {
+    "command": CommandEvent,
+    "regex": RegexEvent,
+    "on_cap_available": CapEvent,
+    "on_cap_ack": CapEvent,
+}
+
+
+def _bind_parameters(required_args):
+    """
+    Creates a function which reads the given arguments from an event, returning them as a tuple
+    :type required_args: list[str]
+    :rtype: (cloudbot.event.Event) -> tuple
+    """
+    if not required_args:
+        return lambda event: ()
+    if len(required_args) == 1:
+        # attrgetter only returns a tuple when given more than one attribute
+        getter = attrgetter(required_args[0])
+        return lambda event: (getter(event),)
+    return attrgetter(*required_args)
+
+
 class Hook:
     """
     Each hook is specific to one function. This class is never used by itself, rather extended.
@@ -624,10 +1264,19 @@ class Hook:
     :type function: callable
     :type function_name: str
     :type required_args: list[str]
+    :type needs_db: bool
+    :type get_parameters: (cloudbot.event.Event) -> tuple
+    :type invalid_args: list[str]
     :type threaded: bool
     :type permissions: list[str]
     :type single_thread: bool
+    :type max_concurrent: int | None
+    :type executor: str
+    :type timeout: float | None
+    :type sieve_chain: list[list[SieveHook]]
     """
+    # see cloudbot.manifest.LazyHook
+    lazy = False
 
     def __init__(self, _type, plugin, func_hook):
         """
@@ -647,6 +1296,16 @@ class Hook:
         # don't process args starting with "_"
         self.required_args = [arg for arg in self.required_args if not arg.startswith("_")]
 
+        # work out how to read the arguments from the event once, rather than every time the hook runs
+        self.needs_db = "db" in self.required_args
+        self.get_parameters = _bind_parameters(self.required_args)
+        if _type == "sieve":
+            # sieves are always called with (bot, event, hook)
+            self.invalid_args = []
+        else:
+            event_class = _event_classes.get(_type, Event)
+            self.invalid_args = [arg for arg in self.required_args if not hasattr(event_class, arg)]
+
         if asyncio.iscoroutine(self.function) or asyncio.iscoroutinefunction(self.function):
             self.threaded = False
         else:
@@ -654,6 +1313,18 @@ class Hook:
 
         self.permissions = func_hook.kwargs.pop("permissions", [])
         self.single_thread = func_hook.kwargs.pop("singlethread", False)
+        self.max_concurrent = func_hook.kwargs.pop("max_concurrent", None)
+        # the sieves to run before this hook, set by PluginManager when the hook is registered
+        self.sieve_chain = []
+        # the name of the executor pool threaded hooks run in, see cloudbot.util.executors
+        self.executor = func_hook.kwargs.pop("executor", None) or infer_pool(self.required_args)
+        # seconds the hook may run for before it's cancelled, None to use the default and 0 to never time out
+        self.timeout = func_hook.kwargs.pop("timeout", None)
+        # CPU time limit for hooks running in the process pool, None to use the pool's default
+        self.cpu_limit = func_hook.kwargs.pop("cpu_limit", None)
+
+        if self.executor == PROCESS_POOL and not self._can_run_in_process():
+            self.executor = infer_pool(self.required_args)
         self.action = func_hook.kwargs.pop("action", Action.CONTINUE)
         self.priority = func_hook.kwargs.pop("priority", Priority.NORMAL)
 
@@ -661,13 +1332,36 @@ class Hook:
             # we should have popped all the args, so warn if there are any left
             logger.warning("Ignoring extra args {} from {}".format(func_hook.kwargs, self.description))
 
+    def _can_run_in_process(self):
+        """
+        Checks whether this hook can run in the process pool, logging why not if it can't
+        :rtype: bool
+        """
+        if not self.threaded:
+            logger.warning("Hook {} is a coroutine, it can't run in the process pool".format(self.description))
+            return False
+
+        unsafe_args = [arg for arg in self.required_args if arg not in process_safe_args]
+        if unsafe_args:
+            logger.warning("Hook {} takes arguments which can't be sent to another process ({}), it will run in a "
+                           "thread instead".format(self.description, ", ".join(unsafe_args)))
+            return False
+
+        try:
+            pickle.dumps(self.function)
+        except Exception:
+            logger.warning("Hook {} can't be pickled, it will run in a thread instead".format(self.description))
+            return False
+
+        return True
+
     @property
     def description(self):
         return "{}:{}".format(self.plugin.title, self.function_name)
 
     def __repr__(self):
-        return "type: {}, plugin: {}, permissions: {}, single_thread: {}, threaded: {}".format(
-            self.type, self.plugin.title, self.permissions, self.single_thread, self.threaded
+        return "type: {}, plugin: {}, permissions: {}, single_thread: {}, threaded: {}, executor: {}".format(
+            self.type, self.plugin.title, self.permissions, self.single_thread, self.threaded, self.executor
         )
 
 
@@ -729,6 +1423,8 @@ class RegexHook(Hook):
 class PeriodicHook(Hook):
     """
     :type interval: int
+    :type initial_interval: int
+    :type jitter: float
     """
 
     def __init__(self, plugin, periodic_hook):
@@ -739,9 +1435,15 @@ class PeriodicHook(Hook):
 
         self.interval = periodic_hook.interval
         self.initial_interval = periodic_hook.kwargs.pop("initial_interval", self.interval)
+        # each run is delayed by up to this many seconds, so hooks with the same interval don't all run at once
+        self.jitter = periodic_hook.kwargs.pop("jitter", 0)
 
         super().__init__("periodic", plugin, periodic_hook)
 
+        if not 0 <= self.jitter < self.interval:
+            logger.warning("Ignoring jitter of {} which isn't less than its interval".format(self.description))
+            self.jitter = 0
+
     def __repr__(self):
         return "Periodic[interval: [{}], {}]".format(self.interval, Hook.__repr__(self))
 
@@ -774,6 +1476,12 @@ class RawHook(Hook):
 
 
 class SieveHook(Hook):
+    """
+    :type hook_types: frozenset[str] | None
+    :type plugins: frozenset[str] | None
+    :type exclude_plugins: frozenset[str]
+    """
+
     def __init__(self, plugin, sieve_hook):
         """
         :type plugin: Plugin
@@ -781,9 +1489,27 @@ class SieveHook(Hook):
         """
 
         self.priority = sieve_hook.kwargs.pop("priority", 100)
+        # which hooks this sieve applies to, None for all of them
+        hook_types = sieve_hook.kwargs.pop("hook_types", None)
+        self.hook_types = None if hook_types is None else frozenset(hook_types)
+        plugins = sieve_hook.kwargs.pop("plugins", None)
+        self.plugins = None if plugins is None else frozenset(plugins)
+        self.exclude_plugins = frozenset(sieve_hook.kwargs.pop("exclude_plugins", ()))
         # We don't want to thread sieves by default - this is retaining old behavior for compatibility
         super().__init__("sieve", plugin, sieve_hook)
 
+    def applies_to(self, hook):
+        """
+        Checks whether this sieve should be run before the given hook
+        :type hook: Hook
+        :rtype: bool
+        """
+        if self.hook_types is not None and hook.type not in self.hook_types:
+            return False
+        if self.plugins is not None and hook.plugin.title not in self.plugins:
+            return False
+        return hook.plugin.title not in self.exclude_plugins
+
     def __repr__(self):
         return "Sieve[{}]".format(Hook.__repr__(self))
 
@@ -814,11 +1540,17 @@ class EventHook(Hook):
 
 
 class OnStartHook(Hook):
+    """
+    :type preserve_state: list[str]
+    """
+
     def __init__(self, plugin, on_start_hook):
         """
         :type plugin: Plugin
         :type on_start_hook: cloudbot.util.hook._On_startHook
         """
+        # the module globals this hook sets up, which are carried over instead of running it again on a hot reload
+        self.preserve_state = list(on_start_hook.kwargs.pop("preserve_state", []))
         super().__init__("on_start", plugin, on_start_hook)
 
     def __repr__(self):
@@ -60,7 +60,7 @@ class PluginReloader(object):
         # are no other file changes in that time.
         yield from asyncio.sleep(0.2)
         self.reloading.remove(path)
-        yield from self.bot.plugin_manager.load_plugin(path)
+        yield from self.bot.plugin_manager.reload_plugin(path)
 
     @asyncio.coroutine
     def _unload(self, path):
@@ -0,0 +1,194 @@
+import asyncio
+import sys
+
+import pytest
+
+if sys.version_info >= (3, 7):
+    # the core modules use "async" as a name, which is a keyword from python 3.7
+    pytest.skip("cloudbot.event can't be imported on this version of python", allow_module_level=True)
+
+from cloudbot.dispatcher import EventDispatcher, OVERLOAD_DROP_NEW, OVERLOAD_SHED_OTHER, OVERLOAD_DROP_LOW_PRIORITY
+from cloudbot.event import EventType
+from cloudbot.plugin import PluginManager
+
+
+class FakeEvent:
+    def __init__(self, name, event_type=EventType.message, irc_command="PRIVMSG"):
+        self.name = name
+        self.type = event_type
+        self.irc_command = irc_command
+
+
+class FakeConn:
+    name = "test"
+
+
+class FakePlugin:
+    def __init__(self, title):
+        self.title = title
+
+
+class FakeHook:
+    def __init__(self, plugin_title="test", max_concurrent=None):
+        self.plugin = FakePlugin(plugin_title)
+        self.lazy = False
+        self.type = "event"
+        self.sieve_chain = []
+        self.single_thread = False
+        self.max_concurrent = max_concurrent
+
+
+class FakeBot:
+    """
+    Processes events until their futures are finished with finish()
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.running = {}
+        self.started = []
+
+    @asyncio.coroutine
+    def process(self, event, shed_low_priority=False):
+        future = asyncio.Future(loop=self.loop)
+        self.running[event.name] = future
+        self.started.append((event.name, shed_low_priority))
+        yield from future
+
+    def finish(self, *names):
+        for name in names:
+            self.running.pop(name).set_result(None)
+        run_pending(self.loop)
+
+
+def run_pending(loop):
+    # let the tasks and their done callbacks run
+    for _ in range(5):
+        loop.run_until_complete(asyncio.sleep(0, loop=loop))
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def make_dispatcher(loop, **kwargs):
+    bot = FakeBot(loop)
+    return bot, EventDispatcher(bot, FakeConn(), **kwargs)
+
+
+def submit(bot, dispatcher, *events):
+    for event in events:
+        dispatcher.submit(event)
+    bot.finish()
+
+
+def test_in_flight_limit(loop):
+    bot, dispatcher = make_dispatcher(loop, max_in_flight=2, max_backlog=10)
+    submit(bot, dispatcher, *[FakeEvent(i) for i in range(5)])
+    assert dispatcher.in_flight == 2
+    assert dispatcher.backlog == 3
+    assert [name for name, shed in bot.started] == [0, 1]
+
+    # backlogged events start in order as earlier ones finish
+    bot.finish(0)
+    assert [name for name, shed in bot.started] == [0, 1, 2]
+    bot.finish(1, 2)
+    assert dispatcher.backlog == 0
+    bot.finish(3, 4)
+    assert dispatcher.in_flight == 0
+
+
+def test_shed_other(loop):
+    bot, dispatcher = make_dispatcher(loop, max_in_flight=1, policy=OVERLOAD_SHED_OTHER)
+    submit(bot, dispatcher, FakeEvent("first"), FakeEvent("other", EventType.other, "005"), FakeEvent("message"))
+    assert dispatcher.shed == 1
+    assert dispatcher.backlog == 1
+
+
+def test_drop_low_priority(loop):
+    bot, dispatcher = make_dispatcher(loop, max_in_flight=1, max_backlog=1, policy=OVERLOAD_DROP_LOW_PRIORITY)
+    submit(bot, dispatcher, FakeEvent("first"), FakeEvent("second"), FakeEvent("third"))
+    assert dispatcher.dropped == 1
+    bot.finish("first")
+    # events which waited in the backlog skip low priority raw hooks
+    assert bot.started == [("first", False), ("second", True)]
+
+
+def test_drop_new_hysteresis(loop):
+    bot, dispatcher = make_dispatcher(loop, max_in_flight=1, max_backlog=4, policy=OVERLOAD_DROP_NEW)
+    submit(bot, dispatcher, *[FakeEvent(i) for i in range(6)])
+    assert dispatcher.backlog == 4
+    assert dispatcher.dropping
+    assert dispatcher.dropped == 1
+
+    # still dropping until the backlog is down to half
+    bot.finish(0)
+    submit(bot, dispatcher, FakeEvent("dropped"))
+    assert dispatcher.dropping
+    assert dispatcher.dropped == 2
+    bot.finish(1)
+    assert dispatcher.backlog == 2
+    assert not dispatcher.dropping
+    submit(bot, dispatcher, FakeEvent("accepted"))
+    assert dispatcher.backlog == 3
+
+
+def test_critical_events(loop):
+    bot, dispatcher = make_dispatcher(loop, max_in_flight=1, max_backlog=1, policy=OVERLOAD_DROP_NEW)
+    submit(bot, dispatcher, FakeEvent("first"), FakeEvent("second"), FakeEvent("third"),
+           FakeEvent("ping", EventType.other, "PING"), FakeEvent("join", EventType.join, "JOIN"))
+    # PINGs skip the backlog, even while it's full, but a flood of joins is dropped like anything else
+    assert "ping" in bot.running and "join" not in bot.running
+    assert dispatcher.critical == 1
+    assert dispatcher.dropped == 2
+
+
+def test_reset(loop):
+    bot, dispatcher = make_dispatcher(loop, max_in_flight=1, max_backlog=2, policy=OVERLOAD_DROP_NEW)
+    submit(bot, dispatcher, *[FakeEvent(i) for i in range(4)])
+    assert dispatcher.dropping
+    dispatcher.reset()
+    assert not dispatcher.dropping
+    assert dispatcher.backlog == 0
+    # the event in flight finishes, but the backlog from the old connection isn't processed
+    bot.finish(0)
+    assert [name for name, shed in bot.started] == [0]
+
+
+def test_max_concurrent(loop):
+    manager = PluginManager.__new__(PluginManager)
+    manager.bot = FakeBot(loop)
+    manager._hook_semaphores = {}
+    running = []
+    futures = []
+
+    @asyncio.coroutine
+    def execute_hook(hook, event):
+        future = asyncio.Future(loop=loop)
+        futures.append(future)
+        running.append(event)
+        yield from future
+        running.remove(event)
+        return True
+
+    manager._execute_hook = execute_hook
+    hook = FakeHook(max_concurrent=2)
+    tasks = [loop.create_task(manager.launch(hook, i)) for i in range(5)]
+    run_pending(loop)
+    # only two runs at once, the rest wait for the semaphore
+    assert running == [0, 1]
+
+    futures[0].set_result(None)
+    run_pending(loop)
+    assert running == [1, 2]
+
+    while not all(task.done() for task in tasks):
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+        run_pending(loop)
+    assert all(task.result() for task in tasks)
+    assert list(manager._hook_semaphores) == [hook]
@@ -1,7 +1,312 @@
 """
-database - contains variables set by cloudbot to be easily access
+database - contains variables set by cloudbot to be easily access, and sets up the database engine
 """
 
+import logging
+import re
+
+logger = logging.getLogger("cloudbot")
+
 # this is assigned in the CloudBot so that its recreated when the bot restarts
 metadata = None
 base = None
+
+# applied to every new SQLite connection, overridden by the "sqlite" section of "database_options" in the config
+default_sqlite_pragmas = {
+    # readers don't block the writer, and the writer doesn't block readers
+    "journal_mode": "wal",
+    # with WAL, only a power loss can lose the last commits, and it can't corrupt the database
+    "synchronous": "normal",
+    # milliseconds to wait for another connection's lock before failing with "database is locked"
+    "busy_timeout": 5000,
+    "mmap_size": 64 * 1024 * 1024,
+    # negative sizes are in KiB
+    "cache_size": -16000,
+}
+
+# pool options for databases other than SQLite, overridden by "database_options" in the config
+default_pool_options = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    # needs SQLAlchemy 1.2 or later
+    "pool_pre_ping": True,
+    "pool_recycle": 3600,
+}
+
+_pragma_value_re = re.compile(r"^-?\w+$")
+
+
+def is_sqlite(url):
+    """
+    :type url: str
+    :rtype: bool
+    """
+    return url.startswith("sqlite")
+
+
+def is_memory_sqlite(url):
+    """
+    :type url: str
+    :rtype: bool
+    """
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def sqlite_pragmas(options=None):
+    """
+    Gets the PRAGMA statements to run on each new SQLite connection
+    :type options: dict | None
+    :rtype: list[str]
+    """
+    pragmas = dict(default_sqlite_pragmas)
+    pragmas.update(options or {})
+    statements = []
+    for name, value in pragmas.items():
+        if value is None:
+            # let SQLite use its own default
+            continue
+        if isinstance(value, bool):
+            value = "on" if value else "off"
+        value = str(value)
+        if not name.isidentifier() or not _pragma_value_re.match(value):
+            raise ValueError("Invalid SQLite pragma {}={}".format(name, value))
+        statements.append("PRAGMA {}={}".format(name, value))
+    return statements
+
+
+def create_engine(url, options=None):
+    """
+    Creates the bot's database engine. SQLite connections are pooled and reused across threads, and set up with
+    the configured pragmas. Other databases get a sized connection pool.
+
+    :param options: The "database_options" section of the config
+    :type url: str
+    :type options: dict | None
+    :rtype: sqlalchemy.engine.Engine
+    """
+    import sqlalchemy
+    from sqlalchemy import event
+    from sqlalchemy.pool import QueuePool
+
+    options = dict(options or {})
+    if not is_sqlite(url):
+        pool_options = dict(default_pool_options)
+        pool_options.update((key, value) for key, value in options.items() if key in default_pool_options)
+        return sqlalchemy.create_engine(url, **pool_options)
+
+    if is_memory_sqlite(url):
+        # every connection to an in-memory database is a new database, so leave SQLAlchemy's pooling alone
+        return sqlalchemy.create_engine(url)
+
+    pragmas = sqlite_pragmas(options.get("sqlite"))
+    engine = sqlalchemy.create_engine(
+        url, poolclass=QueuePool, pool_size=options.get("pool_size", 10), max_overflow=options.get("max_overflow", 10),
+        # connections are handed between executor threads by the pool, but only ever used by one at a time
+        connect_args={"check_same_thread": False}
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in pragmas:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return engine
+
+
+class DatabaseMetrics:
+    """
+    Counts connections opened and checked out of an engine's pool, for monitoring.
+
+    :type connects: int
+    :type checkouts: int
+    :type invalidated: int
+    """
+
+    def __init__(self, engine):
+        """
+        :type engine: sqlalchemy.engine.Engine
+        """
+        from sqlalchemy import event
+
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+
+        event.listen(engine, "connect", self._connect)
+        event.listen(engine, "checkout", self._checkout)
+        event.listen(engine, "invalidate", self._invalidate)
+
+    def _connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+
+    def _invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidated += 1
+
+    def stats(self):
+        """
+        :rtype: dict[str, int | str]
+        """
+        pool = self.engine.pool
+        stats = {
+            "pool": type(pool).__name__,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "invalidated": self.invalidated,
+        }
+        # only some pool types keep track of these
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if method is not None:
+                stats[name] = method()
+        return stats
+
+
+def _connection(bind):
+    """
+    :type bind: sqlalchemy.orm.Session | sqlalchemy.engine.Connection
+    :rtype: sqlalchemy.engine.Connection
+    """
+    # sessions hand out the connection they're using, connections are used as they are
+    return bind.connection() if hasattr(bind, "get_bind") else bind
+
+
+def table_exists(bind, table):
+    """
+    :type bind: sqlalchemy.orm.Session | sqlalchemy.engine.Connection
+    :type table: str
+    :rtype: bool
+    """
+    connection = _connection(bind)
+    return connection.dialect.has_table(connection, table)
+
+
+def _normalize_sql(sql):
+    return " ".join(sql.lower().replace(" if not exists", "").split())
+
+
+class TableIndex:
+    """
+    An index which a plugin wants on one of its tables. Plugins declare these at module level, like their Tables, and
+    the plugin manager creates them when the plugin is loaded. Columns may be expressions, such as "lower(name)".
+    Unlike sqlalchemy's Index, these are created on tables which already exist, and work on tables the plugin
+    creates itself with raw SQL.
+
+    :type name: str
+    :type table: str
+    :type columns: tuple[str]
+    :type unique: bool
+    :type where: str | None
+    """
+
+    def __init__(self, name, table, *columns, unique=False, where=None):
+        """
+        :type name: str
+        :type table: str
+        :type unique: bool
+        :param where: A condition making this a partial index
+        :type where: str | None
+        """
+        if not columns:
+            raise ValueError("An index needs at least one column")
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.unique = unique
+        self.where = where
+
+    @property
+    def sql(self):
+        """
+        :rtype: str
+        """
+        sql = "CREATE {}INDEX IF NOT EXISTS {} ON {} ({})".format(
+            "UNIQUE " if self.unique else "", self.name, self.table, ", ".join(self.columns))
+        if self.where:
+            sql += " WHERE {}".format(self.where)
+        return sql
+
+    def create(self, bind):
+        """
+        Creates this index if its table exists and the index doesn't, or rebuilds it if its definition has changed.
+        Returns whether the index was created.
+
+        :type bind: sqlalchemy.orm.Session | sqlalchemy.engine.Connection
+        :rtype: bool
+        """
+        if not table_exists(bind, self.table):
+            # the plugin creates the table when it first needs it, and the index along with it
+            return False
+
+        if _connection(bind).dialect.name == "sqlite":
+            existing = bind.execute("select sql from sqlite_master where type = 'index' and name = :name",
+                                    {"name": self.name}).fetchone()
+            if existing is not None:
+                if _normalize_sql(existing[0]) == _normalize_sql(self.sql):
+                    return False
+                logger.info("Rebuilding index {} on {}, its definition has changed".format(self.name, self.table))
+                bind.execute("DROP INDEX {}".format(self.name))
+
+        bind.execute(self.sql)
+        return True
+
+    def __repr__(self):
+        return "TableIndex[name: {}, table: {}, columns: {}]".format(self.name, self.table, self.columns)
+
+
+class HotQuery:
+    """
+    A query a plugin runs often, declared at module level so admins can check it's using an index.
+
+    :type name: str
+    :type sql: str
+    :type params: dict
+    """
+
+    def __init__(self, name, sql, params=None):
+        """
+        :param params: Sample parameters to explain the query with
+        :type name: str
+        :type sql: str
+        :type params: dict | None
+        """
+        self.name = name
+        self.sql = sql
+        self.params = params or {}
+
+    def explain(self, bind):
+        """
+        Gets the database's plan for this query, one step per item
+        :type bind: sqlalchemy.orm.Session | sqlalchemy.engine.Connection
+        :rtype: list[str]
+        """
+        if _connection(bind).dialect.name == "sqlite":
+            # the last column holds the description of each step
+            return [row[-1] for row in bind.execute("EXPLAIN QUERY PLAN " + self.sql, self.params)]
+        return [str(row[0]) for row in bind.execute("EXPLAIN " + self.sql, self.params)]
+
+    def __repr__(self):
+        return "HotQuery[name: {}]".format(self.name)
+
+
+def create_indexes(bind, indexes):
+    """
+    Creates or rebuilds the given indexes, skipping any whose tables don't exist yet. Returns the names of the indexes
+    which were created.
+
+    :type bind: sqlalchemy.orm.Session | sqlalchemy.engine.Connection
+    :type indexes: collections.Iterable[TableIndex]
+    :rtype: list[str]
+    """
+    created = []
+    for index in indexes:
+        if index.create(bind):
+            created.append(index.name)
+    return created
@@ -0,0 +1,415 @@
+"""
+executors.py
+
+Named thread pools for running threaded hooks and sieves, so slow hooks in one pool can't starve the others, and a
+process pool for CPU bound hooks.
+
+License:
+    GPL v3
+"""
+
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger("cloudbot")
+
+DEFAULT_POOL = "io"
+DB_POOL = "db"
+CPU_POOL = "cpu"
+# not a thread pool, hooks using this run in ExecutorManager.processes
+PROCESS_POOL = "process"
+
+# event attributes which can be sent to a hook running in another process
+process_safe_args = {
+    "text", "triggered_command", "content", "content_raw", "chan", "nick", "user", "host", "mask", "irc_raw",
+    "irc_prefix", "irc_command", "irc_paramlist", "irc_ctcp_text", "irc_tags"
+}
+
+default_pools = {
+    # network bound hooks, like most API lookups
+    "io": {"max_workers": 20},
+    # hooks which use the database
+    "db": {"max_workers": 5},
+    # hooks doing heavy computation
+    "cpu": {"max_workers": os.cpu_count() or 1},
+    # pure CPU bound hooks, run in worker processes
+    "process": {"max_workers": 2, "cpu_limit": 10, "timeout": 30},
+}
+
+
+class HookExecutor(ThreadPoolExecutor):
+    """
+    A ThreadPoolExecutor which keeps track of how many of its tasks are waiting and running.
+
+    :type name: str
+    :type max_workers: int
+    :type queued: int
+    :type active: int
+    :type completed: int
+    """
+
+    def __init__(self, name, max_workers):
+        """
+        :type name: str
+        :type max_workers: int
+        """
+        super().__init__(max_workers)
+        self.name = name
+        self.max_workers = max_workers
+
+        # counters, for monitoring
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+
+        self._counter_lock = threading.Lock()
+
+    @property
+    def thread_count(self):
+        """
+        :return: The number of threads started by this pool so far
+        :rtype: int
+        """
+        return len(self._threads)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._counter_lock:
+            self.queued += 1
+        future = super().submit(self._run, fn, args, kwargs)
+        future.add_done_callback(self._cancelled)
+        return future
+
+    def _run(self, fn, args, kwargs):
+        with self._counter_lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._counter_lock:
+                self.active -= 1
+                self.completed += 1
+
+    def _cancelled(self, future):
+        # tasks cancelled before they started never reach _run()
+        if future.cancelled():
+            with self._counter_lock:
+                self.queued -= 1
+
+    def stats(self):
+        """
+        :rtype: dict[str, int]
+        """
+        return {
+            "max_workers": self.max_workers,
+            "threads": self.thread_count,
+            "queued": self.queued,
+            "active": self.active,
+            "completed": self.completed,
+        }
+
+
+class SessionExecutor:
+    """
+    A pool of single threaded workers for coroutine hooks using the database.
+
+    A database session may only be used from the thread it was created in, so each hook is pinned to one worker for
+    as long as it holds a session. Workers are shared between hooks and reused across events.
+
+    :type name: str
+    :type max_workers: int
+    :type workers: list[HookExecutor]
+    :type pinned: list[int]
+    """
+
+    def __init__(self, max_workers, name="db-session"):
+        """
+        :type max_workers: int
+        :type name: str
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.workers = [HookExecutor("{}-{}".format(name, i), 1) for i in range(max_workers)]
+        # the number of hooks currently pinned to each worker
+        self.pinned = [0] * max_workers
+
+    def acquire(self):
+        """
+        Pins a hook to the least busy worker. The worker must be given back with release() once the hook is done.
+        Not threadsafe, this should only be called from the event loop.
+        :rtype: HookExecutor
+        """
+        index = min(range(self.max_workers), key=self.pinned.__getitem__)
+        self.pinned[index] += 1
+        return self.workers[index]
+
+    def release(self, worker):
+        """
+        :type worker: HookExecutor
+        """
+        self.pinned[self.workers.index(worker)] -= 1
+
+    def stats(self):
+        """
+        :rtype: dict[str, int]
+        """
+        return {
+            "max_workers": self.max_workers,
+            "threads": sum(worker.thread_count for worker in self.workers),
+            "queued": sum(worker.queued for worker in self.workers),
+            "active": sum(worker.active for worker in self.workers),
+            "completed": sum(worker.completed for worker in self.workers),
+        }
+
+    def shutdown(self, wait=True):
+        """
+        :type wait: bool
+        """
+        for worker in self.workers:
+            worker.shutdown(wait=wait)
+
+
+class CPULimitExceeded(Exception):
+    pass
+
+
+def _cpu_limit_exceeded(signum, frame):
+    raise CPULimitExceeded("Hook exceeded its CPU time limit")
+
+
+def _run_limited(function, args, cpu_limit):
+    """
+    Runs a hook function in a worker process, raising CPULimitExceeded inside it if it uses more than cpu_limit
+    seconds of CPU time. The limit is only enforced where the resource module is available.
+    """
+    if resource is None or not cpu_limit:
+        return function(*args)
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # RLIMIT_CPU counts the whole life of the worker, so offset the limit by what earlier calls have used
+    limit = int(usage.ru_utime + usage.ru_stime + cpu_limit) + 1
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+
+    previous_handler = signal.signal(signal.SIGXCPU, _cpu_limit_exceeded)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    try:
+        return function(*args)
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        signal.signal(signal.SIGXCPU, previous_handler)
+
+
+class ProcessHookExecutor:
+    """
+    Runs CPU bound hooks in a pool of worker processes, so they can't stall the event loop or hold the GIL.
+
+    Each call is limited to cpu_limit seconds of CPU time, after which CPULimitExceeded is raised in the hook.
+    Calls which take longer than timeout seconds of wall time are dealt with by kill(), which terminates every worker
+    and starts a fresh pool for the next call. Any other calls running at the time fail with BrokenProcessPool.
+
+    Workers keep the plugin modules they imported when they were started, so after a plugin with process hooks is
+    reloaded, recycle() moves new calls to a fresh pool running the new code.
+
+    :type max_workers: int
+    :type cpu_limit: float
+    :type timeout: float
+    :type active: int
+    :type completed: int
+    :type killed: int
+    :type recycled: int
+    :type _pool: ProcessPoolExecutor | None
+    """
+
+    def __init__(self, max_workers, *, cpu_limit=10, timeout=30):
+        """
+        :type max_workers: int
+        :type cpu_limit: float
+        :type timeout: float
+        """
+        self.name = PROCESS_POOL
+        self.max_workers = max_workers
+        self.cpu_limit = cpu_limit
+        self.timeout = timeout
+
+        # counters, for monitoring
+        self.active = 0
+        self.completed = 0
+        self.killed = 0
+        self.recycled = 0
+
+        self._pool = None
+        self._counter_lock = threading.Lock()
+
+    def submit(self, function, *args, cpu_limit=None):
+        """
+        Runs function(*args) in a worker process. The function and its arguments must be picklable.
+        :type function: callable
+        :type cpu_limit: float | None
+        :rtype: concurrent.futures.Future
+        """
+        if self._pool is None:
+            # started lazily, so no processes are forked if no hook uses them
+            self._pool = ProcessPoolExecutor(self.max_workers)
+        if cpu_limit is None:
+            cpu_limit = self.cpu_limit
+        with self._counter_lock:
+            self.active += 1
+        future = self._pool.submit(_run_limited, function, args, cpu_limit)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._counter_lock:
+            self.active -= 1
+            self.completed += 1
+
+    def kill(self):
+        """
+        Terminates all worker processes, abandoning any running calls
+        """
+        pool = self._pool
+        if pool is None:
+            return
+        self._pool = None
+        self.killed += 1
+
+        processes = pool._processes
+        if isinstance(processes, dict):
+            processes = processes.values()
+        for process in list(processes):
+            process.terminate()
+        pool.shutdown(wait=False)
+
+    def recycle(self):
+        """
+        Starts a fresh pool for the next call, leaving running calls to finish in the old one
+        """
+        pool = self._pool
+        if pool is None:
+            return
+        self._pool = None
+        self.recycled += 1
+        pool.shutdown(wait=False)
+
+    def stats(self):
+        """
+        :rtype: dict[str, int]
+        """
+        return {
+            "max_workers": self.max_workers,
+            "threads": 0 if self._pool is None else len(self._pool._processes),
+            "queued": max(self.active - self.max_workers, 0),
+            "active": min(self.active, self.max_workers),
+            "completed": self.completed,
+            "killed": self.killed,
+            "recycled": self.recycled,
+        }
+
+    def shutdown(self, wait=True):
+        """
+        :type wait: bool
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+class ExecutorManager:
+    """
+    Holds the named executor pools configured in the "executors" section of the config.
+
+    Pools not mentioned in the config use their settings from default_pools. Unknown pool names resolve to the
+    default pool.
+
+    Coroutine hooks using the database run their database calls in db_sessions, which has as many workers as the
+    "db" pool. Hooks using the "process" pool run in processes, configured with max_workers, cpu_limit and timeout.
+
+    :type pools: dict[str, HookExecutor]
+    :type db_sessions: SessionExecutor
+    :type processes: ProcessHookExecutor
+    """
+
+    def __init__(self, config=None):
+        """
+        :type config: dict[str, dict[str, unknown]] | None
+        """
+        if config is None:
+            config = {}
+
+        settings = {name: dict(pool) for name, pool in default_pools.items()}
+        for name, pool in config.items():
+            settings.setdefault(name, {}).update(pool)
+
+        process_settings = settings.pop(PROCESS_POOL)
+        self.processes = ProcessHookExecutor(max(process_settings.get("max_workers", 2), 1),
+                                             cpu_limit=process_settings.get("cpu_limit", 10),
+                                             timeout=process_settings.get("timeout", 30))
+
+        self.pools = {}
+        for name, pool in settings.items():
+            max_workers = pool.get("max_workers")
+            if not max_workers or max_workers < 1:
+                logger.warning("Invalid max_workers for executor pool {}, using 1".format(name))
+                max_workers = 1
+            self.pools[name] = HookExecutor(name, max_workers)
+
+        self.db_sessions = SessionExecutor(self.pools[DB_POOL].max_workers)
+
+    def __contains__(self, name):
+        return name in self.pools or name == PROCESS_POOL
+
+    def get(self, name):
+        """
+        Gets an executor pool by name, falling back to the default pool if there is no pool with that name
+        :type name: str | None
+        :rtype: HookExecutor
+        """
+        pool = self.pools.get(name)
+        if pool is None:
+            return self.pools[DEFAULT_POOL]
+        return pool
+
+    def stats(self):
+        """
+        :rtype: dict[str, dict[str, int]]
+        """
+        stats = {name: pool.stats() for name, pool in self.pools.items()}
+        stats[self.db_sessions.name] = self.db_sessions.stats()
+        stats[self.processes.name] = self.processes.stats()
+        return stats
+
+    def shutdown(self, wait=True):
+        """
+        Shuts down all pools, optionally waiting for running tasks to finish
+        :type wait: bool
+        """
+        for pool in self.pools.values():
+            pool.shutdown(wait=wait)
+        self.db_sessions.shutdown(wait=wait)
+        if wait:
+            self.processes.shutdown()
+        else:
+            # don't leave stuck hooks running in orphaned processes
+            self.processes.kill()
+
+
+def infer_pool(required_args):
+    """
+    Picks the pool a threaded hook should run in when it doesn't specify one: hooks using the database go to the
+    database pool, everything else goes to the default pool.
+    :type required_args: list[str]
+    :rtype: str
+    """
+    if "db" in required_args:
+        return DB_POOL
+    return DEFAULT_POOL
@@ -0,0 +1,102 @@
+"""
+leaderboard.py
+
+Keeps the top scores for each channel in memory, so leaderboard commands don't need to query the database every time
+they're used. Each board is loaded from the database the first time it's asked for, then updated as scores change.
+
+License:
+    GPL v3
+"""
+
+import threading
+
+
+class Leaderboard:
+    """
+    The top scores for any number of keys, such as (network, channel), highest first, or lowest first if lowest is
+    set. A board is only kept while it can be updated exactly, when a score in it drops out of the top the board is
+    discarded, and is reloaded from the database the next time it's used.
+
+    :type size: int
+    :type lowest: bool
+    """
+
+    def __init__(self, size, *, lowest=False):
+        """
+        :type size: int
+        :type lowest: bool
+        """
+        self.size = size
+        self.lowest = lowest
+        # key -> [scores, complete], where complete means there are no scores outside the board
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._boards
+
+    def _rank(self, score):
+        return -score if self.lowest else score
+
+    def _sort(self, scores):
+        scores.sort(key=lambda item: self._rank(item[1]), reverse=True)
+
+    def get(self, key):
+        """
+        Gets the board for a key, best first, or None if it isn't loaded
+        :rtype: list[(str, int)] | None
+        """
+        with self._lock:
+            board = self._boards.get(key)
+            return None if board is None else list(board[0])
+
+    def load(self, key, scores):
+        """
+        Sets the board for a key, from a query for (at most) the top size scores
+        :type scores: collections.Iterable[(str, int)]
+        :rtype: list[(str, int)]
+        """
+        scores = [(name, score) for name, score in scores][:self.size]
+        self._sort(scores)
+        with self._lock:
+            self._boards[key] = [scores, len(scores) < self.size]
+        return list(scores)
+
+    def update(self, key, name, score):
+        """
+        Records a new score for a name, if the board for the key is loaded
+        :type name: str
+        :type score: int
+        """
+        with self._lock:
+            board = self._boards.get(key)
+            if board is None:
+                return
+            scores, complete = board
+
+            for i, (other, old_score) in enumerate(scores):
+                if other == name:
+                    if not complete and self._rank(score) < self._rank(scores[-1][1]):
+                        # something outside the board may now rank higher
+                        del self._boards[key]
+                        return
+                    scores[i] = (name, score)
+                    self._sort(scores)
+                    return
+
+            if complete or self._rank(score) > self._rank(scores[-1][1]):
+                scores.append((name, score))
+                self._sort(scores)
+                if len(scores) > self.size:
+                    scores.pop()
+                    board[1] = False
+
+    def discard(self, key=None):
+        """
+        Forgets the board for a key, or every board if no key is given
+        """
+        with self._lock:
+            if key is None:
+                self._boards.clear()
+            else:
+                self._boards.pop(key, None)
@@ -0,0 +1,196 @@
+"""
+prefilter.py
+
+Selects which regex hooks could possibly match a line, without running every hook's regex against it.
+
+Each regex is parsed once to find literal strings that any match must contain. A line is then checked for those
+literals with a single combined search, and only the hooks whose literals were found (plus any hooks where no
+literal could be extracted) have their full regex evaluated.
+
+License:
+    GPL v3
+"""
+
+import re
+
+try:
+    # python 3.11 deprecated sre_constants and sre_parse, their contents now live in the re package
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+
+def fold(text):
+    """
+    Case-folds text for literal comparisons. A regex compiled with re.IGNORECASE treats 'i', the dotless 'ı' and the
+    dotted 'İ' as equal, which casefold() alone does not. casefold() turns 'İ' into two characters, so it's replaced
+    before folding, and 'ı' after.
+    :type text: str
+    :rtype: str
+    """
+    if "İ" in text:
+        text = text.replace("İ", "i")
+    text = text.casefold()
+    if "ı" in text:
+        text = text.replace("ı", "i")
+    return text
+
+
+def _score(literals):
+    # a set of alternatives is only as selective as its shortest member
+    return min(len(literal) for literal in literals)
+
+
+def _required(subpattern, ignorecase):
+    """
+    Finds the most selective set of literals where at least one must be present in any string the subpattern matches
+    :rtype: frozenset[str] | None
+    """
+    best = None
+    run = []
+
+    def consider(candidate):
+        nonlocal best
+        if candidate and (best is None or _score(candidate) > _score(best)):
+            best = candidate
+
+    def end_run():
+        if run:
+            consider(frozenset([fold("".join(run))]))
+            del run[:]
+
+    for op, av in subpattern:
+        if op == sre_constants.LITERAL:
+            char = chr(av)
+            if ignorecase and ord(char) > 127:
+                # non-ascii case folding in the regex engine doesn't always agree with str.casefold()
+                end_run()
+            else:
+                run.append(char)
+        elif op == sre_constants.AT:
+            # anchors don't consume anything, so the run of literals is still contiguous
+            continue
+        else:
+            end_run()
+            if op == sre_constants.SUBPATTERN:
+                child_ignorecase = ignorecase
+                if len(av) == 4:
+                    # python 3.6+ scoped flags, (?i:...)
+                    if av[1] & sre_constants.SRE_FLAG_IGNORECASE:
+                        child_ignorecase = True
+                    if av[2] & sre_constants.SRE_FLAG_IGNORECASE:
+                        child_ignorecase = False
+                consider(_required(av[-1], child_ignorecase))
+            elif op == sre_constants.BRANCH:
+                alternatives = [_required(branch, ignorecase) for branch in av[1]]
+                if all(alternatives):
+                    consider(frozenset().union(*alternatives))
+            elif op in _REPEATS:
+                if av[0] >= 1:
+                    consider(_required(av[2], ignorecase))
+            elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+                consider(_required(av, ignorecase))
+
+    end_run()
+    return best
+
+
+def required_literals(regex):
+    """
+    Returns a set of folded literals where at least one must appear in fold(text) for regex.search(text) to match,
+    or None if no such set could be found.
+    :type regex: re.__Regex
+    :rtype: frozenset[str] | None
+    """
+    pattern = getattr(regex, "pattern", None)
+    if not isinstance(pattern, str):
+        # bytes patterns, or objects which only provide a search() method
+        return None
+    try:
+        parsed = sre_parse.parse(pattern, regex.flags)
+    except Exception:
+        return None
+    return _required(parsed, bool(regex.flags & re.IGNORECASE))
+
+
+class RegexPrefilter:
+    """
+    Holds an ordered list of (regex, hook) pairs, and yields only those which could match a given line.
+    The order of the pairs is always preserved.
+    :type _entries: list[(re.__Regex, object)]
+    :type _always: list[int]
+    :type _literal_entries: list[(str, list[int])]
+    :type _gate: re.__Regex
+    """
+
+    def __init__(self, regex_hooks=()):
+        """
+        :type regex_hooks: list[(re.__Regex, object)]
+        """
+        # literals are cached by regex, so rebuilding only parses newly registered regexes
+        self._literal_cache = {}
+        self.rebuild(regex_hooks)
+
+    def rebuild(self, regex_hooks):
+        """
+        Recomputes the prefilter for the given (regex, hook) pairs, which should already be in priority order.
+        :type regex_hooks: list[(re.__Regex, object)]
+        """
+        self._entries = list(regex_hooks)
+        self._always = []
+        by_literal = {}
+        cache = {}
+
+        for index, (regex, hook) in enumerate(self._entries):
+            if regex in self._literal_cache:
+                literals = self._literal_cache[regex]
+            else:
+                literals = required_literals(regex)
+            cache[regex] = literals
+
+            if literals is None:
+                self._always.append(index)
+            else:
+                for literal in literals:
+                    by_literal.setdefault(literal, []).append(index)
+
+        self._literal_cache = cache
+        self._literal_entries = list(by_literal.items())
+        if by_literal:
+            # the gate only tells us whether *any* literal is present, the exact candidates are found afterwards
+            gate = "|".join(re.escape(literal) for literal in sorted(by_literal))
+            self._gate = re.compile(gate)
+        else:
+            self._gate = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def candidates(self, text):
+        """
+        Yields each (regex, hook) pair in order, skipping pairs where the regex can't possibly match the text
+        :type text: str
+        :rtype: collections.Iterable[(re.__Regex, object)]
+        """
+        entries = self._entries
+        if self._gate is None:
+            indexes = self._always
+        else:
+            folded = fold(text)
+            if self._gate.search(folded) is None:
+                # the common case, no literal appears anywhere in the line
+                indexes = self._always
+            else:
+                matched = set(self._always)
+                for literal, literal_indexes in self._literal_entries:
+                    if literal in folded:
+                        matched.update(literal_indexes)
+                indexes = sorted(matched)
+
+        for index in indexes:
+            yield entries[index]
@@ -0,0 +1,273 @@
+"""
+scheduler.py
+
+Runs timed callbacks from a single heap, with one event loop timer armed for whichever call is due first, instead of
+one sleeping task per periodic hook.
+
+Repeating calls fire at a fixed rate: the next run is planned from when the last run was due, not from when it
+finished, so the time a hook takes doesn't skew its period. A repeating call whose last run (a coroutine or future
+returned by the callback) hasn't finished when it's due again is skipped for that interval.
+
+License:
+    GPL v3
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import random
+from itertools import count
+
+logger = logging.getLogger("cloudbot")
+
+
+class ScheduledCall:
+    """
+    A callback scheduled by a Scheduler. Times are in the event loop's clock, see loop.time().
+
+    :type name: str
+    :type callback: callable
+    :type args: tuple
+    :type interval: float | None
+    :type jitter: float
+    :type due: float
+    :type when: float
+    :type cancelled: bool
+    :type pending: bool
+    :type runs: int
+    :type skipped: int
+    :type last_duration: float | None
+    """
+
+    def __init__(self, scheduler, due, callback, args, *, interval=None, jitter=0, name=None):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.jitter = jitter
+        self.name = name or getattr(callback, "__name__", repr(callback))
+        # when the call is planned for, and when it will actually run once jitter is added
+        self.due = due
+        self.when = due
+        self.cancelled = False
+        # whether the call is in the scheduler's heap
+        self.pending = False
+
+        # counters, for monitoring
+        self.runs = 0
+        self.skipped = 0
+        self.last_duration = None
+
+        # the unfinished result of the last run, if it returned a coroutine or future
+        self._running = None
+
+    @property
+    def running(self):
+        """
+        :rtype: bool
+        """
+        return self._running is not None
+
+    def cancel(self):
+        """
+        Stops this call from running again. A run which is in progress isn't interrupted.
+        """
+        if not self.cancelled:
+            self.cancelled = True
+            self.scheduler._cancelled(self)
+
+    def __repr__(self):
+        return "ScheduledCall[name: {}, when: {}, interval: {}]".format(self.name, self.when, self.interval)
+
+
+class Scheduler:
+    """
+    :type loop: asyncio.AbstractEventLoop
+    """
+
+    def __init__(self, loop):
+        """
+        :type loop: asyncio.AbstractEventLoop
+        """
+        self.loop = loop
+        # (when, sequence, call), the sequence keeps calls due at the same time in the order they were scheduled
+        self._heap = []
+        self._sequence = count()
+        self._timer = None
+        self._timer_when = None
+        # cancelled calls still in the heap
+        self._cancelled_count = 0
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled_count
+
+    def call_at(self, when, callback, *args, name=None):
+        """
+        Runs callback(*args) once, at the given event loop time. If the callback returns a coroutine, it's run as a
+        task.
+        :type when: float
+        :type callback: callable
+        :type name: str | None
+        :rtype: ScheduledCall
+        """
+        call = ScheduledCall(self, when, callback, args, name=name)
+        self._push(call)
+        return call
+
+    def call_later(self, delay, callback, *args, name=None):
+        """
+        Runs callback(*args) once, after delay seconds
+        :type delay: float
+        :type callback: callable
+        :type name: str | None
+        :rtype: ScheduledCall
+        """
+        return self.call_at(self.loop.time() + delay, callback, *args, name=name)
+
+    def every(self, interval, callback, *args, initial_delay=None, jitter=0, name=None):
+        """
+        Runs callback(*args) every interval seconds, until the returned call is cancelled. Each run is delayed by a
+        random amount of up to jitter seconds (less than the interval), without drifting the schedule.
+        :type interval: float
+        :type callback: callable
+        :type initial_delay: float | None
+        :type jitter: float
+        :type name: str | None
+        :rtype: ScheduledCall
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if not 0 <= jitter < interval:
+            raise ValueError("jitter must be less than the interval")
+        if initial_delay is None:
+            initial_delay = interval
+        call = ScheduledCall(self, self.loop.time() + initial_delay, callback, args, interval=interval,
+                             jitter=jitter, name=name)
+        self._push(call)
+        return call
+
+    def calls(self):
+        """
+        Gets the pending calls, soonest first
+        :rtype: list[ScheduledCall]
+        """
+        return [call for when, sequence, call in sorted(self._heap) if not call.cancelled]
+
+    def close(self):
+        """
+        Cancels every pending call
+        """
+        for when, sequence, call in self._heap:
+            call.cancelled = True
+            call.pending = False
+        self._heap = []
+        self._cancelled_count = 0
+        self._set_timer()
+
+    def _push(self, call):
+        if call.jitter:
+            call.when = call.due + random.uniform(0, call.jitter)
+        else:
+            call.when = call.due
+        heapq.heappush(self._heap, (call.when, next(self._sequence), call))
+        call.pending = True
+        if self._timer_when is None or call.when < self._timer_when:
+            self._set_timer()
+
+    def _cancelled(self, call):
+        if not call.pending:
+            return
+        self._cancelled_count += 1
+        if self._cancelled_count > 64 and self._cancelled_count > len(self._heap) // 2:
+            # mostly cancelled calls, rebuild the heap rather than popping them one at a time as they come due
+            for when, sequence, cancelled_call in self._heap:
+                if cancelled_call.cancelled:
+                    cancelled_call.pending = False
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled_count = 0
+            self._set_timer()
+
+    def _set_timer(self):
+        """
+        Arms the loop timer for the earliest pending call
+        """
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)[2].pending = False
+            self._cancelled_count -= 1
+
+        when = self._heap[0][0] if self._heap else None
+        if when == self._timer_when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._timer_when = when
+        if when is not None:
+            self._timer = self.loop.call_at(when, self._run_due)
+
+    def _run_due(self):
+        self._timer = None
+        self._timer_when = None
+        now = self.loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            when, sequence, call = heapq.heappop(self._heap)
+            call.pending = False
+            if call.cancelled:
+                self._cancelled_count -= 1
+                continue
+            self._run(call, now)
+        self._set_timer()
+
+    def _run(self, call, now):
+        """
+        :type call: ScheduledCall
+        :type now: float
+        """
+        if call.interval is not None:
+            # plan the next run from when this one was due, skipping any intervals the loop was too busy for
+            missed = max(math.floor((now - call.due) / call.interval), 0)
+            call.skipped += missed
+            call.due += (missed + 1) * call.interval
+
+        if call.running:
+            # the last run is still going, don't start another alongside it
+            call.skipped += 1
+        else:
+            self._start(call, now)
+
+        if call.interval is not None and not call.cancelled:
+            self._push(call)
+
+    def _start(self, call, now):
+        """
+        :type call: ScheduledCall
+        :type now: float
+        """
+        call.runs += 1
+        try:
+            result = call.callback(*call.args)
+        except Exception:
+            logger.exception("Error in scheduled call {}".format(call.name))
+            call.last_duration = self.loop.time() - now
+            return
+
+        if asyncio.iscoroutine(result):
+            result = self.loop.create_task(result)
+        if not isinstance(result, asyncio.Future):
+            call.last_duration = self.loop.time() - now
+            return
+
+        def done(future):
+            call._running = None
+            call.last_duration = self.loop.time() - now
+            if future.cancelled():
+                return
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Error in scheduled call {}".format(call.name))
+
+        call._running = result
+        result.add_done_callback(done)
@@ -0,0 +1,176 @@
+"""
+tablecache.py
+
+A write-through cache of a database table, for plugins which keep a table in memory. Rows are loaded once, then each
+write the plugin makes to the table is applied to the cache as well, instead of reading the whole table again.
+
+License:
+    GPL v3
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger("cloudbot")
+
+
+class TableCache:
+    """
+    Maps the key columns of each row, nested in order, to its value column. For example, with the key columns
+    ("chan", "name"), cache[chan][name] is the value of the row for that channel and name. With multi set, each key
+    maps to a list of the values of every row with that key, in the order they were added.
+
+    Changes replace the dicts and lists leading to the changed row instead of modifying them, so anything read from the
+    cache can be iterated while another thread changes the cache. What's read should never be modified.
+
+    :type key_columns: tuple[str]
+    :type value_column: str
+    :type multi: bool
+    :type version: int
+    """
+
+    def __init__(self, key_columns, value_column, *, multi=False, default=None):
+        """
+        :type key_columns: tuple[str]
+        :type value_column: str
+        :type multi: bool
+        :param default: What cache[key] returns for a key with no rows, instead of raising a KeyError
+        :type default: object
+        """
+        if not key_columns:
+            raise ValueError("A cache needs at least one key column")
+        self.key_columns = tuple(key_columns)
+        self.value_column = value_column
+        self.multi = multi
+        self.default = default
+        # bumped by every change, so anything derived from the cache can tell when it's out of date
+        self.version = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        try:
+            return self._data[key]
+        except KeyError:
+            if self.default is None:
+                raise
+            return self.default
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return self._data.keys()
+
+    def items(self):
+        return self._data.items()
+
+    def _build(self, rows):
+        data = {}
+        for row in rows:
+            self._add(data, row)
+        return data
+
+    def _add(self, data, row):
+        *parents, last = (row[column] for column in self.key_columns)
+        for key in parents:
+            data = data.setdefault(key, {})
+        if self.multi:
+            data.setdefault(last, []).append(row[self.value_column])
+        else:
+            data[last] = row[self.value_column]
+
+    def load(self, rows):
+        """
+        Replaces the contents of the cache with the given rows
+        :type rows: collections.Iterable[collections.Mapping]
+        """
+        data = self._build(rows)
+        with self._lock:
+            self._data = data
+            self.version += 1
+
+    def reconcile(self, rows):
+        """
+        Reloads the cache from the given rows, in case the table was changed by something other than the plugin.
+        Returns whether the cache was out of date.
+        :type rows: collections.Iterable[collections.Mapping]
+        :rtype: bool
+        """
+        data = self._build(rows)
+        with self._lock:
+            if data == self._data:
+                return False
+            self._data = data
+            self.version += 1
+        logger.warning("Cache of {} was out of date with its table, reloaded it".format(
+            ", ".join(self.key_columns + (self.value_column,))))
+        return True
+
+    def insert(self, row):
+        """
+        Applies an inserted (or, without multi, updated) row to the cache
+        :type row: collections.Mapping
+        """
+        *parents, last = (row[column] for column in self.key_columns)
+        with self._lock:
+            # copy the dicts leading to the row, rather than changing ones which may be being read
+            data = root = dict(self._data)
+            for key in parents:
+                data[key] = dict(data.get(key, ()))
+                data = data[key]
+            if self.multi:
+                data[last] = data.get(last, []) + [row[self.value_column]]
+            else:
+                data[last] = row[self.value_column]
+            self._data = root
+            self.version += 1
+
+    def delete(self, row):
+        """
+        Applies a deleted row to the cache. Only the key columns are needed, unless multi is set, in which case every
+        row with the same key and value is removed, or every row with the key if the row has no value.
+        :type row: collections.Mapping
+        """
+        keys = [row[column] for column in self.key_columns]
+        with self._lock:
+            # find the dicts leading to the row, so they can be copied and any left empty can be removed
+            path = [self._data]
+            for key in keys[:-1]:
+                inner = path[-1].get(key)
+                if inner is None:
+                    return
+                path.append(inner)
+
+            last = keys[-1]
+            if last not in path[-1]:
+                return
+            data = dict(path[-1])
+            if self.multi and self.value_column in row:
+                value = row[self.value_column]
+                values = [other for other in data[last] if other != value]
+                if values:
+                    data[last] = values
+                else:
+                    del data[last]
+            else:
+                del data[last]
+
+            for parent, key in zip(reversed(path[:-1]), reversed(keys[:-1])):
+                parent = dict(parent)
+                if data:
+                    parent[key] = data
+                else:
+                    del parent[key]
+                data = parent
+            self._data = data
+            self.version += 1
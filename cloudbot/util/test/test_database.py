@@ -1,6 +1,88 @@
-from cloudbot.util.database import metadata, base
+import sqlite3
+
+import pytest
+
+from cloudbot.util.database import metadata, base, is_sqlite, is_memory_sqlite, sqlite_pragmas, TableIndex, \
+    HotQuery, create_indexes
 
 
 def test_database():
     assert metadata is None
     assert base is None
+
+
+def test_is_sqlite():
+    assert is_sqlite("sqlite:///cloudbot.db")
+    assert not is_sqlite("postgresql://cloudbot@localhost/cloudbot")
+    assert is_memory_sqlite("sqlite://")
+    assert is_memory_sqlite("sqlite:///:memory:")
+    assert not is_memory_sqlite("sqlite:///cloudbot.db")
+
+
+def test_sqlite_pragmas():
+    pragmas = sqlite_pragmas()
+    assert "PRAGMA journal_mode=wal" in pragmas
+    assert "PRAGMA synchronous=normal" in pragmas
+
+    pragmas = sqlite_pragmas({"synchronous": "full", "cache_size": -2000, "mmap_size": None})
+    assert "PRAGMA synchronous=full" in pragmas
+    assert "PRAGMA cache_size=-2000" in pragmas
+    assert not any(pragma.startswith("PRAGMA mmap_size") for pragma in pragmas)
+
+
+def test_sqlite_pragmas_invalid():
+    with pytest.raises(ValueError):
+        sqlite_pragmas({"journal_mode": "wal; drop table quote"})
+
+
+class SQLiteDialect:
+    name = "sqlite"
+
+    def has_table(self, connection, table):
+        return connection.execute("select 1 from sqlite_master where type = 'table' and name = :name",
+                                  {"name": table}).fetchone() is not None
+
+
+class SQLiteConnection:
+    """
+    Just enough of a sqlalchemy Connection around sqlite3 for TableIndex
+    """
+    dialect = SQLiteDialect()
+
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:")
+
+    def execute(self, sql, params=()):
+        return self.db.execute(sql, params)
+
+
+def test_index_sql():
+    index = TableIndex("seen_name", "seen_user", "lower(name)", "chan")
+    assert index.sql == "CREATE INDEX IF NOT EXISTS seen_name ON seen_user (lower(name), chan)"
+    index = TableIndex("tells_unread", "tells", "target", unique=True, where="is_read = 0")
+    assert index.sql == "CREATE UNIQUE INDEX IF NOT EXISTS tells_unread ON tells (target) WHERE is_read = 0"
+
+    with pytest.raises(ValueError):
+        TableIndex("empty", "tells")
+
+
+def test_create_indexes():
+    connection = SQLiteConnection()
+    index = TableIndex("seen_name", "seen_user", "lower(name)", "chan")
+    # the table doesn't exist yet
+    assert create_indexes(connection, [index]) == []
+
+    connection.execute("create table seen_user(name, time, quote, chan, host, primary key(name, chan))")
+    assert create_indexes(connection, [index]) == ["seen_name"]
+    # already up to date
+    assert create_indexes(connection, [index]) == []
+
+    query = HotQuery("seen", "select quote from seen_user where lower(name) = :name and chan = :chan",
+                     {"name": "nick", "chan": "#channel"})
+    assert any("seen_name" in step for step in query.explain(connection))
+
+    # the definition changed, so the index is rebuilt
+    index = TableIndex("seen_name", "seen_user", "lower(name)")
+    assert create_indexes(connection, [index]) == ["seen_name"]
+    sql = connection.execute("select sql from sqlite_master where name = 'seen_name'").fetchone()[0]
+    assert "chan" not in sql
@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from cloudbot.util.executors import CPULimitExceeded, ExecutorManager, HookExecutor, ProcessHookExecutor, \
+    SessionExecutor, infer_pool
+
+
+def test_infer_pool():
+    assert infer_pool(["text", "db"]) == "db"
+    assert infer_pool(["text", "reply"]) == "io"
+    assert infer_pool([]) == "io"
+
+
+def test_manager_config():
+    manager = ExecutorManager({"io": {"max_workers": 3}, "web": {"max_workers": 2}, "bad": {"max_workers": 0}})
+    try:
+        assert manager.get("io").max_workers == 3
+        assert manager.get("web").max_workers == 2
+        assert manager.get("bad").max_workers == 1
+        # defaults are kept for pools missing from the config
+        assert manager.get("db").max_workers == 5
+        # unknown pools fall back to the default pool
+        assert "nope" not in manager
+        assert manager.get("nope") is manager.get("io")
+        assert set(manager.stats()) == {"io", "db", "cpu", "web", "bad", "db-session", "process"}
+        assert manager.db_sessions.max_workers == 5
+    finally:
+        manager.shutdown()
+
+
+def test_executor_counters():
+    executor = HookExecutor("test", 1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    try:
+        first = executor.submit(blocker)
+        started.wait(5)
+        second = executor.submit(lambda: 1)
+        third = executor.submit(lambda: 2)
+        assert executor.active == 1
+        assert executor.queued == 2
+
+        assert third.cancel()
+        assert executor.queued == 1
+
+        release.set()
+        assert first.result(5) == "done"
+        assert second.result(5) == 1
+    finally:
+        executor.shutdown()
+
+    stats = executor.stats()
+    assert stats["active"] == 0
+    assert stats["queued"] == 0
+    assert stats["completed"] == 2
+    assert stats["threads"] == 1
+
+
+def test_session_executor_balancing():
+    sessions = SessionExecutor(3)
+    try:
+        workers = [sessions.acquire() for _ in range(6)]
+        assert sessions.pinned == [2, 2, 2]
+        sessions.release(workers[0])
+        sessions.release(workers[3])
+        assert sessions.pinned == [0, 2, 2]
+        assert sessions.acquire() is sessions.workers[0]
+    finally:
+        sessions.shutdown()
+
+
+def test_session_executor_stress():
+    # simulate thousands of coroutine hooks using the database, all running at once
+    sessions = SessionExecutor(4)
+    threads_before = threading.active_count()
+    hooks = 5000
+
+    try:
+        pinned = []
+        futures = []
+        for _ in range(hooks):
+            worker = sessions.acquire()
+            pinned.append(worker)
+            # open, use and close a "session", recording which thread each step ran in
+            futures.append([worker.submit(threading.get_ident) for _ in range(3)])
+
+        assert threading.active_count() <= threads_before + 4
+
+        for worker, steps in zip(pinned, futures):
+            idents = {future.result(5) for future in steps}
+            # every step of a session ran in the same thread
+            assert len(idents) == 1
+            sessions.release(worker)
+
+        stats = sessions.stats()
+        assert stats["threads"] == 4
+        assert stats["completed"] == hooks * 3
+        assert sessions.pinned == [0, 0, 0, 0]
+    finally:
+        sessions.shutdown()
+
+    assert threading.active_count() <= threads_before
+
+
+def _spin():
+    while True:
+        pass
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_process_executor():
+    processes = ProcessHookExecutor(1, cpu_limit=1, timeout=5)
+    try:
+        assert processes.submit(pow, 2, 10).result(10) == 1024
+
+        # busy hooks are stopped by the CPU limit, leaving the worker usable
+        with pytest.raises(CPULimitExceeded):
+            processes.submit(_spin).result(10)
+        assert processes.submit(pow, 3, 2).result(10) == 9
+
+        # hooks which are stuck without using CPU have to be killed
+        stuck = processes.submit(_sleep, 30)
+        processes.kill()
+        with pytest.raises(BrokenProcessPool):
+            stuck.result(10)
+        assert processes.killed == 1
+
+        # a fresh pool is started for the next call
+        assert processes.submit(_sleep, 0).result(10) == 0
+        assert processes.stats()["completed"] == 5
+
+        # recycling lets running calls finish, and starts a fresh pool for new ones
+        running = processes.submit(_sleep, 0.5)
+        processes.recycle()
+        assert processes.recycled == 1
+        assert processes.submit(pow, 2, 3).result(10) == 8
+        assert running.result(10) == 0.5
+    finally:
+        processes.shutdown()
+
+
+def test_process_pool_config():
+    manager = ExecutorManager({"process": {"max_workers": 3, "timeout": 5}})
+    try:
+        assert "process" in manager
+        assert manager.processes.max_workers == 3
+        assert manager.processes.timeout == 5
+        assert manager.processes.cpu_limit == 10
+    finally:
+        manager.shutdown()
@@ -0,0 +1,58 @@
+from cloudbot.util.leaderboard import Leaderboard
+
+
+def test_not_loaded():
+    board = Leaderboard(3)
+    board.update("#chan", "a", 5)
+    assert board.get("#chan") is None
+    assert "#chan" not in board
+
+
+def test_complete_board():
+    board = Leaderboard(3)
+    # fewer scores than the board holds, so every score is on it
+    assert board.load("#chan", [("a", 5), ("b", 3)]) == [("a", 5), ("b", 3)]
+    board.update("#chan", "c", 4)
+    assert board.get("#chan") == [("a", 5), ("c", 4), ("b", 3)]
+    board.update("#chan", "a", 1)
+    assert board.get("#chan") == [("c", 4), ("b", 3), ("a", 1)]
+
+    # full now, the lowest score drops off
+    board.update("#chan", "d", 2)
+    assert board.get("#chan") == [("c", 4), ("b", 3), ("d", 2)]
+
+
+def test_full_board():
+    board = Leaderboard(2)
+    board.load("#chan", [("a", 5), ("b", 3)])
+    # not enough to get on the board
+    board.update("#chan", "c", 2)
+    assert board.get("#chan") == [("a", 5), ("b", 3)]
+    board.update("#chan", "c", 4)
+    assert board.get("#chan") == [("a", 5), ("c", 4)]
+    board.update("#chan", "a", 6)
+    assert board.get("#chan") == [("a", 6), ("c", 4)]
+
+    # b might have a higher score now, so the board has to be reloaded
+    board.update("#chan", "c", 1)
+    assert board.get("#chan") is None
+
+
+def test_lowest():
+    board = Leaderboard(2, lowest=True)
+    board.load("#chan", [("a", -5), ("b", -3)])
+    board.update("#chan", "c", -4)
+    assert board.get("#chan") == [("a", -5), ("c", -4)]
+    board.update("#chan", "a", 0)
+    assert board.get("#chan") is None
+
+
+def test_discard():
+    board = Leaderboard(2)
+    board.load("#a", [])
+    board.load("#b", [])
+    board.discard("#a")
+    assert board.get("#a") is None
+    assert board.get("#b") == []
+    board.discard()
+    assert board.get("#b") is None
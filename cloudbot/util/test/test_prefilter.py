@@ -0,0 +1,78 @@
+import re
+
+from cloudbot.util.prefilter import RegexPrefilter, required_literals
+
+test_regexes = [
+    re.compile(r'(?:youtube.*?(?:v=|/v/)|youtu\.be/|yooouuutuuube.*?id=)([-_a-zA-Z0-9]+)', re.I),
+    re.compile(r'(.*:)//(twitch.tv|www.twitch.tv)(:[0-9]+)?(.*)', re.I),
+    re.compile(r'.*(((www\.)?reddit\.com/r|redd\.it)[^ ]+)', re.I),
+    re.compile(r'^.*\+\+$'),
+    re.compile(r'\\o/', re.IGNORECASE),
+    re.compile(r"^[sS]/(.*/.*(?:/[igx]{,4})?)\S*$"),
+    re.compile(r'^\? ?(.+)', re.I),
+    re.compile(r'[a-z]+'),
+    re.compile(r'dıff', re.I),
+    # ascii letters which IGNORECASE matches to non-ascii characters: 'İ', 'ſ' and the kelvin sign
+    re.compile(r'diff', re.I),
+    re.compile(r'stuff', re.I),
+    re.compile(r'kelvin', re.I),
+]
+
+test_lines = [
+    "hello there",
+    "check out https://www.YOUTUBE.com/watch?v=dQw4w9WgXcQ",
+    "http://youtu.be/dQw4w9WgXcQ",
+    "HTTP://TWITCH.TV/someone",
+    "cloudbot++",
+    "\\O/",
+    "s/foo/bar/g",
+    "? factoid",
+    "reddit.com/r/python and redd.it/abc",
+    "NOTHING TO SEE HERE",
+    "DIFF",
+    "dİff",
+    "DİFF",
+    "ſtuff",
+    "\u212aelvin",
+    "",
+]
+
+
+def test_required_literals():
+    assert required_literals(re.compile(r'.*(((www\.)?google\.com/url\?)[^ ]+)')) == {"google.com/url?"}
+    assert required_literals(re.compile(r'(imdb.com|www.imdb.com)')) == {"imdb"}
+    assert required_literals(re.compile(r'Hello', re.I)) == {"hello"}
+    # nothing is required here
+    assert required_literals(re.compile(r'[a-z]+')) is None
+    assert required_literals(re.compile(r'a|[b-c]')) is None
+    assert required_literals(re.compile(r'(abc)?')) is None
+
+
+def test_candidates_match_naive():
+    pairs = [(regex, index) for index, regex in enumerate(test_regexes)]
+    prefilter = RegexPrefilter(pairs)
+    assert len(prefilter) == len(pairs)
+
+    for line in test_lines:
+        naive = [hook for regex, hook in pairs if regex.search(line)]
+        filtered = [hook for regex, hook in prefilter.candidates(line) if regex.search(line)]
+        assert naive == filtered, line
+
+
+def test_candidates_skip():
+    pairs = [(regex, index) for index, regex in enumerate(test_regexes)]
+    prefilter = RegexPrefilter(pairs)
+
+    # only the regex without any required literal is left to check
+    assert [hook for regex, hook in prefilter.candidates("NOTHING")] == [7]
+    # order is preserved
+    assert [hook for regex, hook in prefilter.candidates("youtu.be/a++")] == [0, 3, 5, 7]
+
+
+def test_rebuild():
+    prefilter = RegexPrefilter()
+    assert list(prefilter.candidates("anything")) == []
+
+    prefilter.rebuild([(test_regexes[4], "cheer")])
+    assert list(prefilter.candidates("\\o/")) == [(test_regexes[4], "cheer")]
+    assert list(prefilter.candidates("o/")) == []
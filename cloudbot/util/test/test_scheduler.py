@@ -0,0 +1,216 @@
+import asyncio
+
+from cloudbot.util.scheduler import Scheduler
+
+
+class FakeTimer:
+    def __init__(self, loop, when, callback):
+        self.loop = loop
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    """
+    Just enough of an event loop for the scheduler, with a clock which only moves when advance() is called
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        timer = FakeTimer(self, when, callback)
+        self.timers.append(timer)
+        return timer
+
+    def advance(self, seconds):
+        target = self.now + seconds
+        while True:
+            timers = [timer for timer in self.timers if not timer.cancelled and timer.when <= target]
+            if not timers:
+                break
+            timer = min(timers, key=lambda t: t.when)
+            self.timers.remove(timer)
+            self.now = max(self.now, timer.when)
+            timer.callback()
+        self.now = target
+
+    @property
+    def armed(self):
+        return [timer for timer in self.timers if not timer.cancelled]
+
+
+def test_call_at_order():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    fired = []
+    scheduler.call_at(5, fired.append, "b")
+    scheduler.call_at(2, fired.append, "a")
+    scheduler.call_later(5, fired.append, "c")
+
+    # one timer, for the earliest call
+    assert len(loop.armed) == 1
+    assert loop.armed[0].when == 2
+
+    loop.advance(3)
+    assert fired == ["a"]
+    loop.advance(3)
+    # calls due at the same time run in the order they were scheduled
+    assert fired == ["a", "b", "c"]
+    assert len(scheduler) == 0
+    assert not loop.armed
+
+
+def test_cancel():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    fired = []
+    first = scheduler.call_at(1, fired.append, 1)
+    scheduler.call_at(2, fired.append, 2)
+    first.cancel()
+    assert len(scheduler) == 1
+    loop.advance(5)
+    assert fired == [2]
+
+
+def test_cancel_many():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    fired = []
+    calls = [scheduler.call_at(i, fired.append, i) for i in range(1000)]
+    for call in calls[:900]:
+        call.cancel()
+    assert len(scheduler) == 100
+    # cancelled calls are dropped from the heap rather than left to pile up
+    assert len(scheduler._heap) < 1000
+    loop.advance(1000)
+    assert fired == list(range(900, 1000))
+
+
+def test_fixed_rate():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    fired = []
+
+    def slow():
+        fired.append(loop.now)
+        # taking time to run doesn't push back the next run
+        loop.now += 3
+
+    call = scheduler.every(10, slow, initial_delay=5)
+    loop.advance(36)
+    assert fired == [5, 15, 25, 35]
+    assert call.runs == 4
+    assert call.due == 45
+
+    call.cancel()
+    loop.advance(100)
+    assert len(fired) == 4
+
+
+def test_missed_intervals():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    fired = []
+    call = scheduler.every(10, lambda: fired.append(loop.now))
+    loop.advance(10)
+    # the loop was blocked for a while
+    loop.now = 45
+    loop.advance(0)
+    assert fired == [10, 45]
+    assert call.skipped == 2
+    # back on the original schedule
+    assert call.due == 50
+
+
+def test_jitter():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    call = scheduler.every(10, lambda: None, jitter=2)
+    for expected_due in (10, 20, 30):
+        assert call.due == expected_due
+        assert expected_due <= call.when <= expected_due + 2
+        loop.advance(call.when - loop.now)
+    assert call.runs == 3 and call.skipped == 0
+
+
+def test_skip_overlapping():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    futures = []
+    # runs the callbacks of the futures the hook returns
+    future_loop = asyncio.new_event_loop()
+
+    def start():
+        future = asyncio.Future(loop=future_loop)
+        futures.append(future)
+        return future
+
+    call = scheduler.every(10, start)
+    loop.advance(10)
+    assert call.running
+    loop.advance(10)
+    # the first run hasn't finished, so the second is skipped
+    assert len(futures) == 1
+    assert call.skipped == 1
+
+    futures[0].set_result(None)
+    future_loop.run_until_complete(futures[0])
+    future_loop.close()
+    assert not call.running
+    assert call.last_duration == 10
+    loop.advance(10)
+    assert len(futures) == 2
+
+
+def test_errors_dont_stop_repeating():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    runs = []
+
+    def broken():
+        runs.append(loop.now)
+        raise ValueError()
+
+    scheduler.every(1, broken)
+    loop.advance(3)
+    assert runs == [1, 2, 3]
+
+
+def test_close():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    fired = []
+    calls = [scheduler.call_at(1, fired.append, 1), scheduler.every(1, fired.append, 2)]
+    scheduler.close()
+    loop.advance(5)
+    assert not fired
+    assert all(call.cancelled for call in calls)
+    assert len(scheduler) == 0
+
+
+def test_many_pending():
+    loop = FakeLoop()
+    scheduler = Scheduler(loop)
+    fired = []
+    calls = [scheduler.call_at(3600 + i * 0.5, fired.append, i) for i in range(100000)]
+
+    # a single timer, however many calls are waiting
+    assert len(loop.armed) == 1
+    loop.advance(3599)
+    assert not fired
+
+    for call in calls[::2]:
+        call.cancel()
+    assert len(scheduler) == 50000
+    loop.advance(11)
+    # calls are run on time, to the second
+    assert fired == [1, 3, 5, 7, 9, 11, 13, 15, 17, 19]
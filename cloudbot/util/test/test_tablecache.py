@@ -0,0 +1,94 @@
+import time
+
+from cloudbot.util.tablecache import TableCache
+
+
+def grab_row(i, chan="#chan"):
+    return {"chan": chan, "name": "nick{}".format(i % 500), "quote": "quote {}".format(i)}
+
+
+def test_load():
+    cache = TableCache(("chan", "name"), "quote", multi=True)
+    cache.load([grab_row(0), grab_row(500), grab_row(1), grab_row(2, "#other")])
+    assert cache["#chan"] == {"nick0": ["quote 0", "quote 500"], "nick1": ["quote 1"]}
+    assert cache["#other"] == {"nick2": ["quote 2"]}
+    assert "#nowhere" not in cache
+    assert cache.get("#nowhere") is None
+
+
+def test_insert_delete():
+    cache = TableCache(("chan", "word"), "data", default={"commands": "help"})
+    cache.load([])
+    # channels without rows get the default
+    assert cache["#chan"] == {"commands": "help"}
+
+    cache.insert({"chan": "#chan", "word": "a", "data": "1"})
+    cache.insert({"chan": "#chan", "word": "a", "data": "2"})
+    assert cache["#chan"] == {"a": "2"}
+    version = cache.version
+
+    cache.delete({"chan": "#chan", "word": "b"})
+    assert cache.version == version
+    cache.delete({"chan": "#chan", "word": "a"})
+    assert cache.version == version + 1
+    # the channel is left empty, so it's removed
+    assert "#chan" not in cache
+    assert cache["#chan"] == {"commands": "help"}
+
+
+def test_multi_delete():
+    cache = TableCache(("connection", "target"), "message", multi=True)
+    cache.load([{"connection": "net", "target": "nick", "message": message} for message in ("a", "b", "a")])
+    cache.delete({"connection": "net", "target": "nick", "message": "a"})
+    assert cache["net"] == {"nick": ["b"]}
+    # without a value, every row for the key
+    cache.insert({"connection": "net", "target": "nick", "message": "c"})
+    cache.delete({"connection": "net", "target": "nick"})
+    assert "net" not in cache
+
+
+def test_copy_on_write():
+    cache = TableCache(("channel", "connection"), "mask", multi=True)
+    cache.load([{"channel": "*", "connection": "net", "mask": "a!*@*"}])
+    connections = cache["*"]
+    masks = connections["net"]
+
+    # what was read before a change is left as it was, so it can still be iterated
+    for _ in connections.values():
+        cache.insert({"channel": "*", "connection": "other", "mask": "b!*@*"})
+        cache.insert({"channel": "*", "connection": "net", "mask": "c!*@*"})
+    for _ in masks:
+        cache.delete({"channel": "*", "connection": "net", "mask": "a!*@*"})
+    assert connections == {"net": ["a!*@*"]}
+    assert masks == ["a!*@*"]
+    assert cache["*"] == {"net": ["c!*@*"], "other": ["b!*@*"]}
+
+
+def test_reconcile():
+    cache = TableCache(("chan", "name"), "quote", multi=True)
+    rows = [grab_row(i) for i in range(10)]
+    cache.load(rows)
+    assert not cache.reconcile(rows)
+    rows.append(grab_row(10))
+    assert cache.reconcile(rows)
+    assert cache["#chan"]["nick10"] == ["quote 10"]
+
+
+def time_inserts(cache, count):
+    start = time.perf_counter()
+    for i in range(count):
+        cache.insert({"chan": "#chan", "name": "new{}".format(i % 50), "quote": "new quote {}".format(i)})
+    return time.perf_counter() - start
+
+
+def test_insert_constant_time():
+    small = TableCache(("chan", "name"), "quote", multi=True)
+    small.load([grab_row(i) for i in range(50)])
+    large = TableCache(("chan", "name"), "quote", multi=True)
+    large.load([grab_row(i) for i in range(50000)])
+    assert len(large["#chan"]) == 500
+
+    # adding a grab to a 50k row table costs about the same as adding one to a tiny table
+    small_time = min(time_inserts(small, 1000) for _ in range(3))
+    large_time = min(time_inserts(large, 1000) for _ in range(3))
+    assert large_time < small_time * 5
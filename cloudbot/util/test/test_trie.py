@@ -0,0 +1,60 @@
+import pytest
+
+from cloudbot.util.trie import PrefixTrie
+
+
+def test_trie_basic():
+    trie = PrefixTrie()
+    trie["weather"] = 1
+    trie["wiki"] = 2
+    trie["w"] = 3
+
+    assert len(trie) == 3
+    assert "wiki" in trie
+    assert "wik" not in trie
+    assert trie["weather"] == 1
+    assert trie.get("wik") is None
+    assert trie.get("wik", 5) == 5
+
+    with pytest.raises(KeyError):
+        trie["nope"]
+
+
+def test_trie_replace():
+    trie = PrefixTrie()
+    trie["wiki"] = 1
+    trie["wiki"] = 2
+    assert len(trie) == 1
+    assert trie["wiki"] == 2
+
+
+def test_trie_prefix():
+    trie = PrefixTrie()
+    for key in ("weather", "wiki", "wikipedia", "time"):
+        trie[key] = key.upper()
+
+    assert trie.count_prefix("w") == 3
+    assert trie.count_prefix("wiki") == 2
+    assert trie.count_prefix("x") == 0
+    assert trie.find_prefix("wi") == [("wiki", "WIKI"), ("wikipedia", "WIKIPEDIA")]
+    assert trie.find_prefix("t") == [("time", "TIME")]
+    assert trie.find_prefix("q") == []
+    assert [key for key, value in trie.find_prefix("")] == ["time", "weather", "wiki", "wikipedia"]
+
+
+def test_trie_delete():
+    trie = PrefixTrie()
+    trie["wiki"] = 1
+    trie["wikipedia"] = 2
+
+    del trie["wikipedia"]
+    assert len(trie) == 1
+    assert trie.count_prefix("wikip") == 0
+    assert trie.find_prefix("w") == [("wiki", 1)]
+
+    del trie["wiki"]
+    assert len(trie) == 0
+    assert trie.find_prefix("") == []
+
+    with pytest.raises(KeyError):
+        del trie["wiki"]
@@ -0,0 +1,131 @@
+"""
+trie.py
+
+A simple prefix trie, used to resolve partial command names without scanning every registered command.
+
+License:
+    GPL v3
+"""
+
+
+class _Node:
+    __slots__ = ("children", "value", "has_value", "size")
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+        self.has_value = False
+        # number of keys stored in this node and all of its descendants
+        self.size = 0
+
+
+class PrefixTrie:
+    """A mapping of string keys to values which supports fast lookups by key prefix.
+    >> trie = PrefixTrie()
+    >> trie["weather"] = 1
+    >> trie["wiki"] = 2
+    >> trie.find_prefix("w")
+    [('weather', 1), ('wiki', 2)]
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def __len__(self):
+        return self._root.size
+
+    def __contains__(self, key):
+        node = self._find_node(key)
+        return node is not None and node.has_value
+
+    def __getitem__(self, key):
+        node = self._find_node(key)
+        if node is None or not node.has_value:
+            raise KeyError(key)
+        return node.value
+
+    def __setitem__(self, key, value):
+        node = self._find_node(key)
+        if node is not None and node.has_value:
+            # replacing an existing value doesn't change any sizes
+            node.value = value
+            return
+
+        node = self._root
+        node.size += 1
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            child.size += 1
+            node = child
+
+        node.value = value
+        node.has_value = True
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        node = self._root
+        node.size -= 1
+        for char in key:
+            child = node.children[char]
+            child.size -= 1
+            if not child.size:
+                # nothing is stored below this point anymore, so drop the whole branch
+                del node.children[char]
+                return
+            node = child
+
+        node.value = None
+        node.has_value = False
+
+    def get(self, key, default=None):
+        """
+        :type key: str
+        """
+        node = self._find_node(key)
+        if node is None or not node.has_value:
+            return default
+        return node.value
+
+    def count_prefix(self, prefix):
+        """
+        Returns the number of keys starting with the given prefix, in O(len(prefix))
+        :type prefix: str
+        :rtype: int
+        """
+        node = self._find_node(prefix)
+        if node is None:
+            return 0
+        return node.size
+
+    def find_prefix(self, prefix):
+        """
+        Returns a list of (key, value) pairs for every key starting with the given prefix, sorted by key
+        :type prefix: str
+        :rtype: list[(str, object)]
+        """
+        node = self._find_node(prefix)
+        if node is None:
+            return []
+
+        found = []
+        stack = [(prefix, node)]
+        while stack:
+            key, node = stack.pop()
+            if node.has_value:
+                found.append((key, node.value))
+            # push in reverse so that keys are popped in sorted order
+            for char in sorted(node.children, reverse=True):
+                stack.append((key + char, node.children[char]))
+        return found
+
+    def _find_node(self, key):
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
@@ -20,7 +20,7 @@ def get_channels(db, conn):
 
 
 @asyncio.coroutine
-@hook.irc_raw('004')
+@hook.irc_raw('004', timeout=0)
 def do_joins(db, conn, async):
     chans = yield from async(get_channels, db, conn)
     for chan in chans:
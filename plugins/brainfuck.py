@@ -2,7 +2,6 @@
 http://brainfuck.sourceforge.net/brain.py"""
 
 import re
-import asyncio
 import random
 
 from cloudbot import hook
@@ -11,8 +10,7 @@ BUFFER_SIZE = 5000
 MAX_STEPS = 1000000
 
 
-@asyncio.coroutine
-@hook.command("brainfuck", "bf")
+@hook.command("brainfuck", "bf", executor="process")
 def bf(text):
     """<prog> - executes <prog> as Brainfuck code
     :type text: str
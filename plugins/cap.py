@@ -14,6 +14,12 @@ def send_cap_ls(conn):
     conn.cmd("CAP", "LS", "302")
 
 
+@hook.on_cap_available("message-tags", "server-time", "account-tag")
+def message_tags_available():
+    """Tags from these capabilities are parsed into event.irc_tags"""
+    pass
+
+
 @asyncio.coroutine
 def handle_available_caps(conn, caplist, event, irc_paramlist, bot):
     available_caps = conn.memory.setdefault("available_caps", set())
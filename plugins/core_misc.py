@@ -33,7 +33,7 @@ def check_mode(irc_paramlist, conn, message):
 
 # Identify to NickServ (or other service)
 @asyncio.coroutine
-@hook.irc_raw('004')
+@hook.irc_raw('004', timeout=0)
 def onjoin(conn, bot):
     """
     :type conn: cloudbot.clients.clients.IrcClient
@@ -86,7 +86,7 @@ def onjoin(conn, bot):
 
 
 @asyncio.coroutine
-@hook.irc_raw('004')
+@hook.irc_raw('004', timeout=0)
 def keep_alive(conn):
     """
     :type conn: cloudbot.clients.clients.IrcClient
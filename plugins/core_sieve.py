@@ -6,30 +6,15 @@ from time import time
 from cloudbot import hook
 from cloudbot.util.tokenbucket import TokenBucket
 
-ready = False
 buckets = {}
 logger = logging.getLogger("cloudbot")
 
 
-def task_clear(loop):
-    global buckets
-    for uid, _bucket in buckets.copy().items():
+@hook.periodic(600, initial_interval=600)
+def task_clear():
+    for uid, _bucket in list(buckets.items()):
         if (time() - _bucket.timestamp) > 600:
-            del buckets[uid]
-    loop.call_later(600, task_clear, loop)
-
-
-@asyncio.coroutine
-@hook.irc_raw('004')
-def init_tasks(loop, conn):
-    global ready
-    if ready:
-        # tasks already started
-        return
-
-    logger.info("[{}|sieve] Bot is starting ratelimiter cleanup task.".format(conn.name))
-    loop.call_later(600, task_clear, loop)
-    ready = True
+            buckets.pop(uid, None)
 
 
 @asyncio.coroutine
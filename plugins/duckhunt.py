@@ -1,13 +1,16 @@
 import random
 import operator
+import threading
 
 from time import time
 from collections import defaultdict
+import sqlalchemy
 from sqlalchemy import Table, Column, String, Integer, PrimaryKeyConstraint, desc
 from sqlalchemy.sql import select
 from cloudbot import hook
 from cloudbot.event import EventType
 from cloudbot.util import database
+from cloudbot.util.leaderboard import Leaderboard
 
 duck_tail = "・゜゜・。。・゜゜"
 duck = ["\_o< ", "\_O< ", "\_0< ", "\_\u00f6< ", "\_\u00f8< ", "\_\u00f3< "]
@@ -24,6 +27,26 @@ table = Table(
     PrimaryKeyConstraint('name', 'chan','network')
     )
 
+# the channel leaderboards are read straight from these, in order
+chan_index = database.TableIndex("duck_hunt_network_chan", "duck_hunt", "network", "chan", "shot")
+friend_index = database.TableIndex("duck_hunt_network_chan_befriend", "duck_hunt", "network", "chan", "befriend")
+name_index = database.TableIndex("duck_hunt_network_name", "duck_hunt", "network", "name")
+chan_scores_query = database.HotQuery(
+    "duck hunt channel scores", "select name, shot from duck_hunt where network = :network and chan = :chan and "
+                                "shot > 0 order by shot desc limit 30", {'network': "network", 'chan': "#channel"})
+network_scores_query = database.HotQuery(
+    "duck hunt network scores", "select name, sum(shot) as score from duck_hunt where network = :network and "
+                                "shot > 0 group by name order by score desc limit 30", {'network': "network"})
+
+# more than fit on one line, the rest are cut off by smart_truncate()
+LEADERBOARD_SIZE = 30
+
+# the top scores in each (network, channel)
+killer_boards = Leaderboard(LEADERBOARD_SIZE)
+friend_boards = Leaderboard(LEADERBOARD_SIZE)
+# so a board read before a score is written can't be loaded after that score has been skipped for not finding the board
+board_lock = threading.Lock()
+
 optout = Table(
     'nohunt',
     database.metadata,
@@ -188,6 +211,15 @@ def hit_or_miss(deploy, shoot):
     else:
         return 1
 
+def update_boards(nick, chan, conn, shoot, friend):
+    """Records changed scores in the cached channel leaderboards."""
+    key = (conn.name, chan.lower())
+    with board_lock:
+        if shoot:
+            killer_boards.update(key, nick.lower(), shoot)
+        if friend:
+            friend_boards.update(key, nick.lower(), friend)
+
 def dbadd_entry(nick, chan, db, conn, shoot, friend):
     """Takes care of adding a new row to the database."""
     query = table.insert().values(
@@ -198,6 +230,7 @@ def dbadd_entry(nick, chan, db, conn, shoot, friend):
         befriend = friend)
     db.execute(query)
     db.commit()
+    update_boards(nick, chan, conn, shoot, friend)
 
 def dbupdate(nick, chan, db, conn, shoot, friend):
     """update a db row"""
@@ -226,6 +259,7 @@ def dbupdate(nick, chan, db, conn, shoot, friend):
             .values(shot = shoot)
         db.execute(query)
         db.commit()
+    update_boards(nick, chan, conn, shoot, friend)
 
 @hook.command("bang", autohelp=False)
 def bang(nick, chan, message, db, conn, notice):
@@ -345,91 +379,65 @@ def smart_truncate(content, length=320, suffix='...'):
         return content[:length].rsplit(' • ', 1)[0]+suffix
 
 
+def top_scores(column, boards, text, chan, conn, db):
+    """Gets the top (name, score) pairs for the channel, or the network if text is 'global' or 'average'."""
+    if text.lower() == 'global' or text.lower() == 'average':
+        if text.lower() == 'average':
+            # the average over the channels the name has a score in
+            score = sqlalchemy.func.sum(column) / sqlalchemy.func.count(column)
+        else:
+            score = sqlalchemy.func.sum(column)
+        score = score.label('score')
+        return db.execute(select([table.c.name, score]) \
+            .where(table.c.network == conn.name) \
+            .where(column > 0) \
+            .group_by(table.c.name) \
+            .order_by(desc(score)) \
+            .limit(LEADERBOARD_SIZE)).fetchall()
+
+    key = (conn.name, chan.lower())
+    scores = boards.get(key)
+    if scores is None:
+        with board_lock:
+            scores = boards.load(key, db.execute(select([table.c.name, column]) \
+                .where(table.c.network == conn.name) \
+                .where(table.c.chan == chan.lower()) \
+                .where(column > 0) \
+                .order_by(desc(column)) \
+                .limit(LEADERBOARD_SIZE)).fetchall())
+    return scores
+
+def format_scores(out, scores):
+    out += ' • '.join(["{}: {}".format('\x02' + k[:1] + u'\u200b' + k[1:] + '\x02', str(v))  for k, v in scores])
+    return smart_truncate(out)
+
 @hook.command("friends", autohelp=False)
 def friends(text, chan, conn, db):
     """Prints a list of the top duck friends in the channel, if 'global' is specified all channels in the database are included."""
     if chan in opt_out:
         return
-    friends = defaultdict(int)
-    chancount = defaultdict(int)
-    out = ""
+    scores = top_scores(table.c.befriend, friend_boards, text, chan, conn, db)
+    if not scores:
+        return "it appears no on has friended any ducks yet."
     if text.lower() == 'global' or text.lower() == 'average':
         out = "Duck friend scores across the network: "
-        scores = db.execute(select([table.c.name, table.c.befriend]) \
-            .where(table.c.network == conn.name) \
-            .order_by(desc(table.c.befriend)))
-        if scores:
-            for row in scores:
-                if row[1] == 0:
-                    continue
-                chancount[row[0]] += 1
-                friends[row[0]] += row[1]
-            if text.lower() == 'average':
-                for k, v in friends.items():
-                    friends[k] = int(v / chancount[k])
-        else:
-            return "it appears no on has friended any ducks yet."
     else:
         out = "Duck friend scores in {}: ".format(chan)
-        scores = db.execute(select([table.c.name, table.c.befriend]) \
-            .where(table.c.network == conn.name) \
-            .where(table.c.chan == chan.lower()) \
-            .order_by(desc(table.c.befriend)))
-        if scores:
-            for row in scores:
-                if row[1] == 0:
-                    continue
-                friends[row[0]] += row[1]
-        else:
-            return "it appears no on has friended any ducks yet."
-
-    topfriends = sorted(friends.items(), key=operator.itemgetter(1), reverse = True)
-    out += ' • '.join(["{}: {}".format('\x02' + k[:1] + u'\u200b' + k[1:] + '\x02', str(v))  for k, v in topfriends])
-    out = smart_truncate(out)
-    return out
+    return format_scores(out, scores)
 
 @hook.command("killers", autohelp=False)
 def killers(text, chan, conn, db):
     """Prints a list of the top duck killers in the channel, if 'global' is specified all channels in the database are included."""
     if chan in opt_out:
         return
-    killers = defaultdict(int)
-    chancount = defaultdict(int)
-    out = ""
+    scores = top_scores(table.c.shot, killer_boards, text, chan, conn, db)
+    if not scores:
+        return "it appears no on has killed any ducks yet."
     if text.lower() == 'global' or text.lower() == 'average':
         out = "Duck killer scores across the network: "
-        scores = db.execute(select([table.c.name, table.c.shot]) \
-            .where(table.c.network == conn.name) \
-            .order_by(desc(table.c.shot)))
-        if scores:
-            for row in scores:
-                if row[1] == 0:
-                    continue
-                chancount[row[0]] += 1
-                killers[row[0]] += row[1]
-            if text.lower() == 'average':
-                for k, v in killers.items():
-                    killers[k] = int(v / chancount[k])
-        else:
-            return "it appears no on has killed any ducks yet."
     else:
         out = "Duck killer scores in {}: ".format(chan)
-        scores = db.execute(select([table.c.name, table.c.shot]) \
-            .where(table.c.network == conn.name) \
-            .where(table.c.chan == chan.lower()) \
-            .order_by(desc(table.c.shot)))
-        if scores:
-            for row in scores:
-                if row[1] == 0:
-                    continue
-                killers[row[0]] += row[1]
-        else:
-            return "it appears no on has killed any ducks yet."
-
-    topkillers = sorted(killers.items(), key=operator.itemgetter(1), reverse = True)
-    out += ' • '.join(["{}: {}".format('\x02' + k[:1] + u'\u200b' + k[1:] + '\x02', str(v))  for k, v in topkillers])
-    out = smart_truncate(out)
-    return out
+    return format_scores(out, scores)
 
 @hook.command("duckforgive", permissions=["op", "ignore"])
 def duckforgive(text):
@@ -524,6 +532,10 @@ def duck_merge(text, conn, db, message):
             .where(table.c.name == oldnick)
         db.execute(query)
         db.commit()
+        # the old nick's scores are gone from every channel
+        with board_lock:
+            killer_boards.discard()
+            friend_boards.discard()
         message("Migrated {} duck kills and {} duck friends from {} to {}".format(duckmerge["TKILLS"], duckmerge["TFRIENDS"], oldnick, newnick))
     else:
         return "There are no duck scores to migrate from {}".format(oldnick)
@@ -2,10 +2,10 @@ import string
 import re
 
 from sqlalchemy import Table, Column, String, PrimaryKeyConstraint
-from collections import defaultdict
 
 from cloudbot import hook
 from cloudbot.util import database, colors, web
+from cloudbot.util.tablecache import TableCache
 
 
 # below is the default factoid in every channel you can modify it however you like
@@ -26,24 +26,24 @@ table = Table(
 )
 
 
-@hook.on_start()
+# factoid_cache[chan][word] is the data of a factoid, channels without any factoids get the default ones
+factoid_cache = TableCache(("chan", "word"), "data", default=default_dict)
+
+
+@hook.on_start(preserve_state=["factoid_cache"])
 def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global factoid_cache
-    factoid_cache = defaultdict(lambda: default_dict)
-    for row in db.execute(table.select()):
-        # assign variables
-        chan = row["chan"]
-        word = row["word"]
-        data = row["data"]
-        if chan not in factoid_cache:
-            factoid_cache.update({chan:{word:data}})
-        elif word not in factoid_cache[chan]:
-            factoid_cache[chan].update({word:data})
-        else:
-            factoid_cache[chan][word] = data
+    factoid_cache.load(db.execute(table.select()))
+
+
+@hook.periodic(3600, initial_interval=3600)
+def reconcile_cache(db):
+    """
+    :type db: sqlalchemy.orm.Session
+    """
+    factoid_cache.reconcile(db.execute(table.select()))
 
 
 def add_factoid(db, word, chan, data, nick):
@@ -53,15 +53,15 @@ def add_factoid(db, word, chan, data, nick):
     :type data: str
     :type nick: str
     """
-    if word in factoid_cache[chan]:
-        # if we have a set value, update
+    if word in factoid_cache.get(chan, {}):
+        # if we have a set value, update (the default factoids aren't in the table)
         db.execute(table.update().values(data=data, nick=nick, chan=chan).where(table.c.chan == chan).where(table.c.word == word))
         db.commit()
     else:
         # otherwise, insert
         db.execute(table.insert().values(word=word, data=data, nick=nick, chan=chan))
         db.commit()
-    load_cache(db)
+    factoid_cache.insert({"chan": chan, "word": word, "data": data})
 
 
 def del_factoid(db, chan, word):
@@ -71,13 +71,12 @@ def del_factoid(db, chan, word):
     """
     db.execute(table.delete().where(table.c.word == word).where(table.c.chan == chan))
     db.commit()
-    load_cache(db)
+    factoid_cache.delete({"chan": chan, "word": word})
 
 
 @hook.command("r","remember", permissions=["op"])
 def remember(text, nick, db, chan, notice):
     """<word> [+]<data> - remembers <data> with <word> - add + to <data> to append. If the input starts with <act> the message will be sent as an action. If <user> in in the message it will be replaced by input arguments when command is called."""
-    global factoid_cache
     try:
         word, data = text.split(None, 1)
     except ValueError:
@@ -110,7 +109,6 @@ def remember(text, nick, db, chan, notice):
 @hook.command("f","forget", permissions=["op"])
 def forget(text, chan, db, notice):
     """<word> - forgets previously remembered <word>"""
-    global factoid_cache
     data = factoid_cache[chan][text.lower()]
 
     if data:
@@ -4,6 +4,7 @@ from collections import defaultdict
 from sqlalchemy import Table, Column, String
 from cloudbot import hook
 from cloudbot.util import database
+from cloudbot.util.tablecache import TableCache
 
 search_pages = defaultdict(list)
 search_page_indexes = {}
@@ -17,20 +18,29 @@ table = Table(
     Column('chan', String)
 )
 
-grab_cache = {}
+# grab_cache[chan][name] is the list of quotes grabbed from name in chan, oldest first
+grab_cache = TableCache(("chan", "name"), "quote", multi=True)
 
 
-@hook.on_start()
+def grab_rows(db):
+    for row in db.execute(table.select().order_by(table.c.time)):
+        yield {"chan": row["chan"], "name": row["name"].lower(), "quote": row["quote"]}
+
+
+@hook.on_start(preserve_state=["grab_cache"])
 def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    grab_cache.clear()
-    for row in db.execute(table.select().order_by(table.c.time)):
-        name = row["name"].lower()
-        quote = row["quote"]
-        chan = row["chan"]
-        grab_cache.setdefault(chan, {}).setdefault(name, []).append(quote)
+    grab_cache.load(grab_rows(db))
+
+
+@hook.periodic(3600, initial_interval=3600)
+def reconcile_cache(db):
+    """
+    :type db: sqlalchemy.orm.Session
+    """
+    grab_cache.reconcile(grab_rows(db))
 
 
 def two_lines(bigstring, chan):
@@ -87,7 +97,7 @@ def grab_add(nick, time, msg, chan, db, conn):
     # Adds a quote to the grab table
     db.execute(table.insert().values(name=nick, time=time, quote=msg, chan=chan))
     db.commit()
-    load_cache(db)
+    grab_cache.insert({"chan": chan, "name": nick.lower(), "quote": msg})
 
 
 @hook.command()
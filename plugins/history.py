@@ -1,40 +1,113 @@
 from collections import deque
+import threading
 import time
 import asyncio
 import re
 
 from cloudbot import hook
-from cloudbot.util import timeformat
+from cloudbot.util import timeformat, database
+from cloudbot.util.executors import DB_POOL
 from cloudbot.event import EventType
 
-db_ready = []
+db_ready = False
 
+# write seen_user rows every FLUSH_INTERVAL seconds, or sooner once FLUSH_ROWS are waiting
+FLUSH_INTERVAL = 5
+FLUSH_ROWS = 500
 
-def db_init(db, conn_name):
-    """check to see that our db has the the seen table (connection name is for caching the result per connection)
+# the latest seen_user row for each (name, chan) which hasn't been written yet, and the rows being written
+seen_buffer = {}
+seen_flushing = {}
+# chat_tracker runs in a thread, so access to the buffers is locked
+seen_lock = threading.Lock()
+# only one flush writes at a time, so an older row can't overwrite a newer one
+flush_lock = threading.Lock()
+
+SEEN_INSERT = "insert or replace into seen_user(name, time, quote, chan, host) values(:name,:time,:quote,:chan,:host)"
+SEEN_SELECT = "select name, time, quote from seen_user where lower(name) = :name and chan = :chan"
+
+seen_index = database.TableIndex("seen_user_name_chan", "seen_user", "lower(name)", "chan")
+seen_query = database.HotQuery("seen", SEEN_SELECT, {'name': "nick", 'chan': "#channel"})
+
+
+def db_init(db):
+    """check to see that our db has the the seen table
     :type db: sqlalchemy.orm.Session
     """
     global db_ready
-    if db_ready.count(conn_name) < 1:
+    if not db_ready:
         db.execute("create table if not exists seen_user(name, time, quote, chan, host, primary key(name, chan))")
+        seen_index.create(db)
         db.commit()
-        db_ready.append(conn_name)
+        db_ready = True
 
 
-def track_seen(event, db, conn):
-    """ Tracks messages for the .seen command
+def track_seen(event):
+    """ Tracks messages for the .seen command, returning the number of rows waiting to be written
     :type event: cloudbot.event.Event
-    :type db: sqlalchemy.orm.Session
-    :type conn: cloudbot.client.Client
+    :rtype: int
     """
-    db_init(db, conn)
     # keep private messages private
     if event.chan[:1] == "#" and not re.findall('^s/.*/.*/$', event.content.lower()):
-        db.execute(
-            "insert or replace into seen_user(name, time, quote, chan, host) values(:name,:time,:quote,:chan,:host)",
-            {'name': event.nick.lower(), 'time': time.time(), 'quote': event.content, 'chan': event.chan,
-             'host': event.mask})
-        db.commit()
+        row = {'name': event.nick.lower(), 'time': time.time(), 'quote': event.content, 'chan': event.chan,
+               'host': event.mask}
+        with seen_lock:
+            seen_buffer[(row['name'], row['chan'])] = row
+            return len(seen_buffer)
+    return 0
+
+
+def flush_seen(db):
+    """ Writes the buffered seen_user rows in one transaction
+    :type db: sqlalchemy.orm.Session
+    """
+    global seen_buffer, seen_flushing
+    with flush_lock:
+        with seen_lock:
+            if not seen_buffer:
+                return
+            seen_flushing, seen_buffer = seen_buffer, {}
+
+        try:
+            db_init(db)
+            db.execute(SEEN_INSERT, list(seen_flushing.values()))
+            db.commit()
+        except Exception:
+            db.rollback()
+            # keep the rows for the next flush, unless they've been replaced by newer ones
+            with seen_lock:
+                for key, row in seen_flushing.items():
+                    seen_buffer.setdefault(key, row)
+            raise
+        finally:
+            with seen_lock:
+                seen_flushing = {}
+
+
+def flush_pending(db_session):
+    """ Writes the buffered seen_user rows, if there are any, with a session from the database pool's scoped session.
+    Run this in the database pool.
+    :type db_session: sqlalchemy.orm.scoping.scoped_session
+    """
+    with seen_lock:
+        if not seen_buffer:
+            return
+    db = db_session()
+    try:
+        flush_seen(db)
+    finally:
+        db.close()
+
+
+def get_buffered_seen(name, chan):
+    """ Gets the seen_user row for a name which hasn't been written yet, if any
+    :type name: str
+    :type chan: str
+    :rtype: dict | None
+    """
+    key = (name, chan)
+    with seen_lock:
+        return seen_buffer.get(key) or seen_flushing.get(key)
 
 
 def track_history(event, message_time, conn):
@@ -55,19 +128,43 @@ def track_history(event, message_time, conn):
 
 
 @hook.event([EventType.message, EventType.action], singlethread=True)
-def chat_tracker(event, db, conn):
+def chat_tracker(event, conn, bot):
     """
-    :type db: sqlalchemy.orm.Session
     :type event: cloudbot.event.Event
     :type conn: cloudbot.client.Client
+    :type bot: cloudbot.bot.CloudBot
     """
     if event.type is EventType.action:
         event.content = "\x01ACTION {}\x01".format(event.content)
 
     message_time = time.time()
-    track_seen(event, db, conn)
+    buffered = track_seen(event)
     track_history(event, message_time, conn)
 
+    if buffered >= FLUSH_ROWS and not flush_lock.locked():
+        bot.executors.get(DB_POOL).submit(flush_pending, bot.db_session).result()
+
+
+@asyncio.coroutine
+@hook.periodic(FLUSH_INTERVAL)
+def flush_tracker(bot):
+    """
+    :type bot: cloudbot.bot.CloudBot
+    """
+    # most of the time nothing has been said since the last flush, so don't take a database worker for nothing
+    with seen_lock:
+        if not seen_buffer:
+            return
+    yield from bot.loop.run_in_executor(bot.executors.get(DB_POOL), flush_pending, bot.db_session)
+
+
+@hook.on_stop()
+def flush_on_stop(db):
+    """
+    :type db: sqlalchemy.orm.Session
+    """
+    flush_seen(db)
+
 
 @asyncio.coroutine
 @hook.command(autohelp=False)
@@ -101,15 +198,13 @@ def seen(text, nick, chan, db, event, conn):
     if not re.match("^[A-Za-z0-9_|\^\*\`.\-\]\[\{\}\\\\]*$", text.lower()):
         return "I can't look up that name, its impossible to use!"
 
-    db_init(db, conn.name)
-
-    if '_' in text:
-        text = text.replace("_", "/_")
-
-    last_seen = db.execute("select name, time, quote from seen_user where name like :name escape '/' and chan = :chan",
-                            {'name': text, 'chan': chan}).fetchone()
-
-    text = text.replace("/", "")
+    # rows which haven't been written yet are the most recent
+    buffered = get_buffered_seen(text.lower(), chan)
+    if buffered is not None:
+        last_seen = (buffered['name'], buffered['time'], buffered['quote'])
+    else:
+        db_init(db)
+        last_seen = db.execute(SEEN_SELECT, {'name': text.lower(), 'chan': chan}).fetchone()
 
     if last_seen:
         reltime = timeformat.time_since(last_seen[1])
@@ -5,6 +5,7 @@ from sqlalchemy import Table, Column, UniqueConstraint, PrimaryKeyConstraint, St
 
 from cloudbot import hook
 from cloudbot.util import database
+from cloudbot.util.tablecache import TableCache
 
 logchannel = ""
 
@@ -20,63 +21,61 @@ table = Table(
 )
 
 
+# ignore_cache[channel][connection] is the list of masks ignored in a channel, or everywhere for the channel "*"
+ignore_cache = TableCache(("channel", "connection"), "mask", multi=True)
+
+
 @hook.on_start
 def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global ignore_cache
-    ignore_cache = []
-    for row in db.execute(table.select()):
-        conn = row["connection"]
-        chan = row["channel"]
-        mask = row["mask"]
-        ignore_cache.append((conn, chan, mask))
+    ignore_cache.load(db.execute(table.select()))
 
 
-def add_ignore(db, conn, chan, mask):
-    if (conn, chan) in ignore_cache:
-        pass
-    else:
-        db.execute(table.insert().values(connection=conn, channel=chan, mask=mask))
+@hook.periodic(3600, initial_interval=3600)
+def reconcile_cache(db):
+    """
+    :type db: sqlalchemy.orm.Session
+    """
+    ignore_cache.reconcile(db.execute(table.select()))
 
+
+def add_ignore(db, conn, chan, mask):
+    db.execute(table.insert().values(connection=conn, channel=chan, mask=mask))
     db.commit()
-    load_cache(db)
+    ignore_cache.insert({"connection": conn, "channel": chan, "mask": mask})
 
 
 def remove_ignore(db, conn, chan, mask):
     db.execute(table.delete().where(table.c.connection == conn).where(table.c.channel == chan)
                .where(table.c.mask == mask))
     db.commit()
-    load_cache(db)
+    ignore_cache.delete({"connection": conn, "channel": chan, "mask": mask})
 
 def is_ignored(conn, chan, mask):
-    for _conn, _chan, _mask in ignore_cache:
-        if _chan == "*":
-            # this is a global ignore
-            if fnmatch(mask, _mask):
-                return True
-        else:
-            # this is a channel-specific ignore
-            if not (conn, chan) == (_conn, _chan):
-                continue
+    # global ignores apply on every connection
+    for masks in ignore_cache.get("*", {}).values():
+        for _mask in masks:
             if fnmatch(mask, _mask):
                 return True
 
+    # channel-specific ignores
+    for _mask in ignore_cache.get(chan, {}).get(conn, ()):
+        if fnmatch(mask, _mask):
+            return True
+
 
 # noinspection PyUnusedLocal
 @asyncio.coroutine
-@hook.sieve(priority=50)
+# don't block event hooks
+@hook.sieve(priority=50, hook_types=("command", "regex"))
 def ignore_sieve(bot, event, _hook):
     """
     :type bot: cloudbot.bot.CloudBot
     :type event: cloudbot.event.Event
     :type _hook: cloudbot.plugin.Hook
     """
-    # don't block event hooks
-    if _hook.type in ("irc_raw", "event"):
-        return event
-
     # don't block an event that could be unignoring
     if _hook.type == "command" and event.triggered_command in ("unignore", "global_unignore"):
         return event
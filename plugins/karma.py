@@ -1,13 +1,28 @@
 import re
-import operator
+import threading
 
-from collections import defaultdict
 from cloudbot import hook
+from cloudbot.util import database
+from cloudbot.util.leaderboard import Leaderboard
 
 karmaplus_re = re.compile('^.*\+\+$')
 karmaminus_re = re.compile('^.*\-\-$')
 db_ready = []
 
+thing_index = database.TableIndex("karma_thing_chan", "karma", "thing", "chan")
+# the channel leaderboards are summed from this without reading the table
+chan_index = database.TableIndex("karma_chan_thing", "karma", "chan", "thing", "score")
+points_query = database.HotQuery("karma points", "select score from karma where thing = :thing", {'thing': "thing"})
+top_query = database.HotQuery("karma top", "select thing, sum(score) as total from karma where chan = :chan "
+                                           "group by thing order by total desc limit 20", {'chan': "#channel"})
+
+# the most and least liked things in each channel, more than are shown so a few changes don't empty the cache
+top_boards = Leaderboard(20)
+bottom_boards = Leaderboard(20, lowest=True)
+# so a total read before another write can't be recorded after that write's total, and a board read before a write
+# can't be loaded after that write has been skipped for not finding the board
+board_lock = threading.Lock()
+
 def db_init(db, conn_name):
     """Check to see if the DB has the herald table. Connection name is for caching the result per connection.
     :type db: sqlalchemy.orm.Session
@@ -15,10 +30,23 @@ def db_init(db, conn_name):
     global db_ready
     if db_ready.count(conn_name) < 1:
         db.execute("create table if not exists karma(name, chan, thing, score INTEGER, primary key(name, chan, thing))")
+        thing_index.create(db)
+        chan_index.create(db)
         db.commit()
         db_ready.append(conn_name)
 
 
+def update_boards(db, chan, thing):
+    """Records the new total score of a thing in the cached leaderboards for the channel."""
+    with board_lock:
+        if chan not in top_boards and chan not in bottom_boards:
+            return
+        total = db.execute("select sum(score) from karma where chan = :chan and thing = :thing",
+                           {'chan': chan, 'thing': thing}).fetchone()[0]
+        top_boards.update(chan, thing, total)
+        bottom_boards.update(chan, thing, total)
+
+
 @hook.command("pp", "addpoint")
 def addpoint(text, nick, chan, db, conn):
     """.addpoint or (.pp) <thing> adds a point to the <thing>"""
@@ -30,10 +58,12 @@ def addpoint(text, nick, chan, db, conn):
         score = score + 1
         db.execute("insert or replace into karma(name, chan, thing, score) values (:name, :chan, :thing, :score)", {'name': nick, 'chan': chan, 'thing': text.lower(), 'score': score})
         db.commit()
+        update_boards(db, chan, text.lower())
         # return "{} is now worth {} in {}'s eyes.".format(text, score, nick)
     else:
         db.execute("insert or replace into karma(name, chan, thing, score) values (:name, :chan, :thing, :score)", {'name': nick, 'chan': chan, 'thing': text.lower(), 'score': 1})
         db.commit()
+        update_boards(db, chan, text.lower())
         #return "{} is now worth 1 in {}'s eyes.".format(text, nick)
 
 @hook.regex(karmaplus_re)
@@ -57,10 +87,12 @@ def rmpoint(text, nick, chan, db, conn):
         score = score - 1
         db.execute("insert or replace into karma(name, chan, thing, score) values (:name, :chan, :thing, :score)", {'name': nick, 'chan': chan, 'thing': text.lower(), 'score': score})
         db.commit()
+        update_boards(db, chan, text.lower())
         #return "{} is now worth {} in {}'s eyes.".format(text, score, nick)
     else:
         db.execute("insert or replace into karma(name, chan, thing, score) values (:name, :chan, :thing, :score)", {'name': nick, 'chan': chan, 'thing': text.lower(), 'score': -1})
         db.commit()
+        update_boards(db, chan, text.lower())
         #return "{} is now worth -1 in {}'s eyes.".format(text, nick)
 
 
@@ -123,33 +155,34 @@ def points(text, chan, db, conn):
     else:
         return "I couldn't find {} in the database.".format(text)
 
+def leaderboard(text, chan, db, boards, order):
+    """Gets the ten things with the highest (or lowest) total score in the channel, or in every channel if text is 'global'."""
+    if text == "global" or text == "-global":
+        items = db.execute("select thing, sum(score) as total from karma group by thing "
+                           "order by total {} limit 10".format(order)).fetchall()
+    else:
+        items = boards.get(chan)
+        if items is None:
+            with board_lock:
+                items = boards.load(chan, db.execute("select thing, sum(score) as total from karma where chan = :chan "
+                                                     "group by thing order by total {} limit :limit".format(order),
+                                                     {'chan': chan, 'limit': boards.size}).fetchall())
+    return items[:10]
+
 @hook.command("topten", "pointstop", "loved", autohelp=False)
 def pointstop(text, chan, db, message, conn, notice):
     """.topten or .pointstop prints the top 10 things with the highest points in the channel. To see the top 10 items in all of the channels the bot sits in use .topten global."""
     db_init(db, conn.name)
-    scores = []
-    points = defaultdict(int)
-    items = ""
     out = ""
     if text == "global" or text == "-global":
-        items = db.execute("select thing, score from karma").fetchall()
         out = "The top {} favorite things in all channels are: "
     else:
-        items = db.execute("select thing, score from karma where chan = :chan", {'chan':chan}).fetchall()
         out = "The top {} favorite things in {} are: "
+    items = leaderboard(text, chan, db, top_boards, "desc")
     if items:
-        for item in items:
-            thing = item[0]
-            score = int(item[1])
-            points[thing] += score
-        scores = points.items()
-        sorts = sorted(scores, key=operator.itemgetter(1), reverse = True)
-        ten = str(len(sorts))
-        if int(ten) > 10:
-            ten = "10"
-        out = out.format(ten, chan)
-        for i in range(0,int(ten)):
-            out += "{} with {} points \u2022 ".format(sorts[i][0], sorts[i][1])
+        out = out.format(len(items), chan)
+        for thing, score in items:
+            out += "{} with {} points \u2022 ".format(thing, score)
         out = out[:-2]
         return out
 
@@ -157,28 +190,15 @@ def pointstop(text, chan, db, message, conn, notice):
 def pointsbottom(text, chan, db, message, conn, notice):
     """.bottomten or .pointsbottom prints the top 10 things with the highest points in the channel. To see the top 10 items in all of the channels the bot sits in use .topten global."""
     db_init(db, conn.name)
-    scores = []
-    points = defaultdict(int)
-    items = ""
     out = ""
     if text == "global" or text == "-global":
-        items = db.execute("select thing, score from karma").fetchall()
         out = "The {} most hated things in all channels are: "
     else:
-        items = db.execute("select thing, score from karma where chan = :chan", {'chan':chan}).fetchall()
         out = "The {} most hated things in {} are: "
+    items = leaderboard(text, chan, db, bottom_boards, "asc")
     if items:
-        for item in items:
-            thing = item[0]
-            score = int(item[1])
-            points[thing] += score
-        scores = points.items()
-        sorts = sorted(scores, key=operator.itemgetter(1))
-        ten = str(len(sorts))
-        if int(ten) > 10:
-            ten = "10"
-        out = out.format(ten, chan)
-        for i in range(0,int(ten)):
-            out += "{} with {} points \u2022 ".format(sorts[i][0], sorts[i][1])
+        out = out.format(len(items), chan)
+        for thing, score in items:
+            out += "{} with {} points \u2022 ".format(thing, score)
         out = out[:-2]
         return out
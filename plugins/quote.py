@@ -23,6 +23,11 @@ qtable = Table(
     PrimaryKeyConstraint('chan', 'nick', 'time')
 )
 
+# quotes by channel are found with the primary key
+nick_index = database.TableIndex("quote_nick", "quote", "nick")
+nick_query = database.HotQuery("quotes by nick", "select time, nick, msg from quote where deleted != 1 and nick = :nick",
+                               {'nick': "nick"})
+
 
 def format_quote(q, num, n_quotes):
     """Returns a formatted string of a quote"""
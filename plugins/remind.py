@@ -21,6 +21,7 @@ from sqlalchemy import Table, Column, String, DateTime, PrimaryKeyConstraint
 
 from cloudbot import hook
 from cloudbot.util import database
+from cloudbot.util.executors import DB_POOL
 from cloudbot.util.timeparse import time_parse
 from cloudbot.util.timeformat import format_time, time_since
 from cloudbot.util import colors
@@ -39,16 +40,6 @@ table = Table(
 )
 
 
-@asyncio.coroutine
-def delete_reminder(async, db, network, remind_time, user):
-    query = table.delete() \
-        .where(table.c.network == network.lower()) \
-        .where(table.c.remind_time == remind_time) \
-        .where(table.c.added_user == user.lower())
-    yield from async(db.execute, query)
-    yield from async(db.commit)
-
-
 @asyncio.coroutine
 def delete_all(async, db, network, user):
     query = table.delete() \
@@ -72,70 +63,129 @@ def add_reminder(async, db, network, added_user, added_chan, message, remind_tim
     yield from async(db.commit)
 
 
-@asyncio.coroutine
-@hook.on_start()
-def load_cache(async, db):
-    global reminder_cache
-    reminder_cache = []
+# pending reminders, by (network, user) and then by the time they were added
+reminders = {}
 
-    for network, remind_time, added_time, user, message in (yield from async(_load_cache_db, db)):
-        reminder_cache.append((network, remind_time, added_time, user, message))
 
+def _schedule(bot, network, remind_time, added_time, user, message, delay=None):
+    """
+    Sets a timer to deliver a reminder, using the bot's scheduler
+    """
+    if delay is None:
+        delay = max((remind_time - datetime.now()).total_seconds(), 0)
+    call = bot.plugin_manager.scheduler.call_later(delay, deliver_reminder, bot, network, remind_time, added_time,
+                                                   user, message, name="reminder")
+    reminders.setdefault((network, user), {})[added_time] = call
 
-def _load_cache_db(db):
-    query = db.execute(table.select())
-    return [(row["network"], row["remind_time"], row["added_time"], row["added_user"], row["message"]) for row in query]
+
+def _unschedule(network, user, added_time=None):
+    """
+    Cancels one reminder, or all of a user's reminders if added_time isn't given
+    """
+    if added_time is None:
+        calls = reminders.pop((network, user), {})
+    else:
+        user_reminders = reminders.get((network, user), {})
+        calls = {added_time: user_reminders.pop(added_time)} if added_time in user_reminders else {}
+        if not user_reminders:
+            reminders.pop((network, user), None)
+
+    for call in calls.values():
+        call.cancel()
+
+
+def _find_connection(bot, network):
+    for name, conn in bot.connections.items():
+        if name.lower() == network:
+            return conn
+    return None
+
+
+def _delete_delivered(db_session, network, user, added_time):
+    db = db_session()
+    try:
+        db.execute(table.delete()
+                   .where(table.c.network == network)
+                   .where(table.c.added_user == user)
+                   .where(table.c.added_time == added_time))
+        db.commit()
+    finally:
+        db.close()
 
 
 @asyncio.coroutine
-@hook.periodic(30, initial_interval=30)
-def check_reminders(bot, async, db):
-    current_time = datetime.now()
+def deliver_reminder(bot, network, remind_time, added_time, user, message):
+    """
+    Called by the scheduler, not through the plugin manager, so no sieves or hook timeouts apply to reminders. The
+    messages have already been checked when the reminder was added.
+    """
+    conn = _find_connection(bot, network)
+    if conn is None:
+        # the network was removed from the config, leave the reminder in the database
+        _unschedule(network, user, added_time)
+        return
+
+    if not conn.ready:
+        # try again once the connection is back
+        _schedule(bot, network, remind_time, added_time, user, message, delay=30)
+        return
 
-    for reminder in reminder_cache:
-        network, remind_time, added_time, user, message = reminder
-        if remind_time <= current_time:
-            if network not in bot.connections:
-                # connection is invalid
-                yield from add_reminder(async, db, network, remind_time, user)
-                yield from load_cache(async, db)
-                continue
+    remind_text = colors.parse(time_since(added_time, count=2))
+    alert = colors.parse("{}, you have a reminder from $(b){}$(clear) ago!".format(user, remind_text))
 
-            conn = bot.connections[network]
+    conn.message(user, alert)
+    conn.message(user, '"{}"'.format(message))
 
-            if not conn.ready:
-                return
+    if (datetime.now() - remind_time).total_seconds() > (30*60):
+        late_time = time_since(remind_time, count=2)
+        late = "(I'm sorry for delivering this message $(b){}$(clear) late," \
+               " it seems I was unable to deliver it on time)".format(late_time)
+        conn.message(user, colors.parse(late))
 
-            remind_text = colors.parse(time_since(added_time, count=2))
-            alert = colors.parse("{}, you have a reminder from $(b){}$(clear) ago!".format(user, remind_text))
+    _unschedule(network, user, added_time)
+    yield from bot.loop.run_in_executor(bot.executors.get(DB_POOL), _delete_delivered, bot.db_session, network, user,
+                                        added_time)
 
-            conn.message(user, alert)
-            conn.message(user, '"{}"'.format(message))
 
-            delta = (remind_time-added_time).seconds
-            if delta > (30*60):
-                late_time = time_since(remind_time, count=2)
-                late = "(I'm sorry for delivering this message $(b){}$(clear) late," \
-                       " it seems I was unable to deliver it on time)".format(late_time)
-                conn.message(user, colors.parse(late))
+def _unschedule_all():
+    for network, user in list(reminders):
+        _unschedule(network, user)
 
-            yield from delete_reminder(async, db, network, remind_time, user)
-            yield from load_cache(async, db)
+
+@asyncio.coroutine
+@hook.on_start()
+def load_cache(bot, async, db):
+    _unschedule_all()
+    for network, remind_time, added_time, user, message in (yield from async(_load_cache_db, db)):
+        _schedule(bot, network, remind_time, added_time, user, message)
+
+
+@hook.on_stop()
+@asyncio.coroutine
+def unload_reminders():
+    # a coroutine hook, as the scheduler may only be used from the event loop
+    _unschedule_all()
+
+
+def _load_cache_db(db):
+    query = db.execute(table.select())
+    return [(row["network"], row["remind_time"], row["added_time"], row["added_user"], row["message"]) for row in query]
 
 
 @asyncio.coroutine
 @hook.command('remind', 'reminder', 'in')
-def remind(text, nick, chan, db, conn, notice, async):
+def remind(text, nick, chan, db, conn, notice, async, bot):
     """<1 minute, 30 seconds>: <do task> -- reminds you to <do task> in <1 minute, 30 seconds>"""
 
-    count = len([x for x in reminder_cache if x[0] == conn.name and x[3] == nick.lower()])
+    network = conn.name.lower()
+    count = len(reminders.get((network, nick.lower()), ()))
 
     if text == "clear":
         if count == 0:
             return "You have no reminders to delete."
 
+        _unschedule(network, nick.lower())
         yield from delete_all(async, db, conn.name, nick)
-        yield from load_cache(async, db)
         return "Deleted all ({}) reminders for {}!".format(count, nick)
 
     # split the input on the first ":"
@@ -172,7 +222,7 @@ def remind(text, nick, chan, db, conn, notice, async):
 
     # finally, add the reminder and send a confirmation message
     yield from add_reminder(async, db, conn.name, nick, chan, message, remind_time, current_time)
-    yield from load_cache(async, db)
+    _schedule(bot, network, remind_time, current_time, nick.lower(), message)
 
     remind_text = format_time(seconds, count=2)
     output = "Alright, I'll remind you \"{}\" in $(b){}$(clear)!".format(message, remind_text)
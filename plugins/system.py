@@ -9,6 +9,7 @@ except ImportError:
     psutil = None
 
 from cloudbot import hook
+from cloudbot.util import database
 from cloudbot.util.filesize import size as format_bytes
 import cloudbot
 
@@ -75,3 +76,101 @@ def sauce():
     return "Check out my source code! I am a fork of cloudbot: " \
            "https://github.com/CloudBotIRC/CloudBot/ and my source is here: " \
            "https://github.com/edwardslabs/CloudBot"
+
+
+@hook.command(autohelp=False, permissions=["botcontrol"])
+def executors(bot):
+    """-- Shows the load on each of the bot's hook executor pools."""
+    out = []
+    for name, stats in sorted(bot.executors.stats().items()):
+        out.append("{}: \x02{}\x02/{} active, \x02{}\x02 queued, {} threads".format(
+            name, stats["active"], stats["max_workers"], stats["queued"], stats["threads"]))
+    out.append("timed out hooks: \x02{}\x02, abandoned threads: \x02{}\x02".format(
+        sum(bot.plugin_manager.timeouts.values()), bot.plugin_manager.abandoned_threads))
+    return ", ".join(out)
+
+
+@hook.command(autohelp=False, permissions=["botcontrol"])
+def loadtimes(text, bot):
+    """[plugin] -- Shows how long the slowest plugins, or the given plugin, took to load."""
+    load_times = bot.plugin_manager.load_times
+    if text:
+        file_name = text.strip()
+        if not file_name.endswith(".py"):
+            file_name += ".py"
+        if file_name not in load_times:
+            return "Plugin {} isn't loaded.".format(file_name)
+        file_names = [file_name]
+    else:
+        file_names = sorted(load_times, key=lambda name: sum(load_times[name].values()), reverse=True)[:5]
+
+    out = []
+    for file_name in file_names:
+        times = load_times[file_name]
+        out.append("{}: \x02{:.0f}\x02ms (import {:.0f}ms, tables {:.0f}ms, on_start {:.0f}ms)".format(
+            file_name, sum(times.values()) * 1000, times["import"] * 1000, times["tables"] * 1000,
+            times["on_start"] * 1000))
+        if file_name in bot.plugin_manager.reload_times:
+            out[-1] += ", last reloaded in {:.0f}ms".format(bot.plugin_manager.reload_times[file_name] * 1000)
+    return ", ".join(out)
+
+
+@hook.command(autohelp=False, permissions=["botcontrol"])
+def scheduled(bot, loop):
+    """-- Shows when each periodic hook next runs, and how long it last took."""
+    now = loop.time()
+    out = []
+    for call in bot.plugin_manager.scheduler.calls():
+        if call.interval is None:
+            continue
+        duration = "n/a" if call.last_duration is None else "{:.0f}ms".format(call.last_duration * 1000)
+        out.append("{}: in \x02{:.0f}s\x02 (every {}s, last took {}, {} skipped)".format(
+            call.name, call.when - now, call.interval, duration, call.skipped))
+    one_shot = len(bot.plugin_manager.scheduler) - len(out)
+    out.append("{} one-shot calls pending".format(one_shot))
+    return ", ".join(out)
+
+
+@hook.command(autohelp=False, permissions=["botcontrol"])
+def dbpool(bot):
+    """-- Shows how the bot's database connections are being pooled and reused."""
+    stats = bot.db_metrics.stats()
+    out = "{}: \x02{}\x02 connections opened, \x02{}\x02 checkouts, {} invalidated".format(
+        stats["pool"], stats["connects"], stats["checkouts"], stats["invalidated"])
+    if "checkedout" in stats:
+        out += ", {} in use, {} idle (size {}, overflow {})".format(
+            stats["checkedout"], stats["checkedin"], stats["size"], stats["overflow"])
+    return out
+
+
+@hook.command(autohelp=False, permissions=["botcontrol"])
+def dbstats(text, bot, db, notice):
+    """[plans] -- Shows the size of each plugin table, or with "plans", how the database runs each plugin's hot
+    queries."""
+    plugins = bot.plugin_manager.plugins.values()
+    if text.strip() == "plans":
+        for plugin in plugins:
+            for query in plugin.hot_queries:
+                try:
+                    plan = " / ".join(query.explain(db))
+                except Exception as e:
+                    plan = "error: {}".format(e)
+                notice("{} ({}): {}".format(query.name, plugin.title, plan))
+        return
+
+    tables = set(bot.db_metadata.tables)
+    for plugin in plugins:
+        tables.update(index.table for index in plugin.indexes)
+
+    out = []
+    for table in sorted(tables):
+        if not database.table_exists(db, table):
+            continue
+        rows = db.execute("select count(*) from {}".format(table)).fetchone()[0]
+        out.append("{}: \x02{}\x02".format(table, rows))
+    out = "Rows: " + ", ".join(out)
+    if db.get_bind().dialect.name == "sqlite":
+        pages = db.execute("pragma page_count").fetchone()[0]
+        page_size = db.execute("pragma page_size").fetchone()[0]
+        out = "Database size: \x02{}\x02, ".format(format_bytes(pages * page_size)) + out
+    return out
@@ -1,3 +1,4 @@
+import asyncio
 import re
 from datetime import datetime
 from sqlalchemy import Table, Column, String, Boolean, DateTime
@@ -6,6 +7,8 @@ from sqlalchemy.sql import select
 
 from cloudbot import hook
 from cloudbot.util import timeformat, database
+from cloudbot.util.executors import DB_POOL
+from cloudbot.util.tablecache import TableCache
 from cloudbot.event import EventType
 
 table = Table(
@@ -20,17 +23,32 @@ table = Table(
     Column('time_read', DateTime)
 )
 
-@hook.on_start
+target_index = database.TableIndex("tells_target", "tells", "connection", "target", "is_read")
+unread_query = database.HotQuery(
+    "unread tells", "select sender, message, time_sent from tells where connection = :connection and "
+                    "target = :target and is_read = 0", {'connection': "network", 'target': "nick"})
+
+# tell_cache[connection][target] is the list of unread messages for target, both lowercase like in the table
+tell_cache = TableCache(("connection", "target"), "message", multi=True)
+
+# (connection, target) pairs whose tells are being delivered
+delivering = set()
+
+
+@hook.on_start(preserve_state=["tell_cache"])
 def load_cache(db):
     """
     :type db: sqlalchemy.orm.Session
     """
-    global tell_cache
-    tell_cache = []
-    for row in db.execute(table.select().where(table.c.is_read == 0)):
-        conn = row["connection"]
-        target = row["target"]
-        tell_cache.append((conn, target))
+    tell_cache.load(db.execute(table.select().where(table.c.is_read == 0).order_by(table.c.time_sent)))
+
+
+@hook.periodic(3600, initial_interval=3600)
+def reconcile_cache(db):
+    """
+    :type db: sqlalchemy.orm.Session
+    """
+    tell_cache.reconcile(db.execute(table.select().where(table.c.is_read == 0).order_by(table.c.time_sent)))
 
 
 def get_unread(db, server, target):
@@ -42,16 +60,6 @@ def get_unread(db, server, target):
     return db.execute(query).fetchall()
 
 
-def count_unread(db, server, target):
-    query = select([table]) \
-        .where(table.c.connection == server.lower()) \
-        .where(table.c.target == target.lower()) \
-        .where(table.c.is_read == 0) \
-        .alias("count") \
-        .count()
-    return db.execute(query).fetchone()[0]
-
-
 def read_all_tells(db, server, target):
     query = table.update() \
         .where(table.c.connection == server.lower()) \
@@ -60,7 +68,7 @@ def read_all_tells(db, server, target):
         .values(is_read=1)
     db.execute(query)
     db.commit()
-    load_cache(db)
+    tell_cache.delete({"connection": server.lower(), "target": target.lower()})
 
 def read_tell(db, server, target, message):
     query = table.update() \
@@ -70,7 +78,7 @@ def read_tell(db, server, target, message):
         .values(is_read=1)
     db.execute(query)
     db.commit()
-    load_cache(db)
+    tell_cache.delete({"connection": server.lower(), "target": target.lower(), "message": message})
 
 
 def add_tell(db, server, sender, target, message):
@@ -84,31 +92,28 @@ def add_tell(db, server, sender, target, message):
     )
     db.execute(query)
     db.commit()
-    load_cache(db)
+    tell_cache.insert({"connection": server.lower(), "target": target.lower(), "message": message})
 
-def tell_check(conn, nick):
-    for _conn, _target in tell_cache:
-        if (conn, nick.lower()) == (_conn, _target):
-            return True
-        else:
-            continue
+def count_pending(server, target):
+    return len(tell_cache.get(server.lower(), {}).get(target.lower(), ()))
 
-@hook.event(EventType.message, singlethread=True)
-def tellinput(event, conn, db, nick, notice):
+def tell_check(server, target):
+    return target.lower() in tell_cache.get(server.lower(), {})
+
+def deliver_tell(db_session, conn, nick, notice):
     """
-    :type event: cloudbot.event.Event
+    Runs in the database pool, with a session from it like a threaded hook's
+    :type db_session: sqlalchemy.orm.scoping.scoped_session
     :type conn: cloudbot.client.Client
-    :type db: sqlalchemy.orm.Session
     """
-    if 'showtells' in event.content.lower():
-        return
-
-    if tell_check(conn.name, nick):
+    db = db_session()
+    try:
         tells = get_unread(db, conn.name, nick)
-    else:
-        return
+        if not tells:
+            # read by something other than this plugin
+            tell_cache.delete({"connection": conn.name.lower(), "target": nick.lower()})
+            return
 
-    if tells:
         user_from, message, time_sent = tells[0]
         reltime = timeformat.time_since(time_sent)
 
@@ -123,6 +128,35 @@ def tellinput(event, conn, db, nick, notice):
 
         read_tell(db, conn.name, nick, message)
         notice(reply)
+    finally:
+        db.close()
+
+@asyncio.coroutine
+@hook.event(EventType.message)
+def tellinput(event, conn, nick, notice, bot):
+    """
+    :type event: cloudbot.event.Event
+    :type conn: cloudbot.client.Client
+    :type bot: cloudbot.bot.CloudBot
+    """
+    # this runs for every message, so it only looks at the cache until a tell is due
+    if not tell_check(conn.name, nick):
+        return
+
+    if 'showtells' in event.content.lower():
+        return
+
+    key = (conn.name.lower(), nick.lower())
+    if key in delivering:
+        # a message sent while the last one's tell is being delivered
+        return
+
+    delivering.add(key)
+    try:
+        yield from bot.loop.run_in_executor(bot.executors.get(DB_POOL), deliver_tell, bot.db_session, conn, nick,
+                                            notice)
+    finally:
+        delivering.discard(key)
 
 
 @hook.command(autohelp=False)
@@ -171,7 +205,7 @@ def tell_cmd(text, nick, db, notice, conn):
         notice("Invalid nick '{}'.".format(target))
         return
 
-    if count_unread(db, conn.name, target.lower()) >= 10:
+    if count_pending(conn.name, target) >= 10:
         notice("Sorry, {} has too many messages queued already.".format(target))
         return
 
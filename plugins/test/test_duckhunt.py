@@ -0,0 +1,28 @@
+import sys
+
+import pytest
+
+if sys.version_info >= (3, 7):
+    # the core modules use "async" as a name, which is a keyword from python 3.7
+    pytest.skip("cloudbot.plugin can't be imported on this version of python", allow_module_level=True)
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from cloudbot import plugin
+from cloudbot.util import database
+
+
+@pytest.fixture
+def metadata():
+    old_metadata = database.metadata
+    database.metadata = sqlalchemy.MetaData()
+    yield database.metadata
+    database.metadata = old_metadata
+
+
+def test_import(metadata):
+    duckhunt = plugin.import_plugin("plugins/duckhunt.py", "duckhunt.py", "duckhunt")
+    commands = {alias for hook in duckhunt.commands for alias in hook.aliases}
+    assert {"bang", "befriend", "friends", "killers"} <= commands
+    assert duckhunt.periodic
+    assert "duck_hunt" in metadata.tables
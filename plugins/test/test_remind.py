@@ -0,0 +1,181 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+if sys.version_info >= (3, 7):
+    # the core modules use "async" as a name, which is a keyword from python 3.7
+    pytest.skip("cloudbot.plugin can't be imported on this version of python", allow_module_level=True)
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from cloudbot import plugin
+from cloudbot.util import database
+from cloudbot.util.executors import DB_POOL
+from cloudbot.util.scheduler import Scheduler
+
+
+class FakeTimer:
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    """
+    Just enough of an event loop for the scheduler, with a clock which only moves when advance() is called. Tasks are
+    handed to a real event loop, to be run with run_tasks().
+    """
+
+    def __init__(self, real_loop):
+        self.real_loop = real_loop
+        self.now = 0.0
+        self.timers = []
+        self.tasks = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        timer = FakeTimer(when, callback)
+        self.timers.append(timer)
+        return timer
+
+    def create_task(self, coro):
+        task = self.real_loop.create_task(coro)
+        self.tasks.append(task)
+        return task
+
+    def advance(self, seconds):
+        target = self.now + seconds
+        while True:
+            timers = [timer for timer in self.timers if not timer.cancelled and timer.when <= target]
+            if not timers:
+                break
+            timer = min(timers, key=lambda t: t.when)
+            self.timers.remove(timer)
+            self.now = max(self.now, timer.when)
+            timer.callback()
+        self.now = target
+
+    def run_tasks(self):
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            self.real_loop.run_until_complete(task)
+
+    @property
+    def armed(self):
+        return [timer for timer in self.timers if not timer.cancelled]
+
+
+class FakeConn:
+    name = "test"
+    ready = True
+
+    def __init__(self):
+        self.messages = []
+
+    def message(self, target, text):
+        self.messages.append((target, text))
+
+
+class FakeExecutors:
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(1)
+        self.requested = []
+
+    def get(self, name):
+        self.requested.append(name)
+        return self.pool
+
+
+class FakePluginManager:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+
+class FakeBot:
+    def __init__(self, loop, scheduler, db_session):
+        self.loop = loop
+        self.plugin_manager = FakePluginManager(scheduler)
+        self.db_session = db_session
+        self.executors = FakeExecutors()
+        self.connections = {"test": FakeConn()}
+
+
+@pytest.fixture
+def metadata():
+    old_metadata = database.metadata
+    database.metadata = sqlalchemy.MetaData()
+    yield database.metadata
+    database.metadata = old_metadata
+
+
+@pytest.fixture
+def remind(metadata):
+    plugin.import_plugin("plugins/remind.py", "remind.py", "remind")
+    module = sys.modules["plugins.remind"]
+    yield module
+    module.reminders.clear()
+
+
+@pytest.fixture
+def bot(metadata, tmpdir):
+    engine = sqlalchemy.create_engine("sqlite:///{}".format(tmpdir.join("remind.db")))
+    metadata.create_all(engine)
+    loop = asyncio.new_event_loop()
+    fake_loop = FakeLoop(loop)
+    bot = FakeBot(loop, Scheduler(fake_loop), scoped_session(sessionmaker(bind=engine)))
+    yield bot
+    bot.executors.pool.shutdown()
+    loop.close()
+    engine.dispose()
+
+
+def test_many_reminders(remind, bot):
+    fake_loop = bot.plugin_manager.scheduler.loop
+    conn = bot.connections["test"]
+    added_time = datetime.now() - timedelta(minutes=1)
+
+    db = bot.db_session()
+    for i in range(200):
+        user = "user{}".format(i)
+        db.execute(remind.table.insert().values(network="test", added_user=user, added_time=added_time,
+                                                added_chan="#chan", message="message {}".format(i),
+                                                remind_time=added_time))
+        # the earliest is due in 100 seconds, and the rest after it
+        remind._schedule(bot, "test", added_time, added_time, user, "message {}".format(i), delay=100 + i)
+    db.commit()
+    db.close()
+
+    # one loop timer for all of them, rather than a task each
+    assert len(fake_loop.armed) == 1
+    assert len(bot.plugin_manager.scheduler) == 200
+
+    fake_loop.advance(99)
+    fake_loop.run_tasks()
+    assert conn.messages == []
+
+    fake_loop.advance(1)
+    fake_loop.run_tasks()
+    assert [target for target, text in conn.messages] == ["user0", "user0"]
+    assert conn.messages[1][1] == '"message 0"'
+    assert bot.executors.requested == [DB_POOL]
+    assert ("test", "user0") not in remind.reminders
+    assert len(bot.plugin_manager.scheduler) == 199
+    assert len(fake_loop.armed) == 1
+
+    # the delivered reminder is gone from the database, and the rest are left
+    db = bot.db_session()
+    users = {row["added_user"] for row in db.execute(remind.table.select())}
+    db.close()
+    assert len(users) == 199
+    assert "user0" not in users